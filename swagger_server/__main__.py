@@ -1,14 +1,39 @@
 #!/usr/bin/env python3
 
+import argparse
+
 import connexion
 
 from swagger_server import encoder
+from swagger_server.controllers.cdr_controller import db_handle_init, \
+    replica_init
+from swagger_server.controllers.stats_controller import rollup_init
+from swagger_server.controllers.common.config_handler import ConfigHandler
+from swagger_server.controllers.common.log_handler import logging_init
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Data Analytics API server')
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+        help='serve the API with asyncio on aiohttp, with non-blocking '
+        'database and SSH clients')
+    args = parser.parse_args()
+    # set the log levels of the subsystems before serving
+    logging_init(ConfigHandler().get_params("logging", {}))
+    if args.async_mode:
+        from swagger_server import aio_app
+        aio_app.main()
+        return
+
     app = connexion.App(__name__, specification_dir='./swagger/')
     app.app.json_encoder = encoder.JSONEncoder
     app.add_api('swagger.yaml', arguments={'title': 'Data Analytics API'}, pythonic_params=True)
+    # open the database connections before serving the first request
+    db_handle_init()
+    # copy the CDR tables to the local replica in the background
+    replica_init()
+    # keep the call statistics up to date in the background
+    rollup_init()
     app.run(port=8080)
 
 
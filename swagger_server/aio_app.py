@@ -0,0 +1,108 @@
+"""Asynchronous serving mode of the API server.
+
+The API is served by connexion on aiohttp instead of Flask. Operations that
+have an asynchronous variant in 'swagger_server.controllers.aio' are routed
+to it, the other operations run their synchronous controller on the default
+executor of the event loop so that they never block it.
+"""
+import asyncio
+import functools
+import importlib
+
+import connexion
+from connexion.apis.aiohttp_api import AioHttpApi
+from connexion.jsonifier import Jsonifier
+from connexion.resolver import Resolver
+from connexion.utils import get_function_from_name
+
+from swagger_server import encoder
+from swagger_server.controllers.common.aio_db_handler import \
+    get_aio_read_router
+from swagger_server.controllers.common.aio_ssh_pool import \
+    close_aio_ssh_pools
+from swagger_server.controllers.cdr_controller import replica_init
+from swagger_server.controllers.stats_controller import rollup_init
+
+# Package of the synchronous controllers and of their asynchronous variants
+controllers_package = "swagger_server.controllers."
+aio_controllers_package = "swagger_server.controllers.aio."
+
+
+def run_in_executor(function):
+    """Wrap a synchronous controller into a coroutine that runs it on the
+    default executor of the event loop."""
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None,
+            functools.partial(function, *args, **kwargs))
+    return wrapper
+
+
+def resolve_aio_function(operation_id):
+    """Resolve an operationId to its asynchronous controller if there is
+    one, or to its synchronous controller run on the executor otherwise."""
+    module_name, function_name = operation_id.rsplit(".", 1)
+    if module_name.startswith(controllers_package):
+        aio_module_name = module_name.replace(controllers_package,
+            aio_controllers_package, 1)
+        try:
+            aio_module = importlib.import_module(aio_module_name)
+        except ModuleNotFoundError as e:
+            # a missing variant falls back, a missing dependency doesn't
+            if e.name != aio_module_name:
+                raise
+            aio_module = None
+        if aio_module is not None and hasattr(aio_module, function_name):
+            return getattr(aio_module, function_name)
+    return run_in_executor(get_function_from_name(operation_id))
+
+
+async def db_handle_init(app):
+    """Open the non-blocking database connections of all the hosts on
+    startup."""
+    await get_aio_read_router().warm_up()
+
+
+async def cdr_replica_init(app):
+    """Start the replication job of the CDR tables on startup. It runs on
+    its own thread with the blocking connection pool."""
+    replica_init()
+
+
+async def stats_rollup_init(app):
+    """Start the rollup job of the call statistics on startup. It runs on
+    its own thread with the blocking connection pool."""
+    rollup_init()
+
+
+async def db_handle_close(app):
+    """Close the non-blocking database connections of all the hosts on
+    shutdown."""
+    await get_aio_read_router().close()
+
+
+async def ssh_pools_close(app):
+    """Close the pooled SSH connections to the sniffers on shutdown."""
+    await close_aio_ssh_pools()
+
+
+def create_app():
+    """Create the connexion application of the asynchronous serving mode."""
+    # serialize the swagger models like the Flask application does
+    AioHttpApi.jsonifier = Jsonifier(cls=encoder.JSONEncoder)
+
+    app = connexion.AioHttpApp(__name__, specification_dir='./swagger/')
+    app.add_api('swagger.yaml', arguments={'title': 'Data Analytics API'},
+        pythonic_params=True, pass_context_arg_name='request',
+        resolver=Resolver(function_resolver=resolve_aio_function))
+    app.app.on_startup.append(db_handle_init)
+    app.app.on_startup.append(cdr_replica_init)
+    app.app.on_startup.append(stats_rollup_init)
+    app.app.on_cleanup.append(db_handle_close)
+    app.app.on_cleanup.append(ssh_pools_close)
+    return app
+
+
+def main():
+    create_app().run(port=8080)
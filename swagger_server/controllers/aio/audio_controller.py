@@ -0,0 +1,63 @@
+"""Asynchronous variant of the audio controller for the asynchronous serving
+mode. PCAP parsing and decoding are CPU bound, so they run on the default
+executor of the event loop instead of on the loop itself.
+"""
+import asyncio
+
+import connexion
+from aiohttp import web
+
+from swagger_server.controllers.audio_controller import decode_call_audio, \
+    get_audio_cache_headers, timeout_params
+from swagger_server.controllers.common.deadline import Deadline
+from swagger_server.controllers.common.errors import DeadlineExceeded
+from swagger_server.controllers.common.http_cache import etag_matches
+
+from swagger_server.controllers.common.log_handler import get_logger
+
+# Logger setup for this module
+logger = get_logger(__name__)
+
+
+async def audio_cdr_id_get(cdr_id, request=None):  # noqa: E501
+    """Return the Audio file of a call identified with cdrId
+
+    This API endpoint identifies a call with the given cdrId and then provides the audio file of the decoded audio of the VoIP call in WAV format. # noqa: E501
+
+    :param cdr_id: CDR-ID of the call to identify it.
+    :type cdr_id: int
+    :param request: The aiohttp request, passed in by connexion.
+    :type request: aiohttp.web.Request
+
+    :rtype: object
+    """
+    pcap_filename = 'g722-only.pcap'
+    audio_filename = 'g722-only.wav'
+
+    # TODO: Add PCAP fetching logic here for the module
+
+    # the client already has this audio, don't decode it again
+    audio_headers = get_audio_cache_headers(cdr_id, pcap_filename)
+    if etag_matches(audio_headers["ETag"],
+            request.headers.get("If-None-Match")):
+        logger.info(f"Audio of CDR-ID {cdr_id} not modified.")
+        return web.Response(status=304, headers=audio_headers)
+
+    # the decoding checks the deadline as it goes, so it stops on its own
+    # once the request has timed out
+    deadline = Deadline(timeout_params)
+    loop = asyncio.get_event_loop()
+    try:
+        audio_data = await asyncio.wait_for(loop.run_in_executor(None,
+            decode_call_audio, pcap_filename, audio_filename, deadline),
+            deadline.remaining())
+    except (DeadlineExceeded, asyncio.TimeoutError) as e:
+        logger.error(f"Audio of CDR-ID {cdr_id}: {e or 'request timed out'}")
+        return connexion.problem(504, "Gateway Timeout",
+            str(e) or "The request deadline expired while decoding.")
+
+    logger.info("Returning response.")
+    return web.Response(body=audio_data, status=200, headers={
+        'Content-Disposition': 'attachment;filename=test.wav;',
+        **audio_headers
+    })
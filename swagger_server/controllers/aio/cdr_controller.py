@@ -0,0 +1,361 @@
+"""Asynchronous variants of the CDR controllers for the asynchronous serving
+mode. They share the queries, the cache and the row mapping of
+'swagger_server.controllers.cdr_controller' and only swap the blocking
+database calls for awaitable ones. Once the local replica of the CDR tables
+has caught up, the CDRs are read from it on the default executor of the event
+loop instead.
+"""
+import asyncio
+import functools
+import json
+
+import connexion
+from aiohttp import web
+
+from swagger_server.encoder import JSONEncoder
+from swagger_server.controllers import cdr_controller
+from swagger_server.controllers.cdr_controller import cdr_cache, \
+    cdr_callend_index, cdr_feed, cdr_full_projection, cdr_joined_query, \
+    cdr_page_ids_query, cdr_replica, cdr_response, create_cdr_object, \
+    create_cdr_list, create_feed_list, decode_cursor, decode_feed_cursor, \
+    format_feed_events, get_stream_query, parse_fields, serialize_cdr_row, max_page_size, \
+    max_stream_size, stream_chunk_size, ndjson_mimetype, \
+    event_stream_mimetype, max_feed_timeout, feed_heartbeat, \
+    cdr_export_columns, cdr_export_query, export_cdr_row, \
+    get_export_attachment, parse_export_range, binary_response, \
+    create_native_cdr_list
+from swagger_server.controllers.common.aio_db_handler import \
+    get_aio_read_router
+from swagger_server.controllers.common.db_handler import in_clause
+from swagger_server.controllers.common.export_writer import \
+    get_export_writer
+from swagger_server.controllers.common.binary_encoder import \
+    negotiate_encoding
+
+from swagger_server.controllers.common.log_handler import get_logger
+
+# Logger setup for this module
+logger = get_logger(__name__)
+
+# Router of the CDR reads to the replica hosts of the database, on top of
+# the shared non-blocking connection pools
+aio_read_router = get_aio_read_router()
+
+
+async def run_in_executor(function, *args):
+    """Run a blocking function on the default executor of the event loop,
+    this is how the replica is read."""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args))
+
+
+async def fetch_cdrs(db_cur, cdr_ids, projection=None):
+    """Fetch the joined rows of the given CDR-IDs with a single query and
+    add them to the cache. Returns a dict() of CDR-ID => row. With a
+    CDRProjection, only its columns are fetched and the rows aren't cached."""
+    if len(cdr_ids) == 0:
+        return dict()
+    placeholders, params = in_clause(cdr_ids)
+    select_query = cdr_joined_query if projection is None else projection.query
+    db_query_cdr = f"{select_query} WHERE cdr.ID IN ({placeholders})"
+
+    await db_cur.execute(db_query_cdr, params)
+    resp_cdr = await db_cur.fetchall()
+    logger.info(f"Fetched {len(resp_cdr)} of {len(cdr_ids)} CDRs.")
+
+    rows = dict()
+    for each_row in resp_cdr:
+        rows[each_row[0]] = each_row
+        if projection is None:
+            cdr_cache.put(each_row[0], each_row,
+                finished=each_row[cdr_callend_index] is not None)
+    return rows
+
+async def fetch_cdr_page(db_cur, last_id, size, projection=None):
+    """Fetch at most 'size' complete CDRs following the CDR-ID 'last_id',
+    reading the CDRs of the page through the cache. With a CDRProjection,
+    only its columns are fetched."""
+    await db_cur.execute(cdr_page_ids_query, (last_id, size))
+    page_ids = [each_row[0] for each_row in await db_cur.fetchall()]
+    logger.info(f"Fetched {len(page_ids)} CDR-IDs after CDR-ID {last_id}.")
+
+    rows = cdr_cache.get_many(page_ids)
+    if projection is not None:
+        rows = {cdr_id: projection.project_row(row)
+            for cdr_id, row in rows.items()}
+    missing_ids = [cdr_id for cdr_id in page_ids if cdr_id not in rows]
+    if len(missing_ids) != 0:
+        rows.update(await fetch_cdrs(db_cur, missing_ids, projection))
+    return [rows[cdr_id] for cdr_id in page_ids if cdr_id in rows]
+
+
+async def calls_cdr_id_get(cdr_id, fields=None, request=None):  # noqa: E501
+    """Return a list of Call Data Records (CDRs).
+
+    This endpoint is currently being used for getting the CDR for a specific call, by providing the CDR-ID as &#x27;/calls/{cdr-id}&#x27;. # noqa: E501
+
+    :param cdr_id: The CDR-ID of the call for which to retrieve the CDR.
+    :type cdr_id: int
+    :param fields: The CDR fields to return, &#x27;cdrId&#x27; is always returned.
+    :type fields: List[str]
+    :param request: The aiohttp request, passed in by connexion.
+    :type request: aiohttp.web.Request
+
+    :rtype: CDR
+    """
+    try:
+        projection = parse_fields(fields)
+    except ValueError as e:
+        return connexion.problem(400, "Bad Request", str(e))
+
+    row = cdr_cache.get(cdr_id)
+    if row is not None and projection is not None:
+        row = projection.project_row(row)
+    if row is None and cdr_replica.is_ready():
+        rows = await run_in_executor(cdr_controller.fetch_cdr_rows, [cdr_id],
+            projection)
+        row = rows.get(cdr_id)
+    elif row is None:
+        rows = await aio_read_router.process_query(fetch_cdrs, [cdr_id],
+            projection)
+        row = rows.get(cdr_id)
+
+    # handle the case of missing CDR
+    if row is None:
+        return create_cdr_object(cdr_id, None, None, None)
+    return cdr_response(row, projection or cdr_full_projection,
+        request.headers.get("If-None-Match"),
+        negotiate_encoding(request.headers.get("Accept")))
+
+async def stream_replica_page(resp, last_id, size, projection):
+    """Write the NDJSON chunks of the CDRs following the CDR-ID 'last_id'
+    from the replica, reading each chunk on the executor."""
+    chunks = cdr_controller.stream_cdr_page(last_id, size, projection)
+    try:
+        while True:
+            chunk = await run_in_executor(next, chunks, None)
+            if chunk is None:
+                break
+            await resp.write(chunk.encode())
+    finally:
+        chunks.close()
+
+async def stream_cdr_page(request, last_id, size, projection):
+    """Stream the CDRs following the CDR-ID 'last_id' as NDJSON, reading the
+    rows through a server-side cursor."""
+    resp = web.StreamResponse(status=200)
+    resp.content_type = ndjson_mimetype
+    resp.enable_chunked_encoding()
+    await resp.prepare(request)
+
+    if cdr_replica.is_ready():
+        await stream_replica_page(resp, last_id, size, projection)
+        await resp.write_eof()
+        return resp
+
+    streamed = 0
+    async for resp_cdr in aio_read_router.stream_query(
+            get_stream_query(projection), (last_id, size), stream_chunk_size):
+        streamed += len(resp_cdr)
+        await resp.write("".join(
+            json.dumps(serialize_cdr_row(each_row, projection),
+                cls=JSONEncoder) + "\n" for each_row in resp_cdr).encode())
+    await resp.write_eof()
+    logger.info(f"Streamed {streamed} CDRs after CDR-ID {last_id}.")
+    return resp
+
+async def calls_get(size, offset=None, cursor=None, stream=None, fields=None,
+        request=None):
+    """Return a list of Call Data Records (CDRs).
+
+    This endpoint will be used to retrieve CDR list using &#x27;offset&#x27; or &#x27;cursor&#x27; and &#x27;size&#x27; parameters. The CDRs are ordered by CDR-ID. The CDR list will always have less than or equal to &#x27;size&#x27; number of entries, and &#x27;size&#x27; is capped by the server. The &#x27;next_cursor&#x27; of the response retrieves the following page. # noqa: E501
+
+    :param size: The maximum number of CDRs to retrieve.
+    :type size: int
+    :param offset: The CDR-ID offset to use for retrieving CDRs.
+    :type offset: int
+    :param cursor: The &#x27;next_cursor&#x27; of a previous page to retrieve the CDRs following it.
+    :type cursor: str
+    :param stream: The flag to stream the CDRs as newline delimited JSON.
+    :type stream: int
+    :param fields: The CDR fields to return, &#x27;cdrId&#x27; is always returned.
+    :type fields: List[str]
+    :param request: The aiohttp request, passed in by connexion.
+    :type request: aiohttp.web.Request
+
+    :rtype: CDRList
+    """
+    try:
+        projection = parse_fields(fields)
+    except ValueError as e:
+        return connexion.problem(400, "Bad Request", str(e))
+
+    if cursor is not None:
+        last_id = decode_cursor(cursor)
+        if last_id is None:
+            return connexion.problem(400, "Bad Request",
+                f"Invalid cursor '{cursor}'.")
+    elif offset is not None:
+        last_id = offset - 1
+    else:
+        last_id = 0
+
+    accept = request.headers.get("Accept", "") if request is not None else ""
+    if stream == 1 or ndjson_mimetype in accept:
+        return await stream_cdr_page(request, last_id,
+            min(size, max_stream_size), projection or cdr_full_projection)
+
+    size = min(size, max_page_size)
+    if cdr_replica.is_ready():
+        resp_cdr = await run_in_executor(
+            cdr_controller.db_handle_process_read,
+            cdr_controller.fetch_cdr_page, last_id, size, projection)
+    else:
+        resp_cdr = await aio_read_router.process_query(fetch_cdr_page,
+            last_id, size, projection)
+
+    media_type = negotiate_encoding(accept)
+    if media_type is not None:
+        return binary_response(media_type, create_native_cdr_list(resp_cdr,
+            size, projection or cdr_full_projection), {"Vary": "Accept"})
+    return create_cdr_list(resp_cdr, size, projection or cdr_full_projection)
+
+async def wait_feed(position, timeout):
+    """Return at most 'max_page_size' CDRs of the feed following 'position'
+    as (position, CDR) tuples, waiting up to 'timeout' seconds for
+    new CDRs. The tail job wakes the request up through the event loop."""
+    loop = asyncio.get_event_loop()
+    new_cdrs = asyncio.Event()
+    listener = functools.partial(loop.call_soon_threadsafe, new_cdrs.set)
+    cdr_feed.add_listener(listener)
+    try:
+        deadline = loop.time() + timeout
+        while True:
+            new_cdrs.clear()
+            entries = cdr_feed.read(position, max_page_size)
+            if entries is None:
+                # behind the buffer, catch up from the database
+                return await run_in_executor(cdr_feed.fetch, position,
+                    max_page_size)
+            remaining = deadline - loop.time()
+            if len(entries) != 0 or remaining <= 0:
+                return entries
+            try:
+                await asyncio.wait_for(new_cdrs.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        cdr_feed.remove_listener(listener)
+
+async def stream_feed_events(request, position):
+    """Push the CDRs of the feed following 'position' as Server-Sent Events
+    until the client disconnects."""
+    resp = web.StreamResponse(status=200,
+        headers={"Cache-Control": "no-cache"})
+    resp.content_type = event_stream_mimetype
+    await resp.prepare(request)
+    await resp.write(b": connected\n\n")
+    while True:
+        entries = await wait_feed(position, feed_heartbeat)
+        if len(entries) == 0:
+            await resp.write(b": keep-alive\n\n")
+            continue
+        position = entries[-1][0]
+        await resp.write(format_feed_events(entries).encode())
+
+async def calls_feed_get(cursor=None, timeout=None, request=None):  # noqa: E501
+    """Follow the new Call Data Records (CDRs) as they are added.
+
+    This endpoint returns the CDRs added after the given &#x27;cursor&#x27;, or from now on without one. A long-poll waits up to &#x27;timeout&#x27; seconds for new CDRs and its &#x27;next_cursor&#x27; continues the feed. With an &#x27;Accept: text/event-stream&#x27; header, the CDRs are pushed as Server-Sent Events instead. # noqa: E501
+
+    :param cursor: The &#x27;next_cursor&#x27; of a previous response to retrieve the CDRs following it.
+    :type cursor: str
+    :param timeout: The maximum number of seconds to wait for new CDRs.
+    :type timeout: int
+    :param request: The aiohttp request, passed in by connexion.
+    :type request: aiohttp.web.Request
+
+    :rtype: CDRList
+    """
+    cursor = cursor or request.headers.get("Last-Event-ID")
+    position = None
+    if cursor is not None:
+        position = decode_feed_cursor(cursor)
+        if position is None:
+            return connexion.problem(400, "Bad Request",
+                f"Invalid cursor '{cursor}'.")
+
+    # starting the tail job queries the database
+    await run_in_executor(cdr_feed.subscribe)
+    try:
+        if position is None:
+            position = cdr_feed.position()
+        if event_stream_mimetype in request.headers.get("Accept", ""):
+            return await stream_feed_events(request, position)
+
+        if timeout is None or timeout > max_feed_timeout:
+            timeout = max_feed_timeout
+        entries = await wait_feed(position, timeout)
+    finally:
+        cdr_feed.unsubscribe()
+
+    return create_feed_list(entries, position)
+
+async def stream_cdr_export(request, writer, date_from, date_to):
+    """Stream the file of the CDRs of a calldate range, reading the rows
+    through a server-side cursor, or from the replica on the executor."""
+    resp = web.StreamResponse(status=200,
+        headers=get_export_attachment(writer, date_from, date_to))
+    resp.content_type = writer.mimetype
+    resp.enable_chunked_encoding()
+    await resp.prepare(request)
+
+    if cdr_replica.is_ready():
+        chunks = cdr_controller.stream_cdr_export(writer, date_from, date_to)
+        try:
+            while True:
+                chunk = await run_in_executor(next, chunks, None)
+                if chunk is None:
+                    break
+                await resp.write(chunk)
+        finally:
+            chunks.close()
+        await resp.write_eof()
+        return resp
+
+    exported = 0
+    await resp.write(writer.header())
+    async for resp_cdr in aio_read_router.stream_query(cdr_export_query,
+            (date_from, date_to), stream_chunk_size):
+        exported += len(resp_cdr)
+        await resp.write(writer.write([export_cdr_row(each_row)
+            for each_row in resp_cdr]))
+    await resp.write(writer.footer())
+    await resp.write_eof()
+    logger.info(f"Exported {exported} CDRs from {date_from} to {date_to}.")
+    return resp
+
+async def calls_export_get(calldate_from, calldate_to, format_=None,
+        request=None):  # noqa: E501
+    """Export the Call Data Records (CDRs) of a calldate range.
+
+    This endpoint streams all the CDRs of a calldate range as a file, ordered by calldate, for bulk analytics. The values keep their types, date and times are exported as timestamps. The &#x27;csv&#x27; format has a header row, the &#x27;arrow&#x27; format is the Apache Arrow IPC stream format. The span of the range is capped by the server. # noqa: E501
+
+    :param calldate_from: Start of the calldate range (inclusive) in ISO 8601 format.
+    :type calldate_from: str
+    :param calldate_to: End of the calldate range (exclusive) in ISO 8601 format.
+    :type calldate_to: str
+    :param format_: The file format of the export.
+    :type format_: str
+    :param request: The aiohttp request, passed in by connexion.
+    :type request: aiohttp.web.Request
+
+    :rtype: str
+    """
+    try:
+        date_from, date_to = parse_export_range(calldate_from, calldate_to)
+        writer = get_export_writer(format_ or "csv", cdr_export_columns)
+    except ValueError as e:
+        return connexion.problem(400, "Bad Request", str(e))
+
+    return await stream_cdr_export(request, writer, date_from, date_to)
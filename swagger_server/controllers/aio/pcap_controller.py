@@ -0,0 +1,360 @@
+"""Asynchronous variant of the PCAP controller for the asynchronous serving
+mode. The SSH session and SFTP transfer run on 'asyncssh', over the pooled
+connections of the sniffers, so a slow sniffer only suspends the request that
+is waiting on it.
+"""
+import asyncio
+from shlex import quote
+
+import asyncssh
+import connexion
+from aiohttp import web
+
+from swagger_server.controllers.common.config_handler import ConfigHandler
+from swagger_server.controllers.common.aio_db_handler import \
+    get_aio_db_handler
+from swagger_server.controllers.common.aio_ssh_pool import get_aio_ssh_pool
+from swagger_server.controllers.common.ssh_pool import sftp_chunk_size, \
+    sftp_read_ahead
+from swagger_server.controllers.common.deadline import Deadline
+from swagger_server.controllers.common.errors import DeadlineExceeded, \
+    SSHPoolExhausted, SnifferLookupError
+from swagger_server.controllers.common.http_cache import etag_matches
+from swagger_server.controllers.common.pcap_merge import merge_pcaps, \
+    ChunkReader
+from swagger_server.controllers.common.pcap_cache import get_pcap_cache
+from swagger_server.controllers.pcap_controller import get_call_info_query, \
+    get_pcap_paths, get_pcap_cache_headers, timeout_params, probe_format, \
+    parse_probe_output, get_remote_pcaps, get_pcap_signature, \
+    get_sniffer_hosts, merge_window
+
+from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup logger for this module
+logger = get_logger(__name__)
+
+# Setup the config handler for this module
+config_handler = ConfigHandler()
+
+# Shared non-blocking connection pool of the asynchronous controllers
+aio_db_handler = get_aio_db_handler()
+
+# Errors of a sniffer that fail its PCAP lookup
+probe_errors = (asyncssh.Error, OSError, asyncio.TimeoutError,
+    SSHPoolExhausted)
+# Errors of a sniffer that fail the transfer of a PCAP, SFTP errors such as
+# the one of a PCAP rotated away in the meantime are asyncssh errors
+transfer_errors = (asyncssh.Error, OSError)
+
+# The running transfers of the PCAPs into the PCAP cache
+fill_tasks = set()
+
+
+async def fetch_call_info(db_cur, cdr_id, timeout):
+    """Fetch the calldate and Call-ID of a call from the 'cdr_next' table."""
+    await db_cur.execute(get_call_info_query(timeout), (cdr_id,))
+    return await db_cur.fetchall()
+
+async def probe_sniffer_pcap(sniffer_params, pcap_filename, sip_dir, rtp_dir,
+        connect_timeout, deadline):
+    """Look for the PCAPs of a call on a sniffer over a pooled connection,
+    and return them as 'parse_probe_output()' does. The probe ends with the
+    listing stage of 'deadline', and its channel is closed when it is
+    cancelled."""
+    ssh_session = await get_aio_ssh_pool(sniffer_params).session(
+        connect_timeout)
+    async with ssh_session:
+        process = await ssh_session.ssh_conn.create_process(
+            f"find {quote(sip_dir)} {quote(rtp_dir)} -maxdepth 1 "
+            f"-name {quote(pcap_filename)} -printf {quote(probe_format)}")
+        try:
+            result = await process.wait(
+                timeout=max(0, deadline.stage_remaining()))
+        finally:
+            process.close()
+    return parse_probe_output((result.stdout or "").splitlines(),
+        sniffer_params, pcap_filename, sip_dir, rtp_dir)
+
+async def find_sniffer_pcaps(sniffers, call_id, call_date, deadline):
+    """Probe all the sniffers concurrently for the PCAPs of a call, and return
+    the (sniffer params, PCAPs found) of the sniffers that have it, like the
+    blocking controller does. The probes still running at the end of the
+    lookup are cancelled, which closes their channels."""
+    with deadline.stage("listing") as timeout:
+        connect_timeout = min(timeout, deadline.timeouts["ssh_connect"])
+        probes = dict()
+        for each_sniffer in sniffers:
+            pcap_filename, sip_dir, rtp_dir = get_pcap_paths(call_id,
+                call_date, each_sniffer["spool_dir"])
+            probes[asyncio.ensure_future(probe_sniffer_pcap(each_sniffer,
+                pcap_filename, sip_dir, rtp_dir, connect_timeout,
+                deadline))] = each_sniffer
+
+        loop = asyncio.get_event_loop()
+        expires = loop.time() + timeout
+        found = list()
+        failures = 0
+        pending = set(probes)
+        try:
+            while len(pending) != 0:
+                remaining = expires - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                    return_when=asyncio.FIRST_COMPLETED)
+                for each_probe in done:
+                    each_sniffer = probes[each_probe]
+                    try:
+                        pcap_files = each_probe.result()
+                        if pcap_files is not None:
+                            found.append((each_sniffer, pcap_files))
+                    except probe_errors as e:
+                        failures += 1
+                        logger.error(f"PCAP lookup on {each_sniffer['host']} "
+                            f"failed: {e}")
+                # wait a little for the other parts of the call, if any
+                if len(found) != 0:
+                    expires = min(expires, loop.time() + merge_window)
+        finally:
+            for each_probe in pending:
+                each_probe.cancel()
+
+        if len(found) == 0 and len(pending) != 0:
+            raise asyncio.TimeoutError()
+    if len(found) == 0 and failures != 0:
+        raise SnifferLookupError(f"The PCAP lookup failed on {failures} of "
+            f"{len(sniffers)} sniffers.")
+    return found
+
+async def open_sniffer_pcap(sniffer_params, remote_path, timeout):
+    """Open a PCAP on a sniffer over a pooled connection. Return the
+    AioSSHSession, the SFTP client and the remote file, which are closed
+    with 'close_sniffer_pcaps()', and the size of the PCAP."""
+    ssh_session = await get_aio_ssh_pool(sniffer_params).session(timeout)
+    try:
+        sftp_client = await asyncio.wait_for(
+            ssh_session.ssh_conn.start_sftp_client(), timeout)
+        try:
+            remote_file = await asyncio.wait_for(
+                sftp_client.open(remote_path, "rb"), timeout)
+            size = (await asyncio.wait_for(remote_file.stat(), timeout)).size
+        except BaseException:
+            sftp_client.exit()
+            raise
+    except BaseException as e:
+        await ssh_session.release(type(e))
+        raise
+    return ssh_session, sftp_client, remote_file, size
+
+async def close_sniffer_pcaps(opened, exc_type=None):
+    """Close the PCAPs opened with 'open_sniffer_pcap()', after an error of
+    'exc_type' if any."""
+    for ssh_session, sftp_client, remote_file, size in opened:
+        await remote_file.close()
+        sftp_client.exit()
+        await ssh_session.release(exc_type)
+
+async def read_remote_file(remote_file, size, timeout):
+    """Generate the chunks of the first 'size' bytes of an open remote file.
+    Each read of 'sftp_read_ahead' pipelined chunks times out after
+    'timeout' seconds."""
+    remaining = size
+    while remaining > 0:
+        chunk = await asyncio.wait_for(remote_file.read(
+            min(sftp_chunk_size * sftp_read_ahead, remaining)), timeout)
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+def iter_remote_file(loop, remote_file, size, timeout):
+    """Generate the chunks of an open remote file like 'read_remote_file()',
+    from a thread of the executor. The reads run on the event loop."""
+    remaining = size
+    while remaining > 0:
+        chunk = asyncio.run_coroutine_threadsafe(asyncio.wait_for(
+            remote_file.read(min(sftp_chunk_size * sftp_read_ahead,
+            remaining)), timeout), loop).result()
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+async def merge_remote_files(opened, timeout):
+    """Generate the chunks of the merge of several open remote PCAPs by
+    packet timestamp. The merge runs in the executor, off the event loop."""
+    loop = asyncio.get_event_loop()
+    merged = merge_pcaps([ChunkReader(iter_remote_file(loop, remote_file,
+        size, timeout)) for ssh_session, sftp_client, remote_file, size
+        in opened])
+    while True:
+        chunk = await loop.run_in_executor(None, next, merged, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def get_opened_hosts(opened):
+    """Return the hosts of the PCAPs opened with 'open_sniffer_pcap()', for
+    the log messages."""
+    return ", ".join(ssh_session.ssh_pool.host
+        for ssh_session, sftp_client, remote_file, size in opened)
+
+async def fill_sniffer_pcaps(opened, cache_fill, timeout):
+    """Write the PCAP of a call into the PCAP cache as it is read from the
+    sniffers, and commit it once complete, like the blocking controller
+    does. This runs as a task of its own, apart from the requests."""
+    loop = asyncio.get_event_loop()
+    exc_type = None
+    try:
+        if len(opened) == 1:
+            ssh_session, sftp_client, remote_file, size = opened[0]
+            chunks = read_remote_file(remote_file, size, timeout)
+        else:
+            chunks = merge_remote_files(opened, timeout)
+        async for chunk in chunks:
+            await loop.run_in_executor(None, cache_fill.write, chunk)
+        cache_fill.commit()
+    except BaseException as e:
+        exc_type = type(e)
+        cache_fill.abort(e)
+        if isinstance(e, Exception):
+            logger.error(f"Fetching {cache_fill.name} from "
+                f"{get_opened_hosts(opened)} failed: {e}")
+    finally:
+        await close_sniffer_pcaps(opened, exc_type)
+
+async def open_call_pcap(remote_pcaps, cache_name, timeout):
+    """Open the PCAP of a call like the blocking controller does. Return
+    (the open PCAP, None, None) when it is read from the PCAP cache, or
+    (None, its first chunk, the generator of the next chunks) when it is
+    read from its transfer into the cache."""
+    pcap_cache = get_pcap_cache()
+    signature = get_pcap_signature(remote_pcaps)
+    pcap_file, cache_fill, new_fill = pcap_cache.begin(cache_name, signature)
+    if pcap_file is not None:
+        return pcap_file, None, None
+
+    if new_fill is not None:
+        opened = list()
+        try:
+            for sniffer_params, remote_path, pcap_stat in remote_pcaps:
+                opened.append(await open_sniffer_pcap(sniffer_params,
+                    remote_path, timeout))
+        except BaseException as e:
+            await close_sniffer_pcaps(opened, type(e))
+            new_fill.abort(e)
+            raise
+        # the task is kept until it is done, the event loop only holds a
+        # weak reference to it
+        fill_task = asyncio.ensure_future(fill_sniffer_pcaps(opened,
+            new_fill, timeout))
+        fill_tasks.add(fill_task)
+        fill_task.add_done_callback(fill_tasks.discard)
+        cache_fill = new_fill
+    pcap_chunks = cache_fill.aio_stream(timeout)
+    try:
+        first_chunk = await pcap_chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
+    return None, first_chunk, pcap_chunks
+
+async def pcap_get(cdr_id, disable_rtp=None, request=None):  # noqa: E501
+    """Return a PCAP with SIP and RTP of call given CDR ID.
+
+    This endpoint retrieves Packet Capture (PCAP) of the call as identified by a provided CDR-ID. Additionally, only SIP can be retrieved by specifying &#x27;disable_rtp&#x3D;1&#x27;. # noqa: E501
+
+    :param cdr_id: The CDR-ID to identify the call for PCAP.
+    :type cdr_id: int
+    :param disable_rtp: The flag to disable RTP in the PCAP.
+    :type disable_rtp: int
+    :param request: The aiohttp request, passed in by connexion.
+    :type request: aiohttp.web.Request
+
+    :rtype: Object
+    """
+    deadline = Deadline(timeout_params)
+    try:
+        with deadline.stage("database") as timeout:
+            db_query_resp = await asyncio.wait_for(
+                aio_db_handler.process_query(fetch_call_info, cdr_id,
+                    timeout), timeout)
+    except DeadlineExceeded as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id}: {e}")
+        return connexion.problem(504, "Gateway Timeout", str(e))
+    # if there is no CDR entry, return nothing
+    if db_query_resp is None or len(db_query_resp) == 0:
+        return web.Response(body=b'', status=200, headers={
+            'Content-Disposition': 'attachment;filename="";'
+            })
+
+    call_date = db_query_resp[0][0]
+    call_id = db_query_resp[0][1]
+    callend = db_query_resp[0][2]
+    logger.info(f"Calldate: {call_date}, Call-ID: {call_id}")
+
+    # the client already has this PCAP, don't fetch it from the sniffer
+    pcap_headers = get_pcap_cache_headers(cdr_id, call_id, call_date, callend,
+        disable_rtp)
+    if etag_matches(pcap_headers.get("ETag"),
+            request.headers.get("If-None-Match")):
+        logger.info(f"PCAP of CDR-ID {cdr_id} not modified.")
+        return web.Response(status=304, headers=pcap_headers)
+
+    pcap_filename = call_id + ".pcap"
+    # the SIP only PCAP is cached apart from the merged one
+    cache_name = call_id + ".sip.pcap" if disable_rtp else pcap_filename
+    sniffer_hosts = None
+    # the errors of a transfer by another request are raised by the wait for
+    # it as well
+    try:
+        found = await find_sniffer_pcaps(config_handler.get_params("sniffers"),
+            call_id, call_date, deadline)
+        if len(found) == 0:
+            logger.error(f"PCAP of CDR-ID {cdr_id} not found on any sniffer.")
+            return connexion.problem(404, "Not Found",
+                f"The PCAP of CDR-ID {cdr_id} wasn't found on any sniffer.")
+        sniffer_hosts = get_sniffer_hosts(found)
+        # served from the PCAP cache, or streamed from the sniffers into it
+        with deadline.stage("transfer") as timeout:
+            pcap_file, first_chunk, pcap_chunks = await asyncio.wait_for(
+                open_call_pcap(get_remote_pcaps(found, disable_rtp),
+                cache_name, timeout), timeout)
+    except DeadlineExceeded as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id} from {sniffer_hosts}: {e}")
+        return connexion.problem(504, "Gateway Timeout", str(e))
+    except SnifferLookupError as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id}: {e}")
+        return connexion.problem(502, "Bad Gateway", str(e))
+    except SSHPoolExhausted as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id} from {sniffer_hosts}: {e}")
+        return connexion.problem(503, "Service Unavailable", str(e))
+    except ValueError as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id} from {sniffer_hosts} can't "
+            f"be merged: {e}")
+        return connexion.problem(502, "Bad Gateway", str(e))
+    except transfer_errors as e:
+        logger.error(f"Transfer of the PCAP of CDR-ID {cdr_id} from "
+            f"{sniffer_hosts} failed: {e}")
+        return connexion.problem(502, "Bad Gateway",
+            f"The transfer of the PCAP of CDR-ID {cdr_id} from "
+            f"{sniffer_hosts} failed: {e}")
+
+    pcap_headers['Content-Disposition'] = \
+        f'attachment;filename="{pcap_filename}";'
+    if pcap_file is not None:
+        # the open file is sent from disk without blocking the event loop
+        return web.Response(body=pcap_file,
+            content_type="application/octet-stream", headers=pcap_headers)
+
+    resp = web.StreamResponse(status=200, headers=pcap_headers)
+    resp.content_type = "application/octet-stream"
+    resp.enable_chunked_encoding()
+    try:
+        await resp.prepare(request)
+        await resp.write(first_chunk)
+        async for chunk in pcap_chunks:
+            await resp.write(chunk)
+    finally:
+        await pcap_chunks.aclose()
+    await resp.write_eof()
+    return resp
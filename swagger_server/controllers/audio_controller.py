@@ -1,21 +1,70 @@
+import os
+
+import connexion
 from flask import Response
 if __name__ != '__main__':
     from swagger_server.controllers.common.codec_processor import CODECProcessor
     from swagger_server.controllers.common.pcap_processor import PCAPProcessor
+    from swagger_server.controllers.common.http_cache import make_etag, \
+        etag_matches, cache_headers
+    from swagger_server.controllers.common.config_handler import ConfigHandler
+    from swagger_server.controllers.common.deadline import Deadline
+    from swagger_server.controllers.common.errors import DeadlineExceeded
+    from swagger_server.controllers.common.log_handler import get_logger
 else:
     from common.codec_processor import CODECProcessor
     from common.pcap_processor import PCAPProcessor
+    from common.http_cache import make_etag, etag_matches, cache_headers
+    from common.config_handler import ConfigHandler
+    from common.deadline import Deadline
+    from common.errors import DeadlineExceeded
+    from common.log_handler import get_logger
 
-import logging
 # Logger setup for this module
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler('logs/' + __name__ + ".log")
-formatter = logging.Formatter(
-    '%(asctime)s : %(levelname)s : %(name)s : %(message)s'
-)
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+logger = get_logger(__name__)
+
+# Request and per-stage timeouts of the audio pipeline
+timeout_params = ConfigHandler().get_params("timeouts", {})
+
+
+def decode_call_audio(pcap_filename, audio_filename, deadline):
+    """Decode the RTP payload of a PCAP into a WAV file and return the
+    contents of the WAV file. Parsing and decoding run as stages of the
+    deadline of the request."""
+    # 3. Parse the PCAP to extract the RTP payload from it.    
+    with deadline.stage("parse"):
+        pcap_proc = PCAPProcessor(pcap_filename, deadline)
+        rtp_payload = pcap_proc.get_all_payload()
+        logger.info("Got all payload from the PCAP.")
+
+        # 4. Identify the Payload type
+        payload_type = pcap_proc.get_payload_type()
+    if payload_type is not None:
+        logger.info("Got paylaod type!")
+    else:
+        logger.error("Couldn't get payload type!")
+
+    # 5. Decode the encoded audio data and get the WAVeform file
+    with deadline.stage("decode"):
+        CODECProcessor(rtp_payload, payload_type, audio_filename,
+            deadline).decode_payload()
+    logger.info("Finished decoding payload.")
+
+    # 6. Read the audio file into a buffer
+    audio_data = open(audio_filename, 'rb').read()
+    logger.info("Reading audio file to stream...")
+    return audio_data
+
+
+def get_audio_cache_headers(cdr_id, pcap_filename):
+    """Return the caching headers of the audio of a call. The WAV is decoded
+    from the PCAP of the call, so its ETag is derived from the metadata of
+    that file and can be checked without decoding. It is revalidated on
+    every use, as the PCAP may still be replaced."""
+    pcap_stat = os.stat(pcap_filename)
+    etag = make_etag("audio", cdr_id, pcap_stat.st_size,
+        pcap_stat.st_mtime_ns)
+    return cache_headers(etag, False)
 
 
 def audio_call_id_get(call_id):  # noqa: E501
@@ -43,34 +92,28 @@ def audio_cdr_id_get(cdr_id):  # noqa: E501
     """
 
     pcap_filename = 'g722-only.pcap'
+    audio_filename = 'g722-only.wav'
     
     # TODO: Add PCAP fetching logic here for the module
- 
-    # 3. Parse the PCAP to extract the RTP payload from it.    
-    pcap_proc = PCAPProcessor(pcap_filename)
-    rtp_payload = pcap_proc.get_all_payload()
-    logger.info("Got all payload from the PCAP.")
-
-    # 4. Identify the Payload type
-    payload_type = pcap_proc.get_payload_type()
-    if payload_type is not None:
-        logger.info("Got paylaod type!")
-    else:
-        logger.error("Couldn't get payload type!")
 
-    # 5. Decode the encoded audio data and get the WAVeform file
-    audio_filename = 'g722-only.wav'
-    CODECProcessor(rtp_payload, payload_type, audio_filename).decode_payload()
-    logger.info("Finished decoding payload.")
+    # the client already has this audio, don't decode it again
+    audio_headers = get_audio_cache_headers(cdr_id, pcap_filename)
+    if etag_matches(audio_headers["ETag"],
+            connexion.request.headers.get("If-None-Match")):
+        logger.info(f"Audio of CDR-ID {cdr_id} not modified.")
+        return Response(None, 304, audio_headers)
 
-    # 6. Read the audio file into a buffer
-    audio_data = open(audio_filename, 'rb').read()
-    logger.info("Reading audio file to stream...")
+    try:
+        audio_data = decode_call_audio(pcap_filename, audio_filename,
+            Deadline(timeout_params))
+    except DeadlineExceeded as e:
+        logger.error(f"Audio of CDR-ID {cdr_id}: {e}")
+        return connexion.problem(504, "Gateway Timeout", str(e))
 
     # 7. Return the response to the API call
     resp = Response(audio_data, '200', {
-        'Content-Disposition': 'attachment;filename=test.wav;'
+        'Content-Disposition': 'attachment;filename=test.wav;',
+        **audio_headers
     })
     logger.info("Returning response.")
     return resp
-        
\ No newline at end of file
@@ -1,11 +1,33 @@
+import base64
+import binascii
+import datetime
+import functools
+import ipaddress
+import json
+
+import connexion
+from connexion.lifecycle import ConnexionResponse
+from flask import Response, stream_with_context
+
+from swagger_server.encoder import JSONEncoder
 from swagger_server.models.cdr import CDR  # noqa: E501
+from swagger_server.models.cdr_batch_request import CDRBatchRequest  # noqa: E501
 from swagger_server.models.cdr_list import CDRList
+from swagger_server import util
 from swagger_server.controllers.common.config_handler import ConfigHandler
+from swagger_server.controllers.common.db_handler import get_db_handler, in_clause
+from swagger_server.controllers.common.read_router import get_read_router
+from swagger_server.controllers.common.cdr_cache import CDRCache
+from swagger_server.controllers.common.cdr_replica import CDRReplica
+from swagger_server.controllers.common.cdr_feed import CDRFeed
+from swagger_server.controllers.common.export_writer import \
+    get_export_writer
+from swagger_server.controllers.common.binary_encoder import \
+    negotiate_encoding, encode_document
+from swagger_server.controllers.common.http_cache import make_etag, \
+    etag_matches, cache_headers, default_cache_max_age
 
-import logging
-
-#imports for the MySQL connector
-import mysql.connector
+from swagger_server.controllers.common.log_handler import get_logger
 
 # The CODEC lookup dictionary to convert Payload Type (PT) into
 # Payload name string.
@@ -15,14 +37,7 @@ from swagger_server.controllers.common.rtp_parser import codec_lookup
 config_handler = ConfigHandler()
 
 # Logger setup for this module
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler('logs/' + __name__ + ".log")
-formatter = logging.Formatter(
-    '%(asctime)s : %(levelname)s : %(name)s : %(message)s'
-)
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+logger = get_logger(__name__)
 
 
 # 'cdr' table schema to control the output formatting
@@ -45,12 +60,129 @@ cdr_next_table_schema = ("fbasename")
 cdr_next_1_table_schema = ("custom_header_1, custom_header_2, "
     "custom_header_3, custom_header_4, custom_header_5")
 
-# put in the DB connection functionality here for reuse
+def prefix_schema(table, schema):
+    """Qualify each column of a table schema string with the table name, so
+    that it can be used in a query joining several tables."""
+    return ", ".join(
+        f"{table}.{column.strip()}" for column in schema.split(","))
+
+# Number of columns fetched from each table in a joined CDR row
+cdr_table_width = len(cdr_table_schema.split(","))
+cdr_next_table_width = len(cdr_next_table_schema.split(","))
+
+# Positions of the 'cdr_next' and 'cdr_next_1' columns in a joined CDR row
+cdr_next_start = 1 + cdr_table_width
+cdr_next_1_start = cdr_next_start + cdr_next_table_width
+
+# Position of 'callend' in a joined CDR row, it tells finished calls apart
+cdr_callend_index = 1 + [column.strip()
+    for column in cdr_table_schema.split(",")].index("callend")
+
+# Query to fetch complete CDRs with a single statement. Each row holds the
+# ID followed by the columns of 'cdr', 'cdr_next' and 'cdr_next_1' in the
+# order of their schema strings. A WHERE clause is appended to this query.
+cdr_joined_query = (
+    f"SELECT cdr.ID, {prefix_schema('cdr', cdr_table_schema)}, "
+    f"{prefix_schema('cdr_next', cdr_next_table_schema)}, "
+    f"{prefix_schema('cdr_next_1', cdr_next_1_table_schema)} FROM cdr "
+    "LEFT JOIN cdr_next ON cdr_next.cdr_ID = cdr.ID "
+    "LEFT JOIN cdr_next_1 ON cdr_next_1.cdr_ID = cdr.ID"
+)
+
+# Query for the CDR-IDs of a page, with bound (last_id, size) parameters
+cdr_page_ids_query = "SELECT ID FROM cdr WHERE ID>%s ORDER BY ID LIMIT %s"
+
+# Query for the complete CDRs of a streamed listing, with bound
+# (last_id, size) parameters
+cdr_stream_query = (
+    f"{cdr_joined_query} WHERE cdr.ID>%s ORDER BY cdr.ID LIMIT %s"
+)
+
+# Shared connection pool of the controllers for the database
+db_handler = get_db_handler()
+
+# Router of the CDR reads to the replica hosts of the database, it falls
+# back on the shared pool of the primary host
+read_router = get_read_router()
+
+# Read-through cache of the joined CDR rows, keyed by CDR-ID
+cdr_cache = CDRCache(config_handler.get_params("cache", {}))
+
+# API behaviour parameters, the page size requested by clients is capped to
+# 'max_page_size' CDRs.
+api_params = config_handler.get_params("api", {})
+max_page_size = api_params.get("max_page_size", 1000)
+# Streamed responses aren't held in memory, so they allow a much larger size.
+# Rows are read from the database 'stream_chunk_size' at a time.
+max_stream_size = api_params.get("max_stream_size", 1000000)
+stream_chunk_size = api_params.get("stream_chunk_size", 500)
+
+# A search on a calldate range alone may span at most this many days
+max_search_days = api_params.get("max_search_days", 31)
+
+# A bulk export may span at most this many days of calldate
+max_export_days = api_params.get("max_export_days", 31)
+
+# A batch lookup may ask for at most this many CDR-IDs
+max_batch_size = api_params.get("max_batch_size", 1000)
+
+# The resources of finished calls may be cached by clients for this many
+# seconds
+cache_max_age = api_params.get("cache_max_age", default_cache_max_age)
+
+# Media type of the streamed CDR listing, one JSON CDR per line
+ndjson_mimetype = "application/x-ndjson"
+
+# Media type of the live CDR feed as Server-Sent Events
+event_stream_mimetype = "text/event-stream"
+
+# Live feed parameters, a long-poll waits at most 'max_timeout' seconds for
+# new CDRs, and an event stream without new CDRs sends a comment every
+# 'heartbeat' seconds to keep the connection open.
+feed_params = config_handler.get_params("feed", {})
+max_feed_timeout = feed_params.get("max_timeout", 30)
+feed_heartbeat = feed_params.get("heartbeat", 15)
+
 def db_handle_init():
-    pass
+    """Initialize the shared connection pool by opening all of its
+    connections. This is called once at startup, so the first requests
+    don't pay for connection setup."""
+    db_handler.warm_up()
+    read_router.warm_up()
+    logger.info(f"Connection pools ready: {read_router.get_metrics()}")
+
+def replica_init():
+    """Start the replication job of the CDR tables if it is configured.
+    This is called once at startup, the CDRs are read from the database
+    until the replica has caught up."""
+    if replica_params:
+        cdr_replica.start()
+
+def db_handle_process_query(query_fn, *args):
+    """Borrow a connection from the shared pool and run 'query_fn' with a
+    cursor on it, i.e. query_fn(db_cur, *args). The connection is given
+    back to the pool once the function returns, and its result is returned.
+    """
+    with db_handler.cursor() as db_cur:
+        return query_fn(db_cur, *args)
 
-def db_handle_process_query():
-    pass
+def read_cursor():
+    """Return a cursor context manager for the streamed CDR reads, on the
+    local replica while it is caught up and on a database host chosen by
+    the read router otherwise."""
+    if cdr_replica.is_ready():
+        return cdr_replica.cursor()
+    return read_router.cursor(timed=False)
+
+def db_handle_process_read(query_fn, *args):
+    """Run 'query_fn' like 'db_handle_process_query', on the local replica
+    while it is caught up and through the read router otherwise, which may
+    hedge it on two database hosts. The query must only read the
+    replicated tables."""
+    if cdr_replica.is_ready():
+        with cdr_replica.cursor() as db_cur:
+            return query_fn(db_cur, *args)
+    return read_router.process_query(query_fn, *args)
 
 def create_cdr_object(cdr_id, resp_cdr, resp_cdr_next, resp_cdr_next_1):
     return_cdr = CDR()
@@ -99,109 +231,906 @@ def create_cdr_object(cdr_id, resp_cdr, resp_cdr_next, resp_cdr_next_1):
 
     return return_cdr
 
+def split_joined_row(row):
+    """Split a row of 'cdr_joined_query' into the CDR-ID and the per-table
+    rows expected by 'create_cdr_object'. The LEFT JOIN fills the columns of
+    a missing 'cdr_next' or 'cdr_next_1' entry with NULLs, these are turned
+    back into a missing row."""
+    resp_cdr = row[1:cdr_next_start]
+    resp_cdr_next = row[cdr_next_start:cdr_next_1_start]
+    resp_cdr_next_1 = row[cdr_next_1_start:]
+    if all(value is None for value in resp_cdr_next):
+        resp_cdr_next = None
+    if all(value is None for value in resp_cdr_next_1):
+        resp_cdr_next_1 = None
+    return row[0], resp_cdr, resp_cdr_next, resp_cdr_next_1
+
+# Source of each attribute of the CDR model in a joined CDR row, as the
+# table and column it is read from and the conversion 'create_cdr_object'
+# applies to it.
+cdr_attribute_columns = {
+    "cdr_id": ("cdr", "ID", str),
+    "caller": ("cdr", "caller", None),
+    "called": ("cdr", "called", None),
+    "calldate": ("cdr", "calldate", None),
+    "callend": ("cdr", "callend", None),
+    "call_id": ("cdr_next", "fbasename", None),
+    "duration": ("cdr", "duration", str),
+    "connect_duration": ("cdr", "connect_duration", str),
+    "sipcallerip": ("cdr", "sipcallerip", str),
+    "sipcallerport": ("cdr", "sipcallerport", str),
+    "sipcalledip": ("cdr", "sipcalledip", str),
+    "sipcalledport": ("cdr", "sipcalledport", str),
+    "codec_a": ("cdr", "a_payload", codec_lookup.__getitem__),
+    "codec_b": ("cdr", "b_payload", codec_lookup.__getitem__),
+    "a_last_rtp_from_end": ("cdr", "a_last_rtp_from_end", str),
+    "b_last_rtp_from_end": ("cdr", "b_last_rtp_from_end", str),
+    "cell_id_caller": ("cdr_next_1", "custom_header_3", str),
+    "cell_id_called": ("cdr_next_1", "custom_header_4", str),
+    "imsi_contact": ("cdr_next_1", "custom_header_1", str),
+    "imsi_request": ("cdr_next_1", "custom_header_2", str),
+    "session_id": ("cdr_next_1", "custom_header_5", str)
+}
+
+def local_timestamp(value):
+    """Attach the local timezone to a date and time of the database, which
+    the sniffer writes in local time."""
+    return value.astimezone()
+
+# Conversions of the CDR model attributes in the binary encodings, which
+# keep the types of the database otherwise
+cdr_native_conversions = {
+    "calldate": local_timestamp,
+    "callend": local_timestamp,
+    "codec_a": codec_lookup.get,
+    "codec_b": codec_lookup.get
+}
+
+# Tables of a joined CDR row, in the order of their columns in the row
+cdr_joined_tables = [("cdr", cdr_table_schema),
+    ("cdr_next", cdr_next_table_schema),
+    ("cdr_next_1", cdr_next_1_table_schema)]
+
+# The local replica of the CDR tables is only used when the 'replica' section
+# is configured
+replica_params = config_handler.get_params("replica", {})
+
+# Local replica of the tables of the joined CDR rows
+cdr_replica = CDRReplica(replica_params, db_handler, cdr_joined_tables)
+
+# Columns of a row of 'cdr_joined_query' as (table, column) tuples
+cdr_joined_columns = [("cdr", "ID")] + [(table, column.strip())
+    for table, schema in cdr_joined_tables for column in schema.split(",")]
+
+# CDR model attributes by their JSON key, in the order of the attribute_map
+cdr_json_attributes = {json_key: attr
+    for attr, json_key in CDR().attribute_map.items()}
+
+class CDRProjection():
+    """This class describes the rows fetched for a subset of the fields of a
+    CDR, given as the JSON keys of the CDR model. 'cdrId' is always part of
+    it. Only the 'cdr' columns of the requested fields are selected, and
+    'cdr_next' and 'cdr_next_1' are only joined when one of their fields is
+    requested. Without fields, the projection describes the complete rows
+    of 'cdr_joined_query'.
+
+    The fields of the serialized CDR are precomputed, in the order of the
+    attribute_map, as (JSON key, table, position in the row, conversion)
+    tuples, and those of the binary encodings as (JSON key, position in the
+    row, conversion) tuples."""
+    def __init__(self, json_keys=None):
+        """The class constructor. Raises ValueError for an unknown field."""
+        if json_keys is None:
+            json_keys = cdr_json_attributes.keys()
+        for json_key in json_keys:
+            if json_key not in cdr_json_attributes:
+                raise ValueError(f"Unknown CDR field '{json_key}'.")
+        attrs = [(json_key, attr)
+            for json_key, attr in cdr_json_attributes.items()
+            if json_key in json_keys or attr == "cdr_id"]
+        # 'callend' tells finished calls apart, so it is always selected
+        needed_columns = [cdr_attribute_columns[attr][:2]
+            for _, attr in attrs] + [("cdr", "callend")]
+
+        # the columns of the row and the joined tables they come from
+        self.columns = [("cdr", "ID")]
+        self.joined_ranges = dict()
+        for table, schema in cdr_joined_tables:
+            columns = [(table, column.strip())
+                for column in schema.split(",")]
+            if table == "cdr":
+                columns = [column for column in columns
+                    if column in needed_columns]
+            elif not any(column in needed_columns for column in columns):
+                continue
+            else:
+                # an entry is told missing from all of its columns
+                self.joined_ranges[table] = (len(self.columns),
+                    len(self.columns) + len(columns))
+            self.columns.extend(columns)
+
+        select_list = ", ".join(f"{table}.{column}"
+            for table, column in self.columns)
+        self.query = f"SELECT {select_list} FROM cdr"
+        for table in self.joined_ranges:
+            self.query += f" LEFT JOIN {table} ON {table}.cdr_ID = cdr.ID"
+
+        self.row_fields = list()
+        self.native_fields = list()
+        for json_key, attr in attrs:
+            table, column, convert = cdr_attribute_columns[attr]
+            index = self.columns.index((table, column))
+            self.row_fields.append((json_key, table, index, convert))
+            self.native_fields.append((json_key, index,
+                cdr_native_conversions.get(attr)))
+
+        self.callend_index = self.columns.index(("cdr", "callend"))
 
+        # positions of the columns in a complete row, to project cached rows
+        self.joined_indexes = [cdr_joined_columns.index(column)
+            for column in self.columns]
 
-def calls_cdr_id_get(cdr_id):  # noqa: E501
+    def project_row(self, row):
+        """Project a complete row of 'cdr_joined_query' on the columns of
+        this projection."""
+        return tuple(row[index] for index in self.joined_indexes)
+
+# Projection of the complete CDRs
+cdr_full_projection = CDRProjection()
+
+@functools.lru_cache(maxsize=64)
+def get_cdr_projection(json_keys):
+    """Return the CDRProjection of a tuple of JSON keys. Projections are
+    shared between requests asking for the same fields, which also keeps
+    the query strings of the prepared statement cache identical."""
+    return CDRProjection(json_keys)
+
+def parse_fields(fields):
+    """Return the CDRProjection of the 'fields' parameter, or None when all
+    the fields are requested. Raises ValueError for an unknown field."""
+    if fields is None or len(fields) == 0:
+        return None
+    return get_cdr_projection(tuple(sorted(set(fields))))
+
+def serialize_cdr_row(row, projection=cdr_full_projection):
+    """Convert a row of 'cdr_joined_query', or of a projection of it,
+    straight into the dict() that JSONEncoder produces for the CDR model of
+    'create_cdr_object', with the same keys, order and values. This skips
+    the model setters and the reflection of the encoder, which dominate the
+    cost of large pages.
+
+    The columns of a missing 'cdr_next' or 'cdr_next_1' entry come out as
+    empty strings, and the values that would be None are left out."""
+    present_tables = {"cdr": True}
+    for table, (start, end) in projection.joined_ranges.items():
+        present_tables[table] = any(value is not None
+            for value in row[start:end])
+
+    cdr_dict = dict()
+    for json_key, table, index, convert in projection.row_fields:
+        if not present_tables[table]:
+            cdr_dict[json_key] = ""
+            continue
+        value = row[index]
+        if convert is not None:
+            value = convert(value)
+        if value is not None:
+            cdr_dict[json_key] = value
+    return cdr_dict
+
+def native_cdr_row(row, projection=cdr_full_projection):
+    """Convert a row of 'cdr_joined_query', or of a projection of it, into
+    the dict() of a CDR for the binary encodings. It has the keys of the
+    JSON CDR, with the values of the database instead of strings, and the
+    values that are None left out."""
+    cdr_dict = dict()
+    for json_key, index, convert in projection.native_fields:
+        value = row[index]
+        if value is not None and convert is not None:
+            value = convert(value)
+        if value is not None:
+            cdr_dict[json_key] = value
+    return cdr_dict
+
+def binary_response(media_type, document, headers=None):
+    """Return the response of a document of native values in a negotiated
+    binary encoding. It is a ConnexionResponse, so that connexion doesn't
+    serialize it again in either serving mode."""
+    return ConnexionResponse(status_code=200, mimetype=media_type,
+        body=encode_document(media_type, document), headers=headers)
+
+def fetch_cdrs(db_cur, cdr_ids, projection=None):
+    """Fetch the joined rows of the given CDR-IDs with a single query and
+    add them to the cache. Returns a dict() of CDR-ID => row, CDR-IDs that
+    don't exist are left out. With a CDRProjection, only its columns are
+    fetched and the rows aren't cached, as the cache holds complete rows."""
+    if len(cdr_ids) == 0:
+        return dict()
+    placeholders, params = in_clause(cdr_ids)
+    select_query = cdr_joined_query if projection is None else projection.query
+    db_query_cdr = f"{select_query} WHERE cdr.ID IN ({placeholders})"
+
+    db_cur.execute(db_query_cdr, params)
+    resp_cdr = db_cur.fetchall()
+    logger.info(f"Fetched {len(resp_cdr)} of {len(cdr_ids)} CDRs.")
+
+    rows = dict()
+    for each_row in resp_cdr:
+        rows[each_row[0]] = each_row
+        if projection is None:
+            cdr_cache.put(each_row[0], each_row,
+                finished=each_row[cdr_callend_index] is not None)
+    return rows
+
+def get_cdr_rows(db_cur, cdr_ids, projection=None):
+    """Return a dict() of CDR-ID => joined row for the given CDR-IDs, from
+    the cache where possible and from the database otherwise. With a
+    CDRProjection, the rows are projected on its columns."""
+    rows = cdr_cache.get_many(cdr_ids)
+    if projection is not None:
+        rows = {cdr_id: projection.project_row(row)
+            for cdr_id, row in rows.items()}
+    missing_ids = [cdr_id for cdr_id in cdr_ids if cdr_id not in rows]
+    if len(missing_ids) != 0:
+        rows.update(fetch_cdrs(db_cur, missing_ids, projection))
+    return rows
+
+def fetch_unreplicated(cdr_ids, projection=None):
+    """Fetch the rows of the given CDR-IDs that are past the high-water
+    mark of the replica, or within its trailing window, from the database,
+    as a dict() of CDR-ID => row. These CDRs were added, or committed late,
+    since the last run of the replication job."""
+    if not cdr_replica.is_ready():
+        return dict()
+    new_ids = [cdr_id for cdr_id in cdr_ids if cdr_id >
+        cdr_replica.high_water_mark - cdr_replica.trailing_window]
+    if len(new_ids) == 0:
+        return dict()
+    return read_router.process_query(fetch_cdrs, new_ids, projection)
+
+def fetch_cdr_rows(cdr_ids, projection=None):
+    """Return a dict() of CDR-ID => joined row for the given CDR-IDs like
+    'get_cdr_rows', from the replica where possible. The CDRs that aren't
+    replicated yet are looked up in the database."""
+    rows = db_handle_process_read(get_cdr_rows, cdr_ids, projection)
+    missing_ids = [cdr_id for cdr_id in cdr_ids if cdr_id not in rows]
+    if len(missing_ids) != 0:
+        rows.update(fetch_unreplicated(missing_ids, projection))
+    return rows
+
+
+def cdr_response(row, projection, if_none_match, media_type=None):
+    """Return the response of a CDR with its caching headers, as JSON or in
+    the binary encoding 'media_type'. The ETag is derived from the
+    serialized CDR and the encoding, and a matching 'If-None-Match' is
+    answered with 304. Only the CDR of a finished call is cacheable."""
+    cdr_dict = serialize_cdr_row(row, projection)
+    etag = make_etag(json.dumps(cdr_dict, cls=JSONEncoder, sort_keys=True))
+    if media_type is not None:
+        etag = make_etag(media_type, etag)
+    headers = cache_headers(etag, row[projection.callend_index] is not None,
+        cache_max_age)
+    # the representation depends on the 'Accept' header of the request
+    headers["Vary"] = "Accept"
+    if etag_matches(etag, if_none_match):
+        return connexion.NoContent, 304, headers
+    if media_type is not None:
+        return binary_response(media_type, native_cdr_row(row, projection),
+            headers)
+    return cdr_dict, 200, headers
+
+def calls_cdr_id_get(cdr_id, fields=None):  # noqa: E501
     """Return a list of Call Data Records (CDRs).
 
     This endpoint is currently being used for getting the CDR for a specific call, by providing the CDR-ID as &#x27;/calls/{cdr-id}&#x27;. # noqa: E501
 
     :param cdr_id: The CDR-ID of the call for which to retrieve the CDR.
     :type cdr_id: int
+    :param fields: The CDR fields to return, &#x27;cdrId&#x27; is always returned.
+    :type fields: List[str]
 
     :rtype: CDR
     """
-    # load database config parameters from the confighandler
-    db_params = config_handler.get_params("database")
-    # initiate a database connection
-    db_conn = mysql.connector.connect(
-        user=db_params["username"],
-        password=db_params["password"],
-        host=db_params["host"],
-        database=db_params["database"]
-    )
+    try:
+        projection = parse_fields(fields)
+    except ValueError as e:
+        return connexion.problem(400, "Bad Request", str(e))
 
-    # Get the DB cursor
-    db_cur = db_conn.cursor()
+    # finished calls never change, so they are served from the cache
+    row = cdr_cache.get(cdr_id)
+    if row is not None and projection is not None:
+        row = projection.project_row(row)
+    if row is None:
+        row = fetch_cdr_rows([cdr_id], projection).get(cdr_id)
 
-    # the query to perform on the database to fetch some of the fields
-    db_query_cdr = (
-        f"SELECT {cdr_table_schema} FROM cdr WHERE ID={cdr_id}"
-    )
-    db_query_cdr_next = (
-        f"SELECT {cdr_next_table_schema} FROM cdr_next WHERE cdr_ID={cdr_id}"
-    )
-    db_query_cdr_next_1 = (
-        f"SELECT {cdr_next_1_table_schema} FROM cdr_next_1 WHERE cdr_ID={cdr_id}"
-    )
+    # handle the case of missing CDR
+    if row is None:
+        return create_cdr_object(cdr_id, None, None, None)
+    return cdr_response(row, projection or cdr_full_projection,
+        connexion.request.headers.get("If-None-Match"),
+        negotiate_encoding(connexion.request.headers.get("Accept")))
 
-    # this function call is always used to fetch one CDR entry from the
-    # database, therefore, fetchone() is used for all queries.
-    db_cur.execute(db_query_cdr)
-    resp_cdr = db_cur.fetchone()
-    logger.info(resp_cdr)
+def create_cdr_list(resp_cdr, size, projection=cdr_full_projection):
+    """Build the CDRList of a page from its joined rows. A full page may be
+    followed by more CDRs, so it points after its last CDR with a cursor."""
+    return_cdr_list = CDRList()
 
-    db_cur.execute(db_query_cdr_next)
-    resp_cdr_next = db_cur.fetchone()
-    logger.info(resp_cdr_next)
+    # list object to populate all the CDR responses
+    cdrs_list = list()
 
-    db_cur.execute(db_query_cdr_next_1)
-    resp_cdr_next_1 = db_cur.fetchone()
-    logger.info(resp_cdr_next_1)
+    # Serialize the joined rows and populate the list
+    for each_row in resp_cdr:
+        cdrs_list.append(serialize_cdr_row(each_row, projection))
 
-    # all done, so close the cursor and connection with the database
-    db_cur.close()
-    db_conn.close()
+    # attach the list to the response object
+    return_cdr_list.cdr = cdrs_list
+
+    if len(resp_cdr) == size:
+        return_cdr_list.next_cursor = encode_cursor(resp_cdr[-1][0])
 
-    return create_cdr_object(cdr_id, resp_cdr, resp_cdr_next, resp_cdr_next_1)
+    # return the populated list
+    return return_cdr_list
 
-def calls_get(offset, size):
+def create_native_cdr_list(resp_cdr, size, projection=cdr_full_projection):
+    """Build the document of a page for the binary encodings, like
+    'create_cdr_list' with the CDRs of 'native_cdr_row'."""
+    cdr_list = {"cdr": [native_cdr_row(each_row, projection)
+        for each_row in resp_cdr]}
+    if len(resp_cdr) == size:
+        cdr_list["next_cursor"] = encode_cursor(resp_cdr[-1][0])
+    return cdr_list
+
+def encode_cursor(last_id):
+    """Encode the CDR-ID of the last CDR of a page into an opaque cursor."""
+    cursor_json = json.dumps({"last_id": last_id})
+    return base64.urlsafe_b64encode(cursor_json.encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode an opaque cursor into the CDR-ID of the last CDR of the
+    previous page. Returns None for a malformed cursor."""
+    try:
+        cursor_json = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        last_id = cursor_json["last_id"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    # JSON true and false are ints to Python
+    if not isinstance(last_id, int) or isinstance(last_id, bool) or \
+            last_id < 0:
+        return None
+    return last_id
+
+def fetch_cdr_page(db_cur, last_id, size, projection=None):
+    """Fetch at most 'size' complete CDRs following the CDR-ID 'last_id'.
+    The keyset condition on the primary key lets the database seek straight
+    to the page, whatever its position. Only the IDs of the page are read
+    from the 'cdr' index, the CDRs themselves come from the cache or from a
+    single joined query for the ones that aren't cached. With a
+    CDRProjection, only its columns are fetched."""
+    db_cur.execute(cdr_page_ids_query, (last_id, size))
+    page_ids = [each_row[0] for each_row in db_cur.fetchall()]
+    logger.info(f"Fetched {len(page_ids)} CDR-IDs after CDR-ID {last_id}.")
+
+    rows = get_cdr_rows(db_cur, page_ids, projection)
+    return [rows[cdr_id] for cdr_id in page_ids if cdr_id in rows]
+
+def get_stream_query(projection):
+    """Return the query of a streamed listing of the CDRs of a projection,
+    with bound (last_id, size) parameters."""
+    if projection is cdr_full_projection:
+        return cdr_stream_query
+    return f"{projection.query} WHERE cdr.ID>%s ORDER BY cdr.ID LIMIT %s"
+
+def stream_cdr_page(last_id, size, projection=cdr_full_projection):
+    """Generate the CDRs following the CDR-ID 'last_id' as NDJSON chunks.
+
+    The rows are read through an unbuffered cursor with fetchmany(), so only
+    'stream_chunk_size' rows are held in memory at any time. The pooled
+    connection is kept until the generator is exhausted or closed. Streamed
+    rows bypass the cache, so that exports don't evict the hot CDRs."""
+    streamed = 0
+    with read_cursor() as db_cur:
+        db_cur.execute(get_stream_query(projection), (last_id, size))
+        while True:
+            resp_cdr = db_cur.fetchmany(stream_chunk_size)
+            if not resp_cdr:
+                break
+            streamed += len(resp_cdr)
+            yield "".join(
+                json.dumps(serialize_cdr_row(each_row, projection),
+                    cls=JSONEncoder) + "\n" for each_row in resp_cdr)
+    logger.info(f"Streamed {streamed} CDRs after CDR-ID {last_id}.")
+
+def calls_get(size, offset=None, cursor=None, stream=None, fields=None):
     """Return a list of Call Data Records (CDRs).
 
-    This endpoint will be used to retrieve CDR list using &#x27;offset&#x27; and &#x27;size&#x27; parameters. The CDR list will always have less than or equal to &#x27;size&#x27; number of entries. # noqa: E501
+    This endpoint will be used to retrieve CDR list using &#x27;offset&#x27; or &#x27;cursor&#x27; and &#x27;size&#x27; parameters. The CDRs are ordered by CDR-ID. The CDR list will always have less than or equal to &#x27;size&#x27; number of entries, and &#x27;size&#x27; is capped by the server. The &#x27;next_cursor&#x27; of the response retrieves the following page. # noqa: E501
 
-    :param offset: The CDR-ID offset to use for retrieving CDRs.
-    :type offset: int
     :param size: The maximum number of CDRs to retrieve.
     :type size: int
+    :param offset: The CDR-ID offset to use for retrieving CDRs.
+    :type offset: int
+    :param cursor: The &#x27;next_cursor&#x27; of a previous page to retrieve the CDRs following it.
+    :type cursor: str
+    :param stream: The flag to stream the CDRs as newline delimited JSON.
+    :type stream: int
+    :param fields: The CDR fields to return, &#x27;cdrId&#x27; is always returned.
+    :type fields: List[str]
 
     :rtype: CDRList
     """
+    try:
+        projection = parse_fields(fields)
+    except ValueError as e:
+        return connexion.problem(400, "Bad Request", str(e))
+
+    # the cursor holds the last CDR-ID of the previous page, an offset is
+    # the first CDR-ID of this page
+    if cursor is not None:
+        last_id = decode_cursor(cursor)
+        if last_id is None:
+            return connexion.problem(400, "Bad Request",
+                f"Invalid cursor '{cursor}'.")
+    elif offset is not None:
+        last_id = offset - 1
+    else:
+        last_id = 0
+
+    # stream the CDRs as NDJSON if the client asked for it
+    accept = connexion.request.headers.get("Accept", "")
+    if stream == 1 or ndjson_mimetype in accept:
+        size = min(size, max_stream_size)
+        return Response(stream_with_context(stream_cdr_page(last_id, size,
+            projection or cdr_full_projection)), 200, mimetype=ndjson_mimetype)
+
+    size = min(size, max_page_size)
+
+    # fetch the whole page at once, instead of one lookup per CDR-ID
+    resp_cdr = db_handle_process_read(fetch_cdr_page, last_id, size,
+        projection)
+
+    media_type = negotiate_encoding(accept)
+    if media_type is not None:
+        return binary_response(media_type, create_native_cdr_list(resp_cdr,
+            size, projection or cdr_full_projection), {"Vary": "Accept"})
+    return create_cdr_list(resp_cdr, size, projection or cdr_full_projection)
+
+def fetch_new_cdrs(db_cur, last_id, size):
+    """Fetch at most 'size' complete CDRs following the CDR-ID 'last_id',
+    bypassing the cache."""
+    db_cur.execute(cdr_stream_query, (last_id, size))
+    return db_cur.fetchall()
+
+def fetch_window_cdrs(db_cur, first_id, last_id, known_ids):
+    """Fetch the complete CDRs with a CDR-ID in (first_id, last_id] that
+    aren't in 'known_ids', bypassing the cache. These are the CDRs that
+    were committed after a CDR with a larger CDR-ID."""
+    db_cur.execute("SELECT ID FROM cdr WHERE ID>%s AND ID<=%s",
+        (first_id, last_id))
+    cdr_ids = [each_row[0] for each_row in db_cur.fetchall()
+        if each_row[0] not in known_ids]
+    if len(cdr_ids) == 0:
+        return list()
+    placeholders, params = in_clause(cdr_ids)
+    db_cur.execute(f"{cdr_joined_query} WHERE cdr.ID IN ({placeholders}) "
+        "ORDER BY cdr.ID", params)
+    return db_cur.fetchall()
+
+def fetch_max_cdr_id(db_cur):
+    """Fetch the last CDR-ID of the 'cdr' table."""
+    db_cur.execute("SELECT MAX(ID) FROM cdr")
+    return db_cur.fetchone()[0]
+
+def get_feed_entries(last_id, size):
+    """Return the serialized CDRs following the CDR-ID 'last_id' as
+    (CDR-ID, CDR) tuples, this is the query of the live feed. The feed
+    reads from the database hosts and not from the replica, which lags
+    behind."""
+    resp_cdr = read_router.process_query(fetch_new_cdrs, last_id, size)
+    return [(each_row[0], serialize_cdr_row(each_row))
+        for each_row in resp_cdr]
+
+def get_feed_window(first_id, last_id, known_ids):
+    """Return the serialized CDRs with a CDR-ID in (first_id, last_id] that
+    the live feed hasn't seen as (CDR-ID, CDR) tuples."""
+    resp_cdr = read_router.process_query(fetch_window_cdrs, first_id,
+        last_id, known_ids)
+    return [(each_row[0], serialize_cdr_row(each_row))
+        for each_row in resp_cdr]
+
+# Live feed of the new CDRs, shared by all the subscribers
+cdr_feed = CDRFeed(feed_params, get_feed_entries, get_feed_window,
+    lambda: read_router.process_query(fetch_max_cdr_id))
+
+def encode_feed_cursor(position):
+    """Encode a position of the live feed into an opaque cursor. It holds
+    the high-water mark of the position like the cursor of a page, along
+    with the sequence number of the position in the feed."""
+    last_id, epoch, seq = position
+    cursor_json = json.dumps({"last_id": last_id, "epoch": epoch,
+        "seq": seq})
+    return base64.urlsafe_b64encode(cursor_json.encode()).decode()
+
+def decode_feed_cursor(cursor):
+    """Decode an opaque cursor into a position of the live feed. The cursor
+    of a page is followed by CDR-ID. Returns None for a malformed cursor."""
+    last_id = decode_cursor(cursor)
+    if last_id is None:
+        return None
+    cursor_json = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    epoch = cursor_json.get("epoch")
+    seq = cursor_json.get("seq")
+    if epoch is None or seq is None:
+        return last_id, None, None
+    if not isinstance(epoch, str) or not isinstance(seq, int) or \
+            isinstance(seq, bool) or seq < 0:
+        return None
+    return last_id, epoch, seq
+
+def format_feed_events(entries):
+    """Format CDRs of the feed as Server-Sent Events. The ID of an event
+    is the cursor of its position, so that a reconnecting client resumes
+    after it with its 'Last-Event-ID' header."""
+    return "".join(f"id: {encode_feed_cursor(position)}\n"
+        f"data: {json.dumps(cdr_dict, cls=JSONEncoder)}\n\n"
+        for position, cdr_dict in entries)
+
+def stream_feed_events(position):
+    """Generate the Server-Sent Events of the CDRs following 'position',
+    or of the CDRs from now on without one. The subscription ends when the
+    client disconnects."""
+    with cdr_feed.subscription():
+        if position is None:
+            position = cdr_feed.position()
+        # let the client know the stream is open
+        yield ": connected\n\n"
+        while True:
+            entries = cdr_feed.wait(position, feed_heartbeat, max_page_size)
+            if len(entries) == 0:
+                yield ": keep-alive\n\n"
+                continue
+            position = entries[-1][0]
+            yield format_feed_events(entries)
+
+def create_feed_list(entries, position):
+    """Build the CDRList of a long-poll of the feed. Its 'next_cursor'
+    always points after the last CDR seen, for the next long-poll."""
     return_cdr_list = CDRList()
+    return_cdr_list.cdr = [cdr_dict for _, cdr_dict in entries]
+    if len(entries) != 0:
+        position = entries[-1][0]
+    return_cdr_list.next_cursor = encode_feed_cursor(position)
+    return return_cdr_list
 
-    # initiate a database connection
-    db_params = config_handler.get_params("database")
-    db_conn = mysql.connector.connect(
-        user=db_params["username"],
-        password=db_params["password"],
-        host=db_params["host"],
-        database=db_params["database"]
-    )
+def calls_feed_get(cursor=None, timeout=None):  # noqa: E501
+    """Follow the new Call Data Records (CDRs) as they are added.
 
-    # Get the DB cursor
-    db_cur = db_conn.cursor()
+    This endpoint returns the CDRs added after the given &#x27;cursor&#x27;, or from now on without one. A long-poll waits up to &#x27;timeout&#x27; seconds for new CDRs and its &#x27;next_cursor&#x27; continues the feed. With an &#x27;Accept: text/event-stream&#x27; header, the CDRs are pushed as Server-Sent Events instead. # noqa: E501
 
-    # the query to perform on the database to fetch some of the fields
-    db_query_cdr = (
-        f"SELECT ID FROM cdr WHERE ID>={offset} LIMIT {size}"
-    )
-    
-    db_cur.execute(db_query_cdr)
-    resp_cdr = db_cur.fetchall()
-    logger.info(resp_cdr)
-    # all done, so close the cursor and connection with the database
-    db_cur.close()
-    db_conn.close()
+    :param cursor: The &#x27;next_cursor&#x27; of a previous response to retrieve the CDRs following it.
+    :type cursor: str
+    :param timeout: The maximum number of seconds to wait for new CDRs.
+    :type timeout: int
 
-    # list object to populate all the CDR responses
+    :rtype: CDRList
+    """
+    # a reconnecting event stream resumes after its last event
+    cursor = cursor or connexion.request.headers.get("Last-Event-ID")
+    position = None
+    if cursor is not None:
+        position = decode_feed_cursor(cursor)
+        if position is None:
+            return connexion.problem(400, "Bad Request",
+                f"Invalid cursor '{cursor}'.")
+
+    accept = connexion.request.headers.get("Accept", "")
+    if event_stream_mimetype in accept:
+        return Response(stream_with_context(stream_feed_events(position)),
+            200, mimetype=event_stream_mimetype,
+            headers={"Cache-Control": "no-cache"})
+
+    if timeout is None or timeout > max_feed_timeout:
+        timeout = max_feed_timeout
+    with cdr_feed.subscription():
+        if position is None:
+            position = cdr_feed.position()
+        entries = cdr_feed.wait(position, timeout, max_page_size)
+
+    return create_feed_list(entries, position)
+
+def create_cdr_batch_list(cdr_ids, rows):
+    """Build the CDRList of a batch lookup from the joined rows of its
+    CDR-IDs, in the order of the CDR-IDs. A CDR-ID without a row gets a CDR
+    with only its 'cdr_id' set, and is listed in 'missing'."""
+    return_cdr_list = CDRList()
     cdrs_list = list()
+    missing_ids = list()
 
-    # Fetch all the CDR records as per the CDR IDs and populate the list
-    for each_cdr_id in resp_cdr:
-        cdrs_list.append(calls_cdr_id_get(each_cdr_id[0]))
+    for cdr_id in cdr_ids:
+        row = rows.get(cdr_id)
+        if row is None:
+            cdrs_list.append(CDR(cdr_id=str(cdr_id)))
+            missing_ids.append(cdr_id)
+        else:
+            cdrs_list.append(serialize_cdr_row(row))
 
-    # attach the list to the response object
     return_cdr_list.cdr = cdrs_list
-
-    # return the populated list
+    return_cdr_list.missing = missing_ids
     return return_cdr_list
+
+def calls_batch_post(body):  # noqa: E501
+    """Return the Call Data Records (CDRs) of a list of CDR-IDs.
+
+    This endpoint retrieves the CDRs of the given CDR-IDs in a single request, in the order of the CDR-IDs. A CDR-ID that doesn&#x27;t exist gets a CDR with only its &#x27;cdrId&#x27; set, and is listed in &#x27;missing&#x27;. The number of CDR-IDs is capped by the server. # noqa: E501
+
+    :param body: The CDR-IDs of the CDRs to retrieve.
+    :type body: dict | bytes
+
+    :rtype: CDRList
+    """
+    # the validated JSON body is passed in by connexion in both serving modes
+    if isinstance(body, dict):
+        body = CDRBatchRequest.from_dict(body)
+
+    if len(body.cdr_ids) > max_batch_size:
+        return connexion.problem(400, "Bad Request",
+            f"At most {max_batch_size} CDR-IDs can be requested at once.")
+
+    # look each CDR-ID up once, with the cache and a single joined query
+    unique_ids = list(dict.fromkeys(body.cdr_ids))
+    rows = fetch_cdr_rows(unique_ids)
+    logger.info(f"Found {len(rows)} of {len(unique_ids)} batch CDR-IDs.")
+
+    return create_cdr_batch_list(body.cdr_ids, rows)
+
+def parse_ip_filter(name, value):
+    """Convert an IP address filter into the integer form used by the 'cdr'
+    table. Raises ValueError for an invalid address."""
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(ipaddress.IPv4Address(value))
+    except ipaddress.AddressValueError:
+        raise ValueError(f"Invalid IPv4 address '{value}' for '{name}'.")
+
+def parse_calldate_filter(name, value):
+    """Convert a calldate filter into a naive datetime in local time, like
+    the calldate column which the sniffer writes in the local timezone.
+    Raises ValueError for an invalid date and time."""
+    try:
+        calldate = util.deserialize_datetime(value)
+    except (ValueError, OverflowError):
+        raise ValueError(f"Invalid date and time '{value}' for '{name}'.")
+    if calldate.tzinfo is not None:
+        calldate = calldate.astimezone().replace(tzinfo=None)
+    return calldate
+
+def build_search_conditions(caller, called, calldate_from, calldate_to,
+        sipcallerip, sipcalledip, codec):
+    """Build the WHERE conditions and bound parameters of a CDR search.
+
+    Each filter maps to an indexed column of the 'cdr' table, except the
+    codec which is only checked on the rows selected by the other filters.
+    Searches that would have to scan the whole table are rejected with a
+    ValueError: they need an equality filter on caller, called, sipcallerip
+    or sipcalledip, or a bounded calldate range of at most
+    'max_search_days' days."""
+    conditions = list()
+    params = list()
+    indexed = False
+
+    for column, value in [("caller", caller), ("called", called)]:
+        if value is not None:
+            conditions.append(f"{column}=%s")
+            params.append(value)
+            indexed = True
+
+    for column, value in [("sipcallerip", sipcallerip),
+            ("sipcalledip", sipcalledip)]:
+        if value is not None:
+            conditions.append(f"{column}=%s")
+            params.append(parse_ip_filter(column, value))
+            indexed = True
+
+    date_from = date_to = None
+    if calldate_from is not None:
+        date_from = parse_calldate_filter("calldate_from", calldate_from)
+        conditions.append("calldate>=%s")
+        params.append(date_from)
+    if calldate_to is not None:
+        date_to = parse_calldate_filter("calldate_to", calldate_to)
+        conditions.append("calldate<%s")
+        params.append(date_to)
+    if date_from is not None and date_to is not None:
+        if date_to <= date_from:
+            raise ValueError("'calldate_to' must be after 'calldate_from'.")
+        if date_to - date_from <= datetime.timedelta(days=max_search_days):
+            indexed = True
+
+    if codec is not None:
+        payload_types = [payload_type
+            for payload_type, name in codec_lookup.items() if name == codec]
+        if len(payload_types) == 0:
+            raise ValueError(f"Unknown codec '{codec}'.")
+        placeholders = ", ".join(["%s"] * len(payload_types))
+        conditions.append(
+            f"(a_payload IN ({placeholders}) OR b_payload IN ({placeholders}))")
+        params.extend(payload_types + payload_types)
+
+    if not indexed:
+        raise ValueError("The search needs a caller, called, sipcallerip or "
+            "sipcalledip filter, or a calldate range of at most "
+            f"{max_search_days} days.")
+    return conditions, params
+
+def fetch_search_page(db_cur, conditions, params, last_id, size):
+    """Fetch at most 'size' complete CDRs following the CDR-ID 'last_id'
+    that match the search conditions. Like 'fetch_cdr_page', only the IDs
+    are selected by the search, the CDRs are read through the cache."""
+    where_clause = " AND ".join(conditions + ["ID>%s"])
+    db_query_cdr = (
+        f"SELECT ID FROM cdr WHERE {where_clause} ORDER BY ID LIMIT %s"
+    )
+
+    db_cur.execute(db_query_cdr, params + [last_id, size])
+    page_ids = [each_row[0] for each_row in db_cur.fetchall()]
+    logger.info(f"Search found {len(page_ids)} CDR-IDs after CDR-ID {last_id}.")
+
+    rows = get_cdr_rows(db_cur, page_ids)
+    return [rows[cdr_id] for cdr_id in page_ids if cdr_id in rows]
+
+def calls_search_get(size, caller=None, called=None, calldate_from=None, calldate_to=None, sipcallerip=None, sipcalledip=None, codec=None, cursor=None):  # noqa: E501
+    """Search Call Data Records (CDRs) with filters.
+
+    This endpoint retrieves the CDRs matching all the given filters, ordered by CDR-ID. The search must be narrowed by caller, called, sipcallerip or sipcalledip, or by a calldate range of limited span. The &#x27;next_cursor&#x27; of the response retrieves the following page. # noqa: E501
+
+    :param size: The maximum number of CDRs to retrieve.
+    :type size: int
+    :param caller: The MSISDN of the caller.
+    :type caller: str
+    :param called: The MSISDN of the callee.
+    :type called: str
+    :param calldate_from: Start of the calldate range (inclusive) in ISO 8601 format.
+    :type calldate_from: str
+    :param calldate_to: End of the calldate range (exclusive) in ISO 8601 format.
+    :type calldate_to: str
+    :param sipcallerip: IP address of the SIP caller.
+    :type sipcallerip: str
+    :param sipcalledip: IP address of the SIP callee.
+    :type sipcalledip: str
+    :param codec: CODEC of the caller or callee RTP stream.
+    :type codec: str
+    :param cursor: The &#x27;next_cursor&#x27; of a previous page to retrieve the CDRs following it.
+    :type cursor: str
+
+    :rtype: CDRList
+    """
+    try:
+        conditions, params = build_search_conditions(caller, called,
+            calldate_from, calldate_to, sipcallerip, sipcalledip, codec)
+    except ValueError as e:
+        return connexion.problem(400, "Bad Request", str(e))
+
+    last_id = 0
+    if cursor is not None:
+        last_id = decode_cursor(cursor)
+        if last_id is None:
+            return connexion.problem(400, "Bad Request",
+                f"Invalid cursor '{cursor}'.")
+    size = min(size, max_page_size)
+
+    resp_cdr = db_handle_process_read(fetch_search_page, conditions, params,
+        last_id, size)
+
+    return create_cdr_list(resp_cdr, size)
+
+# Columns of the bulk export as (JSON key, type, conversion) tuples. Unlike
+# the JSON CDRs, the values keep their database types, only the CODECs are
+# converted to their names.
+cdr_export_fields = [
+    ("cdr_id", "int", None),
+    ("caller", "string", None),
+    ("called", "string", None),
+    ("calldate", "timestamp", None),
+    ("callend", "timestamp", None),
+    ("call_id", "string", None),
+    ("duration", "int", None),
+    ("connect_duration", "int", None),
+    ("sipcallerip", "int", None),
+    ("sipcallerport", "int", None),
+    ("sipcalledip", "int", None),
+    ("sipcalledport", "int", None),
+    ("codec_a", "string", codec_lookup.get),
+    ("codec_b", "string", codec_lookup.get),
+    ("a_last_rtp_from_end", "int", None),
+    ("b_last_rtp_from_end", "int", None),
+    ("cell_id_caller", "string", str),
+    ("cell_id_called", "string", str),
+    ("imsi_contact", "string", str),
+    ("imsi_request", "string", str),
+    ("session_id", "string", str)
+]
+
+# Columns of the export files as (name, type) tuples
+cdr_export_columns = [(json_key, column_type)
+    for json_key, column_type, _ in cdr_export_fields]
+
+# Positions of the exported columns in a row of 'cdr_joined_query' with
+# their conversions
+cdr_export_row_fields = [
+    (cdr_joined_columns.index(cdr_attribute_columns[json_key][:2]), convert)
+    for json_key, _, convert in cdr_export_fields]
+
+# Query for the complete CDRs of a bulk export, with bound
+# (calldate_from, calldate_to) parameters
+cdr_export_query = (
+    f"{cdr_joined_query} WHERE cdr.calldate>=%s AND cdr.calldate<%s "
+    "ORDER BY cdr.calldate"
+)
+
+def export_cdr_row(row):
+    """Convert a row of 'cdr_joined_query' into the values of the exported
+    columns. The columns of a missing 'cdr_next' or 'cdr_next_1' entry are
+    left empty."""
+    return [row[index] if convert is None or row[index] is None
+        else convert(row[index]) for index, convert in cdr_export_row_fields]
+
+def parse_export_range(calldate_from, calldate_to):
+    """Return the calldate range of a bulk export as naive datetimes. Raises
+    ValueError for an invalid range or one longer than 'max_export_days'
+    days."""
+    date_from = parse_calldate_filter("calldate_from", calldate_from)
+    date_to = parse_calldate_filter("calldate_to", calldate_to)
+    if date_to <= date_from:
+        raise ValueError("'calldate_to' must be after 'calldate_from'.")
+    if date_to - date_from > datetime.timedelta(days=max_export_days):
+        raise ValueError(f"An export may span at most {max_export_days} "
+            "days.")
+    return date_from, date_to
+
+def stream_cdr_export(writer, date_from, date_to):
+    """Generate the file of the CDRs of a calldate range, one chunk of
+    'stream_chunk_size' rows at a time. Like 'stream_cdr_page', the rows are
+    read with fetchmany() and bypass the cache."""
+    exported = 0
+    with read_cursor() as db_cur:
+        db_cur.execute(cdr_export_query, (date_from, date_to))
+        yield writer.header()
+        while True:
+            resp_cdr = db_cur.fetchmany(stream_chunk_size)
+            if not resp_cdr:
+                break
+            exported += len(resp_cdr)
+            yield writer.write([export_cdr_row(each_row)
+                for each_row in resp_cdr])
+        yield writer.footer()
+    logger.info(f"Exported {exported} CDRs from {date_from} to {date_to}.")
+
+def get_export_attachment(writer, date_from, date_to):
+    """Return the Content-Disposition header of the file of an export."""
+    filename = (f"cdr_{date_from:%Y%m%dT%H%M%S}_{date_to:%Y%m%dT%H%M%S}."
+        f"{writer.extension}")
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+def calls_export_get(calldate_from, calldate_to, format_=None):  # noqa: E501
+    """Export the Call Data Records (CDRs) of a calldate range.
+
+    This endpoint streams all the CDRs of a calldate range as a file, ordered by calldate, for bulk analytics. The values keep their types, date and times are exported as timestamps. The &#x27;csv&#x27; format has a header row, the &#x27;arrow&#x27; format is the Apache Arrow IPC stream format. The span of the range is capped by the server. # noqa: E501
+
+    :param calldate_from: Start of the calldate range (inclusive) in ISO 8601 format.
+    :type calldate_from: str
+    :param calldate_to: End of the calldate range (exclusive) in ISO 8601 format.
+    :type calldate_to: str
+    :param format_: The file format of the export.
+    :type format_: str
+
+    :rtype: str
+    """
+    try:
+        date_from, date_to = parse_export_range(calldate_from, calldate_to)
+        writer = get_export_writer(format_ or "csv", cdr_export_columns)
+    except ValueError as e:
+        return connexion.problem(400, "Bad Request", str(e))
+
+    return Response(stream_with_context(stream_cdr_export(writer, date_from,
+        date_to)), 200, mimetype=writer.mimetype,
+        headers=get_export_attachment(writer, date_from, date_to))
@@ -0,0 +1,255 @@
+"""This module implements the non-blocking counterpart of 'db_handler' for the
+asynchronous serving mode.
+
+It keeps a pool of 'aiomysql' connections, sized from the same 'database'
+section of the configuration file, so that a query only suspends the request
+that issued it instead of blocking a worker. Connections that have been idle
+for longer than 'health_check_interval' are recycled when borrowed. The
+connections run in autocommit mode, so that each read sees the latest CDRs
+and the pool doesn't close the connections still in a transaction.
+
+The CDR reads are routed to the replica hosts of the 'database' section by
+an AioReadRouter, with the same host selection and health tracking as the
+'read_router' of the blocking controllers. The reads aren't hedged.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import time
+
+import aiomysql
+
+if __name__ == '__main__':
+    from config_handler import ConfigHandler
+    from db_handler import default_pool_size, default_health_check_interval
+    from read_router import HostHealth, default_replica_retry_interval, \
+        default_replica_max_failures
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.config_handler import ConfigHandler
+    from swagger_server.controllers.common.db_handler import \
+        default_pool_size, default_health_check_interval
+    from swagger_server.controllers.common.read_router import HostHealth, \
+        default_replica_retry_interval, default_replica_max_failures
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Errors that count as a failure of the host, like 'host_errors' of the
+# read router
+aio_host_errors = (aiomysql.InterfaceError, aiomysql.OperationalError,
+    OSError)
+
+
+class AioDBHandler():
+    """This class implements a pool of non-blocking MySQL connections.
+
+    The pool is created on the running event loop by 'warm_up()', which
+    opens all of its connections ahead of the first request.
+    """
+    def __init__(self, db_params):
+        """The class constructor. 'db_params' is the 'database' section of
+        the configuration file."""
+        self.db_params = db_params
+        self.pool_size = db_params.get("pool_size", default_pool_size)
+        self.health_check_interval = db_params.get(
+            "health_check_interval", default_health_check_interval)
+        self._pool = None
+
+    async def warm_up(self):
+        """Create the pool and open all of its connections. This is called
+        once on startup of the event loop."""
+        if self._pool is None:
+            self._pool = await aiomysql.create_pool(
+                user=self.db_params["username"],
+                password=self.db_params["password"],
+                host=self.db_params["host"],
+                db=self.db_params["database"],
+                minsize=self.pool_size,
+                maxsize=self.pool_size,
+                pool_recycle=self.health_check_interval,
+                autocommit=True
+            )
+            logger.info(f"Warmed up the connection pool with "
+                f"{self._pool.size} connections.")
+        return self._pool
+
+    async def process_query(self, query_fn, *args):
+        """Borrow a connection from the pool and await query_fn(db_cur,
+        *args) with a cursor on it. The connection is given back to the pool
+        once the coroutine returns, and its result is returned."""
+        pool = self._pool or await self.warm_up()
+        async with pool.acquire() as db_conn:
+            async with db_conn.cursor() as db_cur:
+                return await query_fn(db_cur, *args)
+
+    async def stream_query(self, query, params, chunk_size):
+        """Run 'query' through an unbuffered server-side cursor and yield
+        its rows in lists of at most 'chunk_size' rows. The connection is
+        held until the generator is exhausted or closed."""
+        pool = self._pool or await self.warm_up()
+        async with pool.acquire() as db_conn:
+            async with db_conn.cursor(aiomysql.SSCursor) as db_cur:
+                await db_cur.execute(query, params)
+                while True:
+                    rows = await db_cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    async def close(self):
+        """Close all the connections of the pool."""
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    def get_metrics(self):
+        """Return the usage of the pool as a dict()."""
+        if self._pool is None:
+            return {"pool_size": self.pool_size, "open": 0, "in_use": 0}
+        return {
+            "pool_size": self.pool_size,
+            "open": self._pool.size,
+            "in_use": self._pool.size - self._pool.freesize
+        }
+
+
+class AioReadRouter():
+    """This class routes the reads of the asynchronous controllers to the
+    replica hosts and falls back on the primary host, like 'ReadRouter'
+    does.
+
+    'primary' is the AioDBHandler of the primary host. The replica hosts get
+    an AioDBHandler each, with the pool parameters of the primary.
+    """
+    def __init__(self, db_params, primary):
+        """The class constructor. 'db_params' is the 'database' section of
+        the configuration file."""
+        retry_interval = db_params.get("replica_retry_interval",
+            default_replica_retry_interval)
+        max_failures = db_params.get("replica_max_failures",
+            default_replica_max_failures)
+
+        self.primary = primary
+        self.replicas = list()
+        for each_replica in db_params.get("replicas", []):
+            replica_params = dict(db_params)
+            replica_params.update(each_replica)
+            self.replicas.append(AioDBHandler(replica_params))
+
+        self.health = {db_handler: HostHealth(db_handler.db_params["host"],
+            retry_interval, max_failures)
+            for db_handler in [primary] + self.replicas}
+
+        # metrics of the routing
+        self.fallbacks = 0
+
+    async def warm_up(self):
+        """Create the pools of all the hosts. A replica that can't be
+        reached is left out of the rotation."""
+        await self.primary.warm_up()
+        for each_replica in self.replicas:
+            try:
+                await each_replica.warm_up()
+            except aio_host_errors as e:
+                logger.error(f"Couldn't warm up the connection pool of "
+                    f"{each_replica.db_params['host']}: {e}")
+                self.health[each_replica].record_failure()
+
+    def choose(self, exclude=()):
+        """Return the host for the next read, excluding the AioDBHandlers in
+        'exclude'. The primary host is only chosen when no replica is up,
+        and None is returned if it is excluded as well."""
+        candidates = [db_handler for db_handler in self.replicas
+            if db_handler not in exclude and self.health[db_handler].is_up()]
+        if len(candidates) == 0:
+            if self.primary in exclude:
+                return None
+            if len(self.replicas) != 0:
+                self.fallbacks += 1
+            return self.primary
+        return min(candidates, key=lambda db_handler:
+            (self.health[db_handler].mean_latency *
+                (db_handler.get_metrics()["in_use"] + 1)))
+
+    async def _run_query(self, db_handler, query_fn, *args):
+        """Await query_fn(db_cur, *args) on a host and record its health."""
+        health = self.health[db_handler]
+        start = time.monotonic()
+        try:
+            result = await db_handler.process_query(query_fn, *args)
+        except aio_host_errors:
+            health.record_failure()
+            raise
+        health.record_success(time.monotonic() - start)
+        return result
+
+    async def process_query(self, query_fn, *args):
+        """Await query_fn(db_cur, *args) on the chosen host and return its
+        result, like 'AioDBHandler.process_query()'. A read that fails on a
+        replica is retried once on another host."""
+        db_handler = self.choose()
+        try:
+            return await self._run_query(db_handler, query_fn, *args)
+        except aio_host_errors:
+            retry_handler = self.choose(exclude=[db_handler])
+            if db_handler is self.primary or retry_handler is None:
+                raise
+            logger.warning(f"Read failed on {db_handler.db_params['host']}, "
+                f"retrying on {retry_handler.db_params['host']}.")
+            return await self._run_query(retry_handler, query_fn, *args)
+
+    async def stream_query(self, query, params, chunk_size):
+        """Stream the rows of 'query' from the chosen host, like
+        'AioDBHandler.stream_query()'. A failure is recorded against the
+        host, the read isn't retried once rows were sent."""
+        db_handler = self.choose()
+        try:
+            async for rows in db_handler.stream_query(query, params,
+                    chunk_size):
+                yield rows
+        except aio_host_errors:
+            self.health[db_handler].record_failure()
+            raise
+
+    async def close(self):
+        """Close the pools of all the hosts."""
+        for db_handler in self.health:
+            await db_handler.close()
+
+    def get_metrics(self):
+        """Return the health of the hosts and the routing metrics as a
+        dict()."""
+        return {
+            "hosts": {db_handler.db_params["host"]: {
+                **health.get_metrics(), **db_handler.get_metrics()}
+                for db_handler, health in self.health.items()},
+            "fallbacks": self.fallbacks
+        }
+
+
+# The shared pool for all the asynchronous controllers of the program
+_aio_db_handler = None
+# The shared router of the reads of the asynchronous controllers
+_aio_read_router = None
+
+
+def get_aio_db_handler():
+    """Return the shared AioDBHandler object, creating it on first use."""
+    global _aio_db_handler
+    if _aio_db_handler is None:
+        db_params = ConfigHandler().get_params("database")
+        _aio_db_handler = AioDBHandler(db_params)
+    return _aio_db_handler
+
+
+def get_aio_read_router():
+    """Return the shared AioReadRouter object, creating it on first use."""
+    global _aio_read_router
+    if _aio_read_router is None:
+        db_params = ConfigHandler().get_params("database")
+        _aio_read_router = AioReadRouter(db_params, get_aio_db_handler())
+    return _aio_read_router
@@ -0,0 +1,222 @@
+"""This module implements the non-blocking counterpart of 'ssh_pool' for the
+asynchronous serving mode.
+
+It keeps up to 'pool_size' authenticated 'asyncssh' connections per sniffer
+host, sized from the same 'ssh' section of the configuration file, and
+multiplexes the exec sessions and SFTP channels of the requests over them.
+The connections send keepalives every 'keepalive_interval' seconds, and a
+connection that fails or closes is replaced on the next request. The host
+keys are checked against the known hosts of the user, as before.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import asyncio
+import time
+
+import asyncssh
+
+if __name__ == '__main__':
+    from config_handler import ConfigHandler
+    from errors import SSHPoolExhausted
+    from ssh_pool import default_pool_size, default_max_sessions, \
+        default_keepalive_interval, default_ssh_port
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.config_handler import ConfigHandler
+    from swagger_server.controllers.common.errors import SSHPoolExhausted
+    from swagger_server.controllers.common.ssh_pool import default_pool_size, \
+        default_max_sessions, default_keepalive_interval, default_ssh_port
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Errors that break a connection, it is closed and replaced. The SFTP errors
+# of a file leave the connection usable.
+connection_errors = (asyncssh.DisconnectError, ConnectionError)
+
+
+class AioPooledConnection():
+    """This class holds a pooled connection along with the number of sessions
+    currently open on it."""
+    def __init__(self, ssh_conn):
+        """The class constructor."""
+        self.ssh_conn = ssh_conn
+        self.sessions = 0
+
+    def is_active(self):
+        return not self.ssh_conn.is_closed()
+
+    def close(self):
+        self.ssh_conn.close()
+
+
+class AioSSHSession():
+    """This class gives access to a pooled connection for the commands and
+    transfers of a request. It is returned by 'AioSSHPool.session()' and
+    gives its session back to the pool at the end of its 'async with'
+    block. A connection error closes the connection."""
+    def __init__(self, ssh_pool, pooled_conn):
+        """The class constructor."""
+        self.ssh_pool = ssh_pool
+        self.pooled_conn = pooled_conn
+        self.ssh_conn = pooled_conn.ssh_conn
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.release(exc_type)
+
+    async def release(self, exc_type=None):
+        """Give the session back to the pool, after an error of 'exc_type'
+        if any. This is for sessions used outside of an 'async with'
+        block."""
+        broken = exc_type is not None and issubclass(exc_type,
+            connection_errors)
+        await self.ssh_pool.release(self.pooled_conn, broken)
+
+
+class AioSSHPool():
+    """This class implements the pool of connections of a sniffer host.
+
+    'sniffer_params' is the entry of the sniffer in the 'sniffers' section,
+    and 'ssh_params' the 'ssh' section of the configuration file.
+    """
+    def __init__(self, sniffer_params, ssh_params):
+        """The class constructor."""
+        self.host = sniffer_params["host"]
+        self.port = sniffer_params.get("port", default_ssh_port)
+        self.username = sniffer_params["username"]
+        self.password = sniffer_params["password"]
+        self.pool_size = ssh_params.get("pool_size", default_pool_size)
+        self.max_sessions = ssh_params.get("max_sessions",
+            default_max_sessions)
+        self.keepalive_interval = ssh_params.get("keepalive_interval",
+            default_keepalive_interval)
+
+        self._connections = list()
+        # connections being opened, they count against the pool size
+        self._connecting = 0
+        self._condition = asyncio.Condition()
+
+        # metrics of the pool
+        self.connects = 0
+        self.reuses = 0
+        self.failures = 0
+
+    async def _connect(self, timeout):
+        """Open and authenticate a new connection to the sniffer."""
+        ssh_conn = await asyncio.wait_for(asyncssh.connect(self.host,
+            port=self.port, username=self.username, password=self.password,
+            keepalive_interval=self.keepalive_interval), timeout)
+        logger.info(f"Opened an SSH connection to {self.host}.")
+        return AioPooledConnection(ssh_conn)
+
+    def _prune(self):
+        """Drop the connections that closed."""
+        for each_conn in list(self._connections):
+            if not each_conn.is_active():
+                self._connections.remove(each_conn)
+                self.failures += 1
+                logger.warning(f"Dropped a closed SSH connection to "
+                    f"{self.host}.")
+
+    async def session(self, timeout):
+        """Return an AioSSHSession on the least busy connection, opening a
+        new connection when all of them are busy and the pool isn't full.
+        Waits up to 'timeout' seconds for a free session when all the
+        connections are at 'max_sessions', then raises SSHPoolExhausted."""
+        expires = time.monotonic() + timeout
+        async with self._condition:
+            while True:
+                self._prune()
+                idle = [each_conn for each_conn in self._connections
+                    if each_conn.sessions < self.max_sessions]
+                least_busy = min(idle, default=None,
+                    key=lambda each_conn: each_conn.sessions)
+                if least_busy is not None and (least_busy.sessions == 0 or
+                        len(self._connections) + self._connecting >=
+                        self.pool_size):
+                    least_busy.sessions += 1
+                    self.reuses += 1
+                    return AioSSHSession(self, least_busy)
+                if len(self._connections) + self._connecting < self.pool_size:
+                    self._connecting += 1
+                    break
+                remaining = expires - time.monotonic()
+                try:
+                    await asyncio.wait_for(self._condition.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise SSHPoolExhausted(f"No SSH session to {self.host} "
+                        f"was available within {timeout:.1f} seconds.")
+
+        # open the new connection outside of the lock
+        try:
+            pooled_conn = await self._connect(max(0, expires -
+                time.monotonic()))
+        except BaseException:
+            async with self._condition:
+                self._connecting -= 1
+                self.failures += 1
+                self._condition.notify()
+            raise
+        async with self._condition:
+            self._connecting -= 1
+            pooled_conn.sessions += 1
+            self._connections.append(pooled_conn)
+            self.connects += 1
+        return AioSSHSession(self, pooled_conn)
+
+    async def release(self, pooled_conn, broken=False):
+        """Give a session back to the pool. A broken connection is closed
+        and dropped, its other sessions fail on their own."""
+        async with self._condition:
+            pooled_conn.sessions -= 1
+            if broken and pooled_conn in self._connections:
+                self._connections.remove(pooled_conn)
+                pooled_conn.close()
+                self.failures += 1
+                logger.warning(f"Dropped a failed SSH connection to "
+                    f"{self.host}.")
+            self._condition.notify()
+
+    async def close(self):
+        """Close all the connections of the pool."""
+        async with self._condition:
+            for each_conn in self._connections:
+                each_conn.close()
+            self._connections.clear()
+
+    def get_metrics(self):
+        """Return the state of the pool as a dict()."""
+        return {
+            "connections": len(self._connections),
+            "sessions": sum(each_conn.sessions
+                for each_conn in self._connections),
+            "connects": self.connects,
+            "reuses": self.reuses,
+            "failures": self.failures
+        }
+
+
+# The shared pools of the sniffer hosts, by host
+_aio_ssh_pools = dict()
+
+
+def get_aio_ssh_pool(sniffer_params):
+    """Return the shared AioSSHPool of a sniffer, creating it on first use
+    on the running event loop."""
+    host = sniffer_params["host"]
+    if host not in _aio_ssh_pools:
+        ssh_params = ConfigHandler().get_params("ssh", {})
+        _aio_ssh_pools[host] = AioSSHPool(sniffer_params, ssh_params)
+    return _aio_ssh_pools[host]
+
+
+async def close_aio_ssh_pools():
+    """Close the connections of all the pools on shutdown."""
+    for each_pool in _aio_ssh_pools.values():
+        await each_pool.close()
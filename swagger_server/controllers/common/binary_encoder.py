@@ -0,0 +1,98 @@
+"""This module implements the compact binary encodings of the CDR responses.
+
+JSON responses carry every number as a string and every date and time as
+text, which is costly to produce and to parse for clients reading millions of
+CDRs. Clients asking for MessagePack or CBOR in their 'Accept' header get the
+same documents in a binary encoding instead, with native integers and with
+the date and times as timestamps of the encoding.
+
+Both encodings are optional dependencies, each needs its package: 'msgpack'
+for MessagePack and 'cbor2' for CBOR. An encoding whose package isn't
+installed is never negotiated.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+# the packages of the encodings are optional dependencies
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+if __name__ == '__main__':
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Media types of the binary encodings
+msgpack_mimetype = "application/msgpack"
+cbor_mimetype = "application/cbor"
+
+
+def pack_msgpack(document):
+    """Encode a document as MessagePack, the date and times must carry a
+    timezone."""
+    return msgpack.packb(document, datetime=True)
+
+def pack_cbor(document):
+    """Encode a document as CBOR, the date and times must carry a
+    timezone."""
+    return cbor2.dumps(document, datetime_as_timestamp=True)
+
+
+# Encoders of the available binary encodings by media type
+binary_encoders = dict()
+if msgpack is not None:
+    binary_encoders[msgpack_mimetype] = pack_msgpack
+    binary_encoders["application/x-msgpack"] = pack_msgpack
+if cbor2 is not None:
+    binary_encoders[cbor_mimetype] = pack_cbor
+
+
+def parse_accept(accept):
+    """Return the media ranges of an 'Accept' header as a dict() of media
+    range => quality."""
+    media_ranges = dict()
+    for each_range in accept.split(","):
+        media_range, *params = [part.strip()
+            for part in each_range.split(";")]
+        quality = 1.0
+        for each_param in params:
+            name, _, value = each_param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_range:
+            media_ranges[media_range.lower()] = quality
+    return media_ranges
+
+def negotiate_encoding(accept):
+    """Return the media type of the binary encoding asked for in an 'Accept'
+    header, or None for JSON. A binary encoding has to be named explicitly,
+    and is only chosen over JSON if it is preferred at least as much."""
+    if not accept:
+        return None
+    media_ranges = parse_accept(accept)
+    json_quality = media_ranges.get("application/json", 0.0)
+    best_type, best_quality = None, 0.0
+    for media_type, quality in media_ranges.items():
+        if media_type in binary_encoders and quality > best_quality:
+            best_type, best_quality = media_type, quality
+    if best_type is None or best_quality < json_quality:
+        return None
+    return best_type
+
+def encode_document(media_type, document):
+    """Encode a document of native values in a negotiated binary
+    encoding."""
+    return binary_encoders[media_type](document)
@@ -0,0 +1,121 @@
+"""This module implements an in-process read-through cache for CDRs.
+
+The cache is a bounded LRU map from CDR-ID to the database row of the CDR.
+Each entry expires after a TTL, which is long for finished calls (their CDR
+never changes) and short for calls that are still ongoing. The cache counts
+hits, misses, evictions and expirations.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import threading
+import time
+from collections import OrderedDict
+
+if __name__ == '__main__':
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the 'cache' section of the configuration file
+default_cache_size = 10000
+default_ttl_finished = 3600
+default_ttl_ongoing = 10
+
+
+class CDRCache():
+    """This class implements a thread-safe LRU cache with per-entry TTLs.
+
+    A 'size' of 0 disables the cache, every lookup is then a miss.
+    """
+    def __init__(self, cache_params):
+        """The class constructor. 'cache_params' is the 'cache' section of
+        the configuration file."""
+        self.size = cache_params.get("size", default_cache_size)
+        self.ttl_finished = cache_params.get("ttl_finished",
+            default_ttl_finished)
+        self.ttl_ongoing = cache_params.get("ttl_ongoing", default_ttl_ongoing)
+
+        # entries as key => (value, expiry time), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # usage counters of the cache
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key):
+        """Return the cached value of 'key', or None if it isn't cached."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def get_many(self, keys):
+        """Return a dict() of the cached values among 'keys'."""
+        found = dict()
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def put(self, key, value, finished=True):
+        """Cache 'value' under 'key'. Values of finished calls are kept for
+        'ttl_finished' seconds, others for 'ttl_ongoing' seconds."""
+        if self.size <= 0:
+            return
+        ttl = self.ttl_finished if finished else self.ttl_ongoing
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key):
+        """Drop 'key' from the cache."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_metrics(self):
+        """Return the usage counters of the cache as a dict()."""
+        with self._lock:
+            return {
+                "size": self.size,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations
+            }
+
+
+def test_function():
+    cache = CDRCache({"size": 2, "ttl_finished": 60, "ttl_ongoing": 0})
+    cache.put(1, "finished call")
+    cache.put(2, "ongoing call", finished=False)
+    cache.put(3, "another finished call")
+    print(cache.get(1), cache.get(2), cache.get(3))
+    print(cache.get_metrics())
+
+
+if __name__ == '__main__':
+    test_function()
@@ -0,0 +1,282 @@
+"""This module implements the live feed of the new CDRs.
+
+Clients watching for new calls would otherwise each poll the CDR listing in
+a loop, so the load on the database grows with the number of watchers. A
+single tail job per server polls the database for the CDRs past the last
+CDR-ID it has seen, and keeps the most recent ones in a bounded in-memory
+buffer. Subscribers are woken up when new CDRs arrive and read them from the
+buffer, so the database sees one query per poll interval whatever the number
+of subscribers.
+
+The tail job only runs while there are subscribers, it stops after being
+idle for 'idle_timeout' seconds and is restarted by the next subscriber.
+
+A CDR can be committed after another one with a larger CDR-ID, past the
+CDR-ID the tail job has seen. Each poll also reads the last 'trailing_window'
+CDR-IDs below it again, and publishes the CDRs that aren't buffered yet. The
+buffer numbers the CDRs in the order they are published, and subscribers
+follow the feed by that sequence number, so that they also get the CDRs that
+were committed late.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+if __name__ == '__main__':
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the 'feed' section of the configuration file
+default_poll_interval = 1
+default_buffer_size = 10000
+default_batch_size = 1000
+default_idle_timeout = 60
+default_trailing_window = 1000
+
+
+class CDRFeed():
+    """This class implements the shared tail job and its subscribers.
+
+    'fetch_fn(last_id, size)' returns at most 'size' CDRs following the
+    CDR-ID 'last_id', in the order of their CDR-ID, as (CDR-ID, CDR) tuples.
+    'window_fn(first_id, last_id, known_ids)' returns the CDRs with a CDR-ID
+    in (first_id, last_id] that aren't in 'known_ids' likewise. 'max_id_fn()'
+    returns the last CDR-ID of the database, where the feed starts.
+
+    A position in the feed is a tuple of (high-water mark, epoch, sequence
+    number), the position after a CDR is returned along with it. The
+    positions of the current run of the tail job, its 'epoch', are followed
+    by sequence number. Other positions, and the positions behind the
+    buffer, are followed by CDR-ID after their high-water mark. The buffer
+    holds every CDR following the CDR-ID 'start_id', subscribers that are
+    further behind catch up through 'fetch_fn' directly.
+    """
+    def __init__(self, feed_params, fetch_fn, window_fn, max_id_fn):
+        """The class constructor. 'feed_params' is the 'feed' section of the
+        configuration file."""
+        self.poll_interval = feed_params.get("poll_interval",
+            default_poll_interval)
+        self.buffer_size = feed_params.get("buffer_size", default_buffer_size)
+        self.batch_size = feed_params.get("batch_size", default_batch_size)
+        self.idle_timeout = feed_params.get("idle_timeout",
+            default_idle_timeout)
+        self.trailing_window = feed_params.get("trailing_window",
+            default_trailing_window)
+        self.fetch_fn = fetch_fn
+        self.window_fn = window_fn
+        self.max_id_fn = max_id_fn
+
+        # the buffered CDRs as (sequence number, high-water mark, CDR-ID,
+        # CDR) tuples in the order they were published
+        self._entries = deque()
+        # the CDR-IDs of the buffered CDRs, a CDR is only published once
+        self._buffered_ids = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        # callables notified of new CDRs, for the asynchronous subscribers
+        self._listeners = set()
+        self._subscribers = 0
+        self._idle_since = time.monotonic()
+
+        self.epoch = None
+        self.start_seq = self.last_seq = 0
+        self.start_id = None
+        self.last_id = None
+
+        # metrics of the feed
+        self.polls = 0
+        self.published = 0
+        self.late = 0
+
+    def subscribe(self):
+        """Register a subscriber, starting the tail job if it isn't running.
+        The feed of a new tail job starts at the last CDR-ID of the
+        database."""
+        with self._condition:
+            self._subscribers += 1
+            if self._thread is None:
+                try:
+                    last_id = self.max_id_fn() or 0
+                except Exception:
+                    self._subscribers -= 1
+                    raise
+                self._entries.clear()
+                self._buffered_ids.clear()
+                self.epoch = uuid.uuid4().hex[:8]
+                self.start_seq = self.last_seq = 0
+                self.start_id = self.last_id = last_id
+                self._thread = threading.Thread(target=self._run,
+                    name="cdr-feed", daemon=True)
+                self._thread.start()
+                logger.info(f"Started the CDR feed after CDR-ID {last_id}.")
+
+    def unsubscribe(self):
+        """Unregister a subscriber."""
+        with self._condition:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                self._idle_since = time.monotonic()
+
+    @contextmanager
+    def subscription(self):
+        """Keep a subscriber registered for the duration of the 'with'
+        block."""
+        self.subscribe()
+        try:
+            yield self
+        finally:
+            self.unsubscribe()
+
+    def position(self):
+        """Return the position of the CDRs published from now on."""
+        with self._condition:
+            return self.last_id, self.epoch, self.last_seq
+
+    def add_listener(self, listener):
+        """Call 'listener()' from the tail job whenever new CDRs arrive."""
+        with self._condition:
+            self._listeners.add(listener)
+
+    def remove_listener(self, listener):
+        with self._condition:
+            self._listeners.discard(listener)
+
+    def _publish(self, entries):
+        """Add the CDRs that aren't buffered yet to the buffer and wake the
+        subscribers up."""
+        with self._condition:
+            published = 0
+            for cdr_id, cdr in entries:
+                if cdr_id in self._buffered_ids:
+                    continue
+                # the oldest CDR is dropped when the buffer is full
+                if len(self._entries) == self.buffer_size:
+                    dropped = self._entries.popleft()
+                    self._buffered_ids.discard(dropped[2])
+                    self.start_seq = dropped[0]
+                    self.start_id = max(self.start_id, dropped[2])
+                self.last_seq += 1
+                self.last_id = max(self.last_id, cdr_id)
+                self._entries.append((self.last_seq, self.last_id, cdr_id,
+                    cdr))
+                self._buffered_ids.add(cdr_id)
+                published += 1
+            if published == 0:
+                return
+            self.published += published
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for each_listener in listeners:
+            try:
+                each_listener()
+            except RuntimeError:
+                # the event loop of the listener was closed
+                self.remove_listener(each_listener)
+
+    def _run(self):
+        """The loop of the tail job thread."""
+        while True:
+            with self._condition:
+                if self._subscribers == 0 and time.monotonic() - \
+                        self._idle_since > self.idle_timeout:
+                    self._thread = None
+                    logger.info("Stopped the idle CDR feed.")
+                    return
+                last_id = self.last_id
+                # the buffer is complete up to 'start_id'
+                first_id = max(self.start_id, last_id - self.trailing_window)
+                known_ids = set(cdr_id for cdr_id in self._buffered_ids
+                    if cdr_id > first_id)
+            try:
+                late_entries = list()
+                if last_id > first_id:
+                    late_entries = self.window_fn(first_id, last_id,
+                        known_ids)
+                entries = self.fetch_fn(last_id, self.batch_size)
+                self.polls += 1
+            except Exception as e:
+                logger.error(f"CDR feed poll failed: {e}")
+                late_entries = entries = list()
+            if len(late_entries) != 0:
+                logger.info(f"{len(late_entries)} CDRs were committed below "
+                    f"CDR-ID {last_id}.")
+                self.late += len(late_entries)
+            if len(late_entries) + len(entries) != 0:
+                self._publish(late_entries + entries)
+            # keep reading while the feed is behind
+            if len(entries) < self.batch_size:
+                time.sleep(self.poll_interval)
+
+    def read(self, position, limit):
+        """Return at most 'limit' buffered CDRs following 'position' as
+        (position, CDR) tuples, or None if the buffer doesn't go back that
+        far."""
+        with self._condition:
+            return self._read(position, limit)
+
+    def _read(self, position, limit):
+        last_id, epoch, seq = position
+        if epoch == self.epoch and seq is not None and \
+                self.start_seq <= seq <= self.last_seq:
+            # the subscribers are mostly up to date, so scan from the end
+            entries = list()
+            for each_entry in reversed(self._entries):
+                if each_entry[0] <= seq:
+                    break
+                entries.append(each_entry)
+            entries.reverse()
+        elif self.start_id is not None and last_id >= self.start_id:
+            entries = [each_entry for each_entry in self._entries
+                if each_entry[2] > last_id]
+        else:
+            return None
+        return [((high_water_mark, self.epoch, entry_seq), cdr)
+            for entry_seq, high_water_mark, cdr_id, cdr in entries[:limit]]
+
+    def fetch(self, position, limit):
+        """Return at most 'limit' CDRs following the high-water mark of
+        'position' from 'fetch_fn', for the subscribers behind the buffer,
+        as (position, CDR) tuples."""
+        return [((cdr_id, None, None), cdr)
+            for cdr_id, cdr in self.fetch_fn(position[0], limit)]
+
+    def wait(self, position, timeout, limit):
+        """Return at most 'limit' CDRs following 'position' as (position,
+        CDR) tuples, waiting up to 'timeout' seconds for new CDRs. A
+        subscriber that is behind the buffer gets its CDRs from
+        'fetch_fn'."""
+        with self._condition:
+            deadline = time.monotonic() + timeout
+            while True:
+                entries = self._read(position, limit)
+                remaining = deadline - time.monotonic()
+                if entries is None or len(entries) != 0 or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+        if entries is None:
+            entries = self.fetch(position, limit)
+        return entries
+
+    def get_metrics(self):
+        """Return the state of the feed as a dict()."""
+        with self._condition:
+            return {
+                "running": self._thread is not None,
+                "subscribers": self._subscribers,
+                "buffered": len(self._entries),
+                "start_id": self.start_id,
+                "last_id": self.last_id,
+                "polls": self.polls,
+                "published": self.published,
+                "late": self.late
+            }
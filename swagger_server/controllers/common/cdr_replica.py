@@ -0,0 +1,361 @@
+"""This module implements a local replica of the CDR tables of the VoIP Monitor.
+
+The MySQL database of the VoIP Monitor is shared with the writers of the
+sniffer, so every read of the API competes with them and pays a network round
+trip. A background job copies the 'cdr', 'cdr_next' and 'cdr_next_1' tables
+into a local SQLite store (WAL mode), incrementally past a stored CDR-ID
+high-water mark, with the indexes of the CDR lookups, listings and searches.
+Once the replica has caught up, the CDR controllers read from it through the
+same cursor interface as the connection pool. The replica lags behind the
+database by up to a run of the job. When it hasn't caught up for 'max_lag'
+seconds, because the job fails or hangs, the controllers read from the
+database again until it catches up.
+
+Only the columns read by the API are copied. The CDRs of ongoing calls are
+copied again on every run until their call has ended. A call whose end is
+never written, such as a call of a crashed sniffer, is no longer refreshed
+once it started more than 'max_call_age' seconds ago. CDRs deleted from the
+database are kept in the replica.
+
+A CDR can be committed after another one with a larger CDR-ID, past the
+high-water mark. Each run compares the last 'trailing_window' CDR-IDs below
+the high-water mark with the database and copies the CDRs that are missing.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import datetime
+import functools
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+if __name__ == '__main__':
+    from db_handler import in_clause
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.db_handler import in_clause
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the 'replica' section of the configuration file
+default_store = "replica.db"
+default_interval = 5
+default_batch_size = 10000
+default_trailing_window = 1000
+default_max_lag = 30
+default_max_call_age = 86400
+
+# Columns holding a date and time, they are read back as datetime objects
+# like from the database
+timestamp_columns = ["calldate", "callend"]
+
+# Columns of the 'cdr' table that are indexed for the searches
+indexed_columns = ["caller", "called", "calldate", "sipcallerip",
+    "sipcalledip"]
+
+# Store the date and times like MySQL prints them, so that they compare in
+# the order of time
+sqlite3.register_adapter(datetime.datetime,
+    lambda value: value.isoformat(" "))
+sqlite3.register_converter("TIMESTAMP",
+    lambda value: datetime.datetime.fromisoformat(value.decode()))
+
+# Statement storing the high-water mark of the replica
+high_water_mark_upsert = ("INSERT INTO replica_state VALUES "
+    "('high_water_mark', ?) ON CONFLICT (name) DO UPDATE SET "
+    "value = excluded.value")
+
+
+@functools.lru_cache(maxsize=256)
+def translate_query(query):
+    """Translate the '%s' placeholders of a MySQL query into the '?'
+    placeholders of SQLite."""
+    return query.replace("%s", "?")
+
+
+class ReplicaCursor():
+    """This class provides the cursor interface of 'db_handler' on top of a
+    connection to the replica, so that the controllers run the same queries
+    on both."""
+    def __init__(self, store_conn):
+        """The class constructor."""
+        self._db_cur = store_conn.cursor()
+
+    def execute(self, query, params=()):
+        """Run 'query' with the bound 'params'."""
+        self._db_cur.execute(translate_query(query), tuple(params))
+
+    def fetchone(self):
+        return self._db_cur.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._db_cur.fetchmany(size)
+
+    def fetchall(self):
+        return self._db_cur.fetchall()
+
+    def close(self):
+        self._db_cur.close()
+
+
+class CDRReplica():
+    """This class implements the replication job and the read connections of
+    the replica.
+
+    'tables' lists the replicated tables as (table, schema) tuples, with the
+    columns of each table in a comma separated schema string. 'cdr' is keyed
+    by its 'ID' column and the other tables by their 'cdr_ID' column. The
+    job runs every 'interval' seconds on a daemon thread once started, and
+    copies at most 'batch_size' CDRs per transaction. The replica is 'ready'
+    once it has caught up with the database, and is read while it caught up
+    within the last 'max_lag' seconds.
+    """
+    def __init__(self, replica_params, db_handler, tables):
+        """The class constructor. 'replica_params' is the 'replica' section
+        of the configuration file and 'db_handler' is the connection pool of
+        the CDR database."""
+        self.store = replica_params.get("store", default_store)
+        self.interval = replica_params.get("interval", default_interval)
+        self.batch_size = replica_params.get("batch_size", default_batch_size)
+        self.trailing_window = replica_params.get("trailing_window",
+            default_trailing_window)
+        self.max_lag = replica_params.get("max_lag", default_max_lag)
+        self.max_call_age = replica_params.get("max_call_age",
+            default_max_call_age)
+        self.db_handler = db_handler
+
+        self.tables = [(table, [column.strip()
+            for column in schema.split(",")]) for table, schema in tables]
+        self.key_columns = {table: "ID" if table == "cdr" else "cdr_ID"
+            for table, _ in self.tables}
+
+        self._store_ready = False
+        self._thread = None
+        self._stop_event = threading.Event()
+        # idle read connections, the most recently used is handed out first
+        self._idle = queue.LifoQueue()
+
+        # the CDR-ID of the last replicated CDR and the progress of the job
+        self.ready = False
+        self.high_water_mark = 0
+        self.last_run = None
+        self.replicated = 0
+        # monotonic time at which the replica last caught up
+        self._caught_up = None
+
+    def _connect(self):
+        """Open a connection to the replica, creating its tables on first
+        use. The connections aren't tied to a thread, as a streamed listing
+        may be read from several."""
+        store_conn = sqlite3.connect(self.store, timeout=10,
+            detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        if not self._store_ready:
+            store_conn.execute("PRAGMA journal_mode=WAL")
+            for each_statement in self._schema():
+                store_conn.execute(each_statement)
+            store_conn.commit()
+            self._store_ready = True
+        return store_conn
+
+    def _schema(self):
+        """Return the statements creating the tables and indexes of the
+        replica."""
+        statements = ["CREATE TABLE IF NOT EXISTS replica_state ("
+            "name TEXT PRIMARY KEY, value INTEGER NOT NULL)"]
+        for table, columns in self.tables:
+            column_defs = ", ".join(
+                f"{column} TIMESTAMP" if column in timestamp_columns
+                else column for column in columns)
+            statements.append(f"CREATE TABLE IF NOT EXISTS {table} ("
+                f"{self.key_columns[table]} INTEGER PRIMARY KEY, "
+                f"{column_defs})")
+        for column in indexed_columns:
+            statements.append(f"CREATE INDEX IF NOT EXISTS cdr_{column} "
+                f"ON cdr ({column})")
+        # the CDRs of the ongoing calls are copied again on every run
+        statements.append("CREATE INDEX IF NOT EXISTS cdr_ongoing "
+            "ON cdr (ID) WHERE callend IS NULL")
+        return statements
+
+    def get_high_water_mark(self, store_conn):
+        """Return the CDR-ID of the last CDR copied to the replica."""
+        row = store_conn.execute("SELECT value FROM replica_state "
+            "WHERE name='high_water_mark'").fetchone()
+        return row[0] if row is not None else 0
+
+    def fetch_rows(self, db_cur, condition, params):
+        """Fetch the rows of all the replicated tables matching a condition
+        on their key column, as a dict() of table => list of rows."""
+        rows = dict()
+        for table, columns in self.tables:
+            key_column = self.key_columns[table]
+            db_cur.execute(f"SELECT {key_column}, {', '.join(columns)} "
+                f"FROM {table} WHERE {condition.format(key=key_column)}",
+                params)
+            rows[table] = db_cur.fetchall()
+        return rows
+
+    def store_rows(self, store_conn, rows):
+        """Insert or replace the rows of the replicated tables."""
+        for table, columns in self.tables:
+            placeholders = ", ".join(["?"] * (len(columns) + 1))
+            store_conn.executemany(f"INSERT OR REPLACE INTO {table} "
+                f"VALUES ({placeholders})", rows[table])
+
+    def copy_ids(self, store_conn, cdr_ids):
+        """Copy the CDRs of the given CDR-IDs to the replica."""
+        for start in range(0, len(cdr_ids), self.batch_size):
+            placeholders, params = in_clause(
+                cdr_ids[start:start + self.batch_size])
+            with self.db_handler.cursor() as db_cur:
+                rows = self.fetch_rows(db_cur,
+                    f"{{key}} IN ({placeholders})", params)
+            with store_conn:
+                self.store_rows(store_conn, rows)
+
+    def refresh_ongoing(self, store_conn):
+        """Copy the CDRs of the calls that were ongoing on the last run again,
+        unless they started more than 'max_call_age' seconds ago. Returns the
+        number of refreshed CDRs."""
+        oldest_call = datetime.datetime.now() - datetime.timedelta(
+            seconds=self.max_call_age)
+        ongoing_ids = [row[0] for row in store_conn.execute(
+            "SELECT ID FROM cdr WHERE callend IS NULL AND calldate>=?",
+            (oldest_call,)).fetchall()]
+        self.copy_ids(store_conn, ongoing_ids)
+        return len(ongoing_ids)
+
+    def fill_window(self, store_conn):
+        """Copy the CDRs of the trailing window that are in the database but
+        not in the replica, the CDRs committed late. Returns the number of
+        copied CDRs."""
+        last_id = self.get_high_water_mark(store_conn)
+        window_start = max(0, last_id - self.trailing_window)
+        with self.db_handler.cursor() as db_cur:
+            db_cur.execute("SELECT ID FROM cdr WHERE ID>%s AND ID<=%s",
+                (window_start, last_id))
+            db_ids = [row[0] for row in db_cur.fetchall()]
+        replica_ids = set(row[0] for row in store_conn.execute(
+            "SELECT ID FROM cdr WHERE ID>? AND ID<=?",
+            (window_start, last_id)))
+        missing_ids = [cdr_id for cdr_id in db_ids
+            if cdr_id not in replica_ids]
+        if len(missing_ids) != 0:
+            self.copy_ids(store_conn, missing_ids)
+            logger.info(f"Replicated {len(missing_ids)} CDRs committed "
+                f"below CDR-ID {last_id}.")
+        return len(missing_ids)
+
+    def run_once(self):
+        """Copy the CDRs past the high-water mark to the replica, along with
+        the CDRs of the trailing window that are missing, and refresh the
+        ongoing ones. Returns the number of copied CDRs."""
+        store_conn = self._connect()
+        replicated = 0
+        try:
+            self.refresh_ongoing(store_conn)
+            while True:
+                last_id = self.get_high_water_mark(store_conn)
+                with self.db_handler.cursor() as db_cur:
+                    db_cur.execute("SELECT MAX(ID) FROM (SELECT ID FROM cdr "
+                        "WHERE ID>%s ORDER BY ID LIMIT %s) AS batch",
+                        (last_id, self.batch_size))
+                    new_last_id = db_cur.fetchone()[0]
+                    if new_last_id is None:
+                        break
+                    rows = self.fetch_rows(db_cur,
+                        "{key}>%s AND {key}<=%s", (last_id, new_last_id))
+
+                with store_conn:
+                    self.store_rows(store_conn, rows)
+                    store_conn.execute(high_water_mark_upsert,
+                        (new_last_id,))
+                self.high_water_mark = new_last_id
+                replicated += len(rows["cdr"])
+                logger.info(f"Replicated CDRs up to CDR-ID {new_last_id}.")
+
+                if len(rows["cdr"]) < self.batch_size:
+                    break
+            replicated += self.fill_window(store_conn)
+            self.high_water_mark = self.get_high_water_mark(store_conn)
+        finally:
+            store_conn.close()
+
+        if not self.is_ready():
+            logger.info("The replica has caught up with the database.")
+        self.ready = True
+        self._caught_up = time.monotonic()
+        self.last_run = time.time()
+        self.replicated += replicated
+        return replicated
+
+    def _run(self):
+        """The loop of the job thread."""
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Replication failed: {e}")
+                if self.ready and self.get_lag() > self.max_lag:
+                    logger.warning(f"The replica is {self.get_lag():.0f}s "
+                        f"behind, reading from the database.")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """Start the job on a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                name="cdr-replica", daemon=True)
+            self._thread.start()
+            logger.info(f"Started the replication job, every "
+                f"{self.interval}s.")
+
+    def stop(self):
+        """Stop the job thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_lag(self):
+        """Return the number of seconds since the replica last caught up with
+        the database, or None if it never did."""
+        if self._caught_up is None:
+            return None
+        return time.monotonic() - self._caught_up
+
+    def is_ready(self):
+        """Return True if the replica can be read instead of the database,
+        i.e. it caught up within the last 'max_lag' seconds."""
+        return self.ready and self.get_lag() <= self.max_lag
+
+    @contextmanager
+    def cursor(self):
+        """Borrow a read connection to the replica for the duration of the
+        'with' block and provide a cursor on it."""
+        try:
+            store_conn = self._idle.get_nowait()
+        except queue.Empty:
+            store_conn = self._connect()
+        db_cur = ReplicaCursor(store_conn)
+        try:
+            yield db_cur
+        finally:
+            db_cur.close()
+            self._idle.put(store_conn)
+
+    def get_metrics(self):
+        """Return the progress of the job as a dict()."""
+        return {
+            "ready": self.is_ready(),
+            "lag": self.get_lag(),
+            "high_water_mark": self.high_water_mark,
+            "replicated": self.replicated,
+            "last_run": self.last_run
+        }
@@ -22,25 +22,16 @@ if __name__ != '__main__':
     from swagger_server.controllers.common.errors import UnsupportedPayload
     from swagger_server.controllers.common.codecs.g729.g729a import G729Adecoder
     from swagger_server.controllers.common.codecs.g722.g722 import G722Decoder
+    from swagger_server.controllers.common.log_handler import get_logger
 else:
     from rtp_parser import codec_lookup
     from errors import UnsupportedPayload
     from codecs.g729.g729a import G729Adecoder
     from codecs.g722.g722 import G722Decoder
+    from log_handler import get_logger
 
 # Create a module logger
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-# Create a file handler for the logger
-file_handler = logging.FileHandler('logs/' + __name__ + '.log')
-formatter = logging.Formatter(
-    '%(asctime)s : %(levelname)s : %(name)s : %(message)s'
-)
-file_handler.setFormatter(formatter)
-
-# Add the handler to the logger
-logger.addHandler(file_handler)
+logger = get_logger(__name__, logging.DEBUG)
 
 # A sample G.711 encoded payload
 g711u_payload = b"\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff" \
@@ -91,13 +82,15 @@ class CODECProcessor():
     """
     This class is the primary class of the module and takes an RTP payload
     and payload type as input. It then performs decoding of the payload
-    and returns a generated WAV audio file.
+    and returns a generated WAV audio file. The optional 'deadline' is
+    checked while the frames are decoded.
     """
-    def __init__(self, rtp_payload, payload_type, filename):
+    def __init__(self, rtp_payload, payload_type, filename, deadline=None):
         self.payload = rtp_payload
         # convert the PT field value into str
         self.payload_type = codec_lookup[payload_type]
         self.filename = filename
+        self.deadline = deadline
 
         # check for payload support in the constructor
         if self.payload_type not in supported_payloads:
@@ -120,9 +113,9 @@ class CODECProcessor():
         elif self.payload_type == "PCMA":
             decoded_audio = PCMACODEC(self.payload).decode()
         elif self.payload_type == "G722":
-            decoded_audio = G722CODEC(self.payload).decode()
+            decoded_audio = G722CODEC(self.payload, self.deadline).decode()
         elif self.payload_type == "G729":
-            decoded_audio = G729CODEC(self.payload).decode()
+            decoded_audio = G729CODEC(self.payload, self.deadline).decode()
         elif self.payload_type == "AMR":
             decoded_audio = AMRCODEC(self.payload).decode()
         elif self.payload_type == "AMR-WB":
@@ -231,8 +224,9 @@ class PCMACODEC(CODEC):
 
 class G722CODEC(CODEC):
     """CODEC implementation for ITU-T G.722 CODEC."""
-    def __init__(self, payload):
+    def __init__(self, payload, deadline=None):
         self.payload = payload
+        self.deadline = deadline
         logging.info("Initialized G722 CODEC processor!")
 
     def encode(self):
@@ -248,13 +242,16 @@ class G722CODEC(CODEC):
         buff_len = decoder.input_size
         # for each-buffer of length buff_len, decode the audio
         for i in range(0, len(self.payload), buff_len):
+            if self.deadline is not None:
+                self.deadline.check()
             output += decoder.decode(self.payload[i:i+buff_len])
         return output
 
 class G729CODEC(CODEC):
     """CODEC implementation for ITU-T G.729a CODEC."""
-    def __init__(self, payload):
+    def __init__(self, payload, deadline=None):
         self.payload = payload
+        self.deadline = deadline
 
     def encode(self):
         pass
@@ -271,6 +268,8 @@ class G729CODEC(CODEC):
 
         # for each_buffer of length buff_len, decode the audio
         for i in range(0, len(self.payload),buff_len ):
+            if self.deadline is not None:
+                self.deadline.check()
             # decode the payload in buffers
             output += decoder.process(self.payload[i:i+buff_len])
         return output
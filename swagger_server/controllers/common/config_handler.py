@@ -9,21 +9,17 @@ Date: January 3, 2022
 License: None
 """
 import json
+import logging
+
 if __name__ == '__main__':
     from errors import InvalidConfigError
+    from log_handler import get_logger
 else:
     from swagger_server.controllers.common.errors import InvalidConfigError
-
-import logging
+    from swagger_server.controllers.common.log_handler import get_logger
 
 # Setup the logger for this module
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler('logs/' + __name__ + ".log")
-formatter = logging.Formatter(
-    '%(asctime)s : %(levelname)s : %(name)s : %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+logger = get_logger(__name__)
 
 # Path to the configuration filename in the project parent directory
 config_filename = 'config.json'
@@ -47,12 +43,30 @@ class ConfigHandler():
             logger.error(f"Configuration invalid!\n {e}")
             raise InvalidConfigError(f"Configuration invalid! See 'logs/{__name__}.log'")
 
-    def get_params(self, type):
+    def get_params(self, type, default=None):
         """This method provides the parameter types requested by the module.
         Type can be a string of value:
-        1. database -> provides DB params as a dict()
+        1. database -> provides DB params as a dict(), with the optional
+           list of replica hosts in 'replicas'
         2. sniffers -> provides sniffer params as list of dict()
+        3. api -> provides API behaviour params as a dict()
+        4. cache -> provides CDR cache params as a dict()
+        5. rollup -> provides statistics rollup params as a dict()
+        6. replica -> provides local CDR replica params as a dict()
+        7. feed -> provides live CDR feed params as a dict()
+        8. timeouts -> provides request and stage timeouts as a dict()
+        9. logging -> provides log levels and log writer params as a dict()
+        10. ssh -> provides SSH transport pool params of the sniffers, and
+            the sizes of their lookup and transfer thread pools, as a dict()
+        11. pcap_cache -> provides the PCAP cache directory and size as a
+            dict()
+        12. pcap_merge -> provides the merge params of the PCAPs found on
+            several sniffers as a dict()
+        Sections that are optional in the configuration file are looked up
+        with a 'default' value, which is returned when they are missing.
         """
+        if default is not None:
+            return self.config.get(type, default)
         return self.config[type]
 
     def _validate_config(self):
@@ -75,6 +89,22 @@ class ConfigHandler():
         for p in db_params_list:
             if p not in db_params:
                 raise InvalidConfigError(f"'{p}' not defined in 'database' section.")
+        # the connection pool parameters are optional, but must be positive
+        for p in ["pool_size", "pool_timeout", "health_check_interval",
+                "statement_cache_size", "query_timeout"]:
+            if p in db_params and not self.config["database"][p] > 0:
+                raise InvalidConfigError(f"'{p}' in 'database' section must be positive.")
+        # the replica hosts are optional, their other connection parameters
+        # default to the ones of the primary host
+        for each_replica in self.config["database"].get("replicas", []):
+            if "host" not in each_replica.keys():
+                raise InvalidConfigError("'host' not defined in 'replicas' of 'database' section.")
+        for p in ["replica_retry_interval", "replica_max_failures"]:
+            if p in db_params and not self.config["database"][p] > 0:
+                raise InvalidConfigError(f"'{p}' in 'database' section must be positive.")
+        if "hedge_percentile" in db_params and \
+                not 0 < self.config["database"]["hedge_percentile"] < 100:
+            raise InvalidConfigError("'hedge_percentile' in 'database' section must be between 0 and 100.")
         logger.info("All entries exist in 'database' section.")
         logger.info("Validating 'sniffers' section.")
         sniffer_params_list = ["host", "username", "password", "spool_dir"]
@@ -83,6 +113,68 @@ class ConfigHandler():
                 if each_param not in each_sniffer.keys():
                     raise InvalidConfigError(f"'{each_param}' not defined in 'sniffers' section.")
         logger.info("All entries exist in 'sniffers' section.")
+        # the rollup section is optional, its job is only run if it is there
+        if "rollup" in config_sections:
+            logger.info("Validating 'rollup' section.")
+            for p in ["interval", "batch_size", "trailing_window",
+                    "max_call_age"]:
+                if p in self.config["rollup"] and not self.config["rollup"][p] > 0:
+                    raise InvalidConfigError(f"'{p}' in 'rollup' section must be positive.")
+        # the replica section is optional, the CDRs are read from the
+        # database if it isn't there
+        if "replica" in config_sections:
+            logger.info("Validating 'replica' section.")
+            for p in ["interval", "batch_size", "trailing_window",
+                    "max_lag", "max_call_age"]:
+                if p in self.config["replica"] and not self.config["replica"][p] > 0:
+                    raise InvalidConfigError(f"'{p}' in 'replica' section must be positive.")
+        # the timeouts section is optional, each timeout has a default
+        if "timeouts" in config_sections:
+            logger.info("Validating 'timeouts' section.")
+            for p, timeout in self.config["timeouts"].items():
+                if not timeout > 0:
+                    raise InvalidConfigError(f"'{p}' in 'timeouts' section must be positive.")
+        # the feed section is optional, its parameters have defaults
+        if "feed" in config_sections:
+            logger.info("Validating 'feed' section.")
+            for p in ["poll_interval", "buffer_size", "batch_size",
+                    "idle_timeout", "max_timeout", "heartbeat",
+                    "trailing_window"]:
+                if p in self.config["feed"] and not self.config["feed"][p] > 0:
+                    raise InvalidConfigError(f"'{p}' in 'feed' section must be positive.")
+        # the ssh section is optional, each pool parameter has a default
+        if "ssh" in config_sections:
+            logger.info("Validating 'ssh' section.")
+            for p in ["pool_size", "max_sessions", "keepalive_interval",
+                    "probe_workers", "fill_workers"]:
+                if p in self.config["ssh"] and not self.config["ssh"][p] > 0:
+                    raise InvalidConfigError(f"'{p}' in 'ssh' section must be positive.")
+        # the pcap_cache section is optional, its parameters have defaults
+        if "pcap_cache" in config_sections:
+            logger.info("Validating 'pcap_cache' section.")
+            if "max_size" in self.config["pcap_cache"] and \
+                    not self.config["pcap_cache"]["max_size"] > 0:
+                raise InvalidConfigError("'max_size' in 'pcap_cache' section must be positive.")
+        # the pcap_merge section is optional, its parameters have defaults
+        if "pcap_merge" in config_sections:
+            logger.info("Validating 'pcap_merge' section.")
+            if "merge_window" in self.config["pcap_merge"] and \
+                    not self.config["pcap_merge"]["merge_window"] > 0:
+                raise InvalidConfigError("'merge_window' in 'pcap_merge' section must be positive.")
+        # the logging section is optional, the loggers log at their own
+        # level if it isn't there
+        if "logging" in config_sections:
+            logger.info("Validating 'logging' section.")
+            log_params = self.config["logging"]
+            levels = list(log_params.get("levels", {}).values())
+            if "level" in log_params:
+                levels.append(log_params["level"])
+            for level in levels:
+                if not isinstance(logging.getLevelName(level), int):
+                    raise InvalidConfigError(f"Unknown log level '{level}' in 'logging' section.")
+            for p in ["queue_size", "batch_size", "flush_interval"]:
+                if p in log_params and not log_params[p] > 0:
+                    raise InvalidConfigError(f"'{p}' in 'logging' section must be positive.")
 
 
     def _print_config(self):
@@ -0,0 +1,355 @@
+"""This module implements a shared, pooled connection layer for the MySQL
+database of the VoIP Monitor.
+
+Opening a MySQL connection costs a TCP handshake, authentication and session
+setup. This module keeps a fixed-size pool of connections open so that the
+controllers only borrow and return them. Connections are health checked when
+borrowed, the pool can be warmed up at startup and the pool keeps saturation
+metrics which are logged when requests start waiting for a connection.
+
+All queries run as server-side prepared statements with bound parameters.
+Each pooled connection keeps its prepared statements, so a statement that
+was already run on a connection skips the parse step on the server.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import mysql.connector
+
+if __name__ == '__main__':
+    from config_handler import ConfigHandler
+    from errors import DBPoolExhausted
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.config_handler import ConfigHandler
+    from swagger_server.controllers.common.errors import DBPoolExhausted
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the optional pool parameters of the 'database' section
+default_pool_size = 8
+# seconds to wait for a free connection before giving up
+default_pool_timeout = 5
+# connections idle for longer than this (in seconds) are pinged on borrow
+default_health_check_interval = 30
+# prepared statements kept per connection, the least recently used statement
+# is closed on the server beyond this count
+default_statement_cache_size = 64
+# seconds to wait on the socket of a connection before giving up, so that a
+# hung server or network can't hold a worker forever
+default_query_timeout = 30
+
+
+class PooledConnection():
+    """This class holds a pooled connection along with the prepared
+    statements that were created on it."""
+    def __init__(self, db_conn, statement_cache_size):
+        """The class constructor."""
+        self.db_conn = db_conn
+        self.statement_cache_size = statement_cache_size
+        # query string => prepared cursor, least recently used first
+        self.statements = OrderedDict()
+        # time when the connection was last given back to the pool
+        self.idle_since = time.monotonic()
+
+    def get_statement(self, query):
+        """Return the prepared cursor and the cached query string object for
+        'query', creating the cursor on first use. The connector only skips
+        the prepare step when the very same string object is executed again,
+        so the cached string must be passed to execute()."""
+        entry = self.statements.get(query)
+        if entry is not None:
+            self.statements.move_to_end(query)
+            return entry
+        entry = (self.db_conn.cursor(prepared=True), query)
+        self.statements[query] = entry
+        while len(self.statements) > self.statement_cache_size:
+            _, (old_cur, _) = self.statements.popitem(last=False)
+            old_cur.close()
+        return entry
+
+    def close(self):
+        """Close the connection, which also drops its prepared statements."""
+        self.statements.clear()
+        self.db_conn.close()
+
+
+class PreparedCursor():
+    """This class provides the cursor interface used by the controllers on
+    top of the prepared statements of a pooled connection. Each execute()
+    runs the cached prepared statement of its query with bound parameters.
+    """
+    def __init__(self, pooled_conn):
+        """The class constructor."""
+        self._pooled_conn = pooled_conn
+        self._db_cur = None
+
+    def execute(self, query, params=()):
+        """Run 'query' as a prepared statement with the bound 'params'."""
+        db_cur, cached_query = self._pooled_conn.get_statement(query)
+        db_cur.execute(cached_query, tuple(params))
+        self._db_cur = db_cur
+
+    def fetchone(self):
+        return self._db_cur.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._db_cur.fetchmany(size)
+
+    def fetchall(self):
+        return self._db_cur.fetchall()
+
+    def close(self):
+        """Nothing to release, the prepared cursors stay with the pooled
+        connection for the next borrower."""
+        self._db_cur = None
+
+
+def in_clause(values):
+    """Return the placeholders and parameters for an 'IN (...)' clause over
+    'values'. The number of placeholders is rounded up to a power of two by
+    repeating the last value, so that a handful of prepared statements serve
+    every list length."""
+    bucket = 1
+    while bucket < len(values):
+        bucket *= 2
+    params = list(values) + [values[-1]] * (bucket - len(values))
+    return ", ".join(["%s"] * bucket), params
+
+
+class DBHandler():
+    """This class implements a fixed-size pool of MySQL connections.
+
+    Connections are created lazily up to 'pool_size' (or eagerly through
+    'warm_up()') and handed out through the 'cursor()' context manager.
+    """
+    def __init__(self, db_params):
+        """The class constructor. 'db_params' is the 'database' section of
+        the configuration file."""
+        self.db_params = db_params
+        self.pool_size = db_params.get("pool_size", default_pool_size)
+        self.pool_timeout = db_params.get("pool_timeout", default_pool_timeout)
+        self.health_check_interval = db_params.get(
+            "health_check_interval", default_health_check_interval)
+        self.statement_cache_size = db_params.get(
+            "statement_cache_size", default_statement_cache_size)
+        self.query_timeout = db_params.get("query_timeout",
+            default_query_timeout)
+
+        # idle PooledConnection objects, the most recently used connection
+        # is handed out first
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        # number of connections currently opened by this pool
+        self._created = 0
+
+        # saturation metrics of the pool
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._borrowed = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._health_check_failures = 0
+
+    def _connect(self):
+        """Open a new connection to the database. The connection runs in
+        autocommit mode, otherwise a pooled connection would stay in its
+        first transaction and keep reading the snapshot of the database
+        taken then, never seeing the new CDRs."""
+        db_conn = mysql.connector.connect(
+            user=self.db_params["username"],
+            password=self.db_params["password"],
+            host=self.db_params["host"],
+            database=self.db_params["database"],
+            connection_timeout=self.query_timeout,
+            autocommit=True
+        )
+        return PooledConnection(db_conn, self.statement_cache_size)
+
+    def warm_up(self):
+        """Open all the connections of the pool ahead of the first request."""
+        opened = 0
+        while True:
+            with self._lock:
+                if self._created >= self.pool_size:
+                    break
+                self._created += 1
+            try:
+                pooled_conn = self._connect()
+            except mysql.connector.Error as e:
+                with self._lock:
+                    self._created -= 1
+                logger.error(f"Couldn't warm up the connection pool: {e}")
+                break
+            self._idle.put(pooled_conn)
+            opened += 1
+        logger.info(f"Warmed up the connection pool with {opened} connections.")
+        return opened
+
+    def _is_healthy(self, pooled_conn):
+        """Check a connection before it is handed out. Recently used
+        connections are trusted, older ones are pinged."""
+        idle_time = time.monotonic() - pooled_conn.idle_since
+        if idle_time < self.health_check_interval:
+            return True
+        try:
+            pooled_conn.db_conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def _discard(self, pooled_conn):
+        """Close a connection and release its slot in the pool."""
+        try:
+            pooled_conn.close()
+        except mysql.connector.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _borrow(self):
+        """Take a healthy connection out of the pool."""
+        waited = False
+        wait_start = time.monotonic()
+        while True:
+            try:
+                pooled_conn = self._idle.get_nowait()
+            except queue.Empty:
+                # open a new connection if the pool isn't full yet
+                with self._lock:
+                    can_create = self._created < self.pool_size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        pooled_conn = self._connect()
+                    except mysql.connector.Error:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    break
+
+                # otherwise, wait for another request to return one
+                waited = True
+                remaining = self.pool_timeout - (time.monotonic() - wait_start)
+                try:
+                    pooled_conn = self._idle.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    logger.error(
+                        f"Connection pool exhausted! {self.get_metrics()}")
+                    raise DBPoolExhausted(
+                        f"No database connection available after "
+                        f"{self.pool_timeout} seconds.")
+
+            if self._is_healthy(pooled_conn):
+                break
+            # replace the broken connection on the next iteration
+            logger.warning("Discarding a broken database connection.")
+            with self._lock:
+                self._health_check_failures += 1
+            self._discard(pooled_conn)
+
+        with self._lock:
+            self._borrowed += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            if waited:
+                self._waits += 1
+                self._wait_time += time.monotonic() - wait_start
+        if waited:
+            logger.warning(f"Connection pool saturated. {self.get_metrics()}")
+        return pooled_conn
+
+    def _return(self, pooled_conn, broken=False):
+        """Give a borrowed connection back to the pool."""
+        with self._lock:
+            self._in_use -= 1
+        if broken:
+            self._discard(pooled_conn)
+        else:
+            pooled_conn.idle_since = time.monotonic()
+            self._idle.put(pooled_conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool for the duration of the 'with'
+        block. Connections that raised a database error are not reused."""
+        pooled_conn = self._borrow()
+        broken = False
+        try:
+            yield pooled_conn
+        except mysql.connector.Error:
+            broken = True
+            raise
+        finally:
+            if not broken and pooled_conn.db_conn.unread_result:
+                # a half-consumed result set would break the next borrower
+                broken = True
+            self._return(pooled_conn, broken)
+
+    @contextmanager
+    def cursor(self):
+        """Borrow a connection from the pool and provide a cursor running
+        prepared statements on it."""
+        with self.connection() as pooled_conn:
+            db_cur = PreparedCursor(pooled_conn)
+            try:
+                yield db_cur
+            finally:
+                db_cur.close()
+
+    def get_metrics(self):
+        """Return the saturation metrics of the pool as a dict()."""
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "borrowed": self._borrowed,
+                "waits": self._waits,
+                "wait_time": round(self._wait_time, 3),
+                "timeouts": self._timeouts,
+                "health_check_failures": self._health_check_failures
+            }
+
+
+# The shared pool for all the controllers of the program
+_db_handler = None
+_db_handler_lock = threading.Lock()
+
+
+def get_db_handler():
+    """Return the shared DBHandler object, creating it on first use."""
+    global _db_handler
+    if _db_handler is None:
+        with _db_handler_lock:
+            if _db_handler is None:
+                db_params = ConfigHandler().get_params("database")
+                _db_handler = DBHandler(db_params)
+    return _db_handler
+
+
+def test_function():
+    db_handler = get_db_handler()
+    db_handler.warm_up()
+    with db_handler.cursor() as db_cur:
+        db_cur.execute("SELECT 1")
+        print(db_cur.fetchall())
+    print(db_handler.get_metrics())
+
+
+if __name__ == '__main__':
+    test_function()
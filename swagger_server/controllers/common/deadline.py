@@ -0,0 +1,106 @@
+"""This module implements the deadlines of the requests that go through the
+PCAP and audio pipelines.
+
+A request gets an overall deadline when it starts, and each stage of its
+pipeline (database lookup, SSH connect, remote listing, transfer, parse and
+decode) gets a timeout of its own, capped by what is left of the request
+deadline. The timeout of a stage is passed to the blocking calls of that
+stage, and long running loops check the deadline as they go. A stage that
+times out or ends past its deadline raises DeadlineExceeded, which the
+controllers answer with 504 Gateway Timeout, so a hung database or sniffer
+never holds a worker for longer than the request deadline.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import asyncio
+import socket
+import time
+from contextlib import contextmanager
+
+if __name__ == '__main__':
+    from errors import DeadlineExceeded
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.errors import DeadlineExceeded
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the 'timeouts' section of the configuration file, in
+# seconds. 'request' is the overall deadline, the others are per stage.
+default_timeouts = {
+    "request": 30,
+    "database": 5,
+    "ssh_connect": 5,
+    "listing": 5,
+    "transfer": 20,
+    "parse": 10,
+    "decode": 10
+}
+
+# Errors raised by the blocking and asynchronous calls that time out
+timeout_errors = (socket.timeout, TimeoutError, asyncio.TimeoutError)
+
+
+class Deadline():
+    """This class holds the deadline of a request and of its current stage.
+
+    'timeout_params' is the 'timeouts' section of the configuration file.
+    """
+    def __init__(self, timeout_params):
+        """The class constructor, the request deadline starts now."""
+        self.timeouts = dict(default_timeouts)
+        self.timeouts.update(timeout_params)
+        self.expires = time.monotonic() + self.timeouts["request"]
+        self.current_stage = None
+        self._stage_expires = self.expires
+
+    def remaining(self):
+        """Return the number of seconds left before the request deadline."""
+        return self.expires - time.monotonic()
+
+    def stage_remaining(self):
+        """Return the number of seconds left before the deadline of the
+        current stage, which is never past the request deadline."""
+        return self._stage_expires - time.monotonic()
+
+    def check(self):
+        """Raise DeadlineExceeded if the current stage is past its deadline.
+        This is called from the loops of the CPU bound stages."""
+        if time.monotonic() >= self._stage_expires:
+            raise DeadlineExceeded(
+                f"The {self.current_stage or 'request'} stage exceeded its "
+                f"deadline.")
+
+    @contextmanager
+    def stage(self, name):
+        """Run a stage of the pipeline in the 'with' block, which gets the
+        timeout of the stage in seconds. A stage that times out, or fails
+        once it is past its deadline, raises DeadlineExceeded."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(
+                f"The request deadline expired before the {name} stage.")
+        timeout = min(self.timeouts[name], remaining)
+        self.current_stage = name
+        self._stage_expires = time.monotonic() + timeout
+        try:
+            yield timeout
+        except DeadlineExceeded:
+            raise
+        except timeout_errors as e:
+            raise DeadlineExceeded(
+                f"The {name} stage timed out after {timeout:.1f} seconds.") \
+                from e
+        except Exception as e:
+            # a connection closed by a socket timeout surfaces as an error of
+            # the client library
+            if time.monotonic() >= self._stage_expires:
+                raise DeadlineExceeded(
+                    f"The {name} stage timed out after {timeout:.1f} "
+                    f"seconds.") from e
+            raise
+        self.check()
@@ -11,4 +11,20 @@ class InvalidConfigError(Exception):
 
 # Exception to indicate unsupported payload
 class UnsupportedPayload(Exception):
-    pass
\ No newline at end of file
+    pass
+
+# Exception to indicate that no database connection could be borrowed
+class DBPoolExhausted(Exception):
+    pass
+
+# Exception to indicate that a stage of a request ran past its deadline
+class DeadlineExceeded(Exception):
+    pass
+
+# Exception to indicate that no SSH session to a sniffer could be opened
+class SSHPoolExhausted(Exception):
+    pass
+
+# Exception to indicate that the sniffers couldn't be searched for a PCAP
+class SnifferLookupError(Exception):
+    pass
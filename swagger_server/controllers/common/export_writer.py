@@ -0,0 +1,112 @@
+"""This module implements the file formats of the bulk CDR export.
+
+The export is written incrementally, one chunk of rows at a time, so that it
+can be streamed while it is read from the database. The values keep their
+native types: numbers stay numbers and date and times stay timestamps.
+
+Two formats are supported:
+1. csv -> comma separated values with a header row
+2. arrow -> the Apache Arrow IPC streaming format, a typed columnar binary
+   format that is read directly by pandas, Polars, DuckDB, Spark and most BI
+   tools. It needs the optional 'pyarrow' package.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import csv
+import io
+
+# pyarrow is an optional dependency, only needed for the 'arrow' format
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+if __name__ == '__main__':
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# End-of-stream marker of the Arrow IPC streaming format
+arrow_end_of_stream = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+class CSVWriter():
+    """This class writes rows as CSV. 'columns' lists the columns as (name,
+    type) tuples, the types are only used by the typed formats."""
+    mimetype = "text/csv"
+    extension = "csv"
+
+    def __init__(self, columns):
+        """The class constructor."""
+        self.columns = columns
+
+    def _write_rows(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+    def header(self):
+        """Return the bytes that start the file."""
+        return self._write_rows([[name for name, _ in self.columns]])
+
+    def write(self, rows):
+        """Return the bytes of a chunk of rows."""
+        return self._write_rows(rows)
+
+    def footer(self):
+        """Return the bytes that end the file."""
+        return b""
+
+
+class ArrowWriter():
+    """This class writes rows in the Arrow IPC streaming format, as one
+    record batch per chunk of rows. 'columns' lists the columns as (name,
+    type) tuples with the types 'int', 'string' or 'timestamp'."""
+    mimetype = "application/vnd.apache.arrow.stream"
+    extension = "arrows"
+
+    def __init__(self, columns):
+        """The class constructor."""
+        if pyarrow is None:
+            raise ValueError("The 'arrow' format needs the 'pyarrow' package, "
+                "which isn't installed on the server.")
+        arrow_types = {
+            "int": pyarrow.int64(),
+            "string": pyarrow.string(),
+            "timestamp": pyarrow.timestamp("us")
+        }
+        self.schema = pyarrow.schema([(name, arrow_types[column_type])
+            for name, column_type in columns])
+
+    def header(self):
+        return self.schema.serialize().to_pybytes()
+
+    def write(self, rows):
+        # transpose the rows into the columns of a record batch
+        arrays = [pyarrow.array(values, type=field.type)
+            for values, field in zip(zip(*rows), self.schema)]
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+        return batch.serialize().to_pybytes()
+
+    def footer(self):
+        return arrow_end_of_stream
+
+
+# Writers of the export formats by the name of the format
+export_writers = {
+    "csv": CSVWriter,
+    "arrow": ArrowWriter
+}
+
+
+def get_export_writer(export_format, columns):
+    """Return the writer of an export format for the given columns. Raises
+    ValueError for an unknown format or one that isn't available."""
+    if export_format not in export_writers:
+        raise ValueError(f"Unknown export format '{export_format}'.")
+    return export_writers[export_format](columns)
@@ -0,0 +1,61 @@
+"""This module implements the HTTP caching helpers of the API resources.
+
+The CDR, PCAP and audio of a finished call never change, so their responses
+carry a strong ETag and a Cache-Control header that lets browsers and CDNs
+keep them. A request whose 'If-None-Match' header matches the ETag of the
+resource is answered with 304 Not Modified, without redoing the work behind
+the response.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import hashlib
+
+if __name__ == '__main__':
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default 'cache_max_age' of the 'api' section of the configuration file, in
+# seconds
+default_cache_max_age = 86400
+
+
+def make_etag(*parts):
+    """Return a strong ETag for a resource identified by 'parts', the values
+    that the representation of the resource is derived from."""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(etag, if_none_match):
+    """Check the 'If-None-Match' header of a request against the ETag of a
+    resource. The header holds '*' or a list of ETags, which are compared
+    weakly as required for 'If-None-Match'."""
+    if etag is None or not if_none_match:
+        return False
+    for each_tag in if_none_match.split(","):
+        each_tag = each_tag.strip()
+        if each_tag == "*":
+            return True
+        if each_tag.startswith("W/"):
+            each_tag = each_tag[2:]
+        if each_tag == etag:
+            return True
+    return False
+
+def cache_headers(etag, finished, max_age=default_cache_max_age):
+    """Return the caching headers of a response as a dict(). The resources
+    of a finished call are cacheable for 'max_age' seconds, the others have
+    to be revalidated with their ETag on every use."""
+    if finished:
+        cache_control = f"public, max-age={max_age}, immutable"
+    else:
+        cache_control = "no-cache"
+    headers = {"Cache-Control": cache_control}
+    if etag is not None:
+        headers["ETag"] = etag
+    return headers
@@ -0,0 +1,199 @@
+"""This module implements the logging setup shared by all the modules of the
+program.
+
+Logging used to go through a FileHandler per module, so every log call of a
+request thread waited on a write to disk. The loggers now put their records
+on a bounded in-memory queue, and a single background writer thread writes
+them to the 'logs/<module>.log' file of each module. The files are flushed
+every 'batch_size' records, and at least every 'flush_interval' seconds.
+Records are dropped, and counted, rather than blocking a request thread when
+the queue is full.
+
+The 'logging' section of the configuration file sets the level of all the
+loggers with 'level', and of the loggers of a subsystem with 'levels', a
+dict() of logger name prefix => level. The most specific prefix applies.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# Default values for the 'logging' section of the configuration file
+default_queue_size = 10000
+default_batch_size = 100
+default_flush_interval = 1
+
+# Directory of the log files and format of their lines
+log_dir = 'logs/'
+log_format = '%(asctime)s : %(levelname)s : %(name)s : %(message)s'
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """This class puts the log records on the queue of the writer without
+    ever blocking, the records that don't fit are dropped."""
+    def __init__(self, log_queue):
+        """The class constructor."""
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter():
+    """This class implements the background writer thread. It writes the
+    records of each logger to its own file in 'log_dir', and flushes the
+    files in batches."""
+    def __init__(self, log_queue):
+        """The class constructor."""
+        self.queue = log_queue
+        self.batch_size = default_batch_size
+        self.flush_interval = default_flush_interval
+        self.formatter = logging.Formatter(log_format)
+        # open log files by logger name
+        self._files = dict()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # metrics of the writer
+        self.written = 0
+        self.flushes = 0
+
+    def _write(self, record):
+        """Write a record to the file of its logger, without flushing it."""
+        log_file = self._files.get(record.name)
+        if log_file is None:
+            log_file = open(log_dir + record.name + '.log', 'a')
+            self._files[record.name] = log_file
+        log_file.write(self.formatter.format(record) + '\n')
+        self._pending += 1
+        self.written += 1
+
+    def flush(self):
+        """Flush the records written since the last flush to disk."""
+        if self._pending != 0:
+            for each_file in self._files.values():
+                each_file.flush()
+            self._pending = 0
+            self.flushes += 1
+        self._last_flush = time.monotonic()
+
+    def _run(self):
+        """The loop of the writer thread, it ends on a None record."""
+        while True:
+            timeout = None
+            if self._pending != 0:
+                timeout = max(0, self._last_flush + self.flush_interval -
+                    time.monotonic())
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush()
+                continue
+            if record is None:
+                self.flush()
+                return
+            try:
+                self._write(record)
+            except Exception as e:
+                # there is nowhere else to log the failure of the log files
+                print(f"Failed to write a log record: {e}", file=sys.stderr)
+            if self._pending >= self.batch_size or time.monotonic() - \
+                    self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def start(self):
+        """Start the writer on a daemon thread."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                    name="log-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Write out the queued records and stop the writer thread."""
+        with self._lock:
+            if self._thread is not None:
+                self.queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+
+# The queue of the log records, its handler and its writer, shared by all
+# the loggers of the program
+log_queue = queue.Queue(default_queue_size)
+queue_handler = DroppingQueueHandler(log_queue)
+log_writer = LogWriter(log_queue)
+
+# Levels of the loggers set up so far by name, as requested by their module
+_default_levels = dict()
+# Configured levels, for all the loggers and by logger name prefix
+_level = None
+_levels = dict()
+
+
+def get_level(name):
+    """Return the configured level of a logger, from the most specific
+    prefix of its name in '_levels', or None if it isn't configured."""
+    prefix = name
+    while True:
+        if prefix in _levels:
+            return _levels[prefix]
+        if "." not in prefix:
+            return _level
+        prefix = prefix.rsplit(".", 1)[0]
+
+
+def get_logger(name, level=logging.INFO):
+    """Return the logger of a module, writing to 'logs/<name>.log' through
+    the shared queue. 'level' is its level unless the 'logging' section
+    configures another one."""
+    logger = logging.getLogger(name)
+    _default_levels[name] = level
+    logger.setLevel(get_level(name) or level)
+    if queue_handler not in logger.handlers:
+        logger.addHandler(queue_handler)
+    log_writer.start()
+    return logger
+
+
+def logging_init(log_params):
+    """Apply the 'logging' section of the configuration file to the writer
+    and to the loggers set up so far. This is called once at startup, the
+    loggers set up later get their configured level right away."""
+    global _level, _levels
+    _level = log_params.get("level")
+    _levels = dict(log_params.get("levels", {}))
+    with log_queue.mutex:
+        log_queue.maxsize = log_params.get("queue_size", default_queue_size)
+    log_writer.batch_size = log_params.get("batch_size", default_batch_size)
+    log_writer.flush_interval = log_params.get("flush_interval",
+        default_flush_interval)
+    for name, level in _default_levels.items():
+        logging.getLogger(name).setLevel(get_level(name) or level)
+
+
+def get_metrics():
+    """Return the state of the log queue and of its writer as a dict()."""
+    return {
+        "queued": log_queue.qsize(),
+        "dropped": queue_handler.dropped,
+        "written": log_writer.written,
+        "flushes": log_writer.flushes
+    }
+
+
+# write out the queued records when the program exits
+atexit.register(log_writer.stop)
@@ -0,0 +1,366 @@
+"""This module implements the on-disk cache of the PCAPs fetched from the
+sniffers.
+
+The PCAPs used to be downloaded into the 'pcap' directory on every request,
+and never cleaned up. The directory is now a cache bounded to 'max_size'
+bytes, the least recently used PCAPs are removed once it is full. The same
+recent calls are retrieved over and over while an incident is looked into,
+and are then served from disk.
+
+- A PCAP is written to a temporary file in the cache directory and renamed
+  into place once complete, so a PCAP is never read while it is written.
+- Each cached PCAP keeps the signature of its remote files, the size and
+  modification time of the PCAP on each sniffer. A PCAP whose signature
+  changed, such as the PCAP of an ongoing call, is fetched again.
+- Concurrent requests for a PCAP that isn't cached share a single transfer,
+  a CacheFill. The first request starts it, and the fill then runs on its
+  own at the pace of the sniffers. Every request, the first one included,
+  streams the PCAP to its client from the temporary file as it grows, so a
+  slow client holds neither the sniffers nor the other clients back.
+
+The PCAPs found in the directory on startup have no signature to be checked
+against, so they are removed rather than taking up room in the cache. The
+temporary files are only removed once they weren't written to for
+'stale_temp_age' seconds, since another server sharing the directory may
+still be writing them.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+if __name__ == '__main__':
+    from config_handler import ConfigHandler
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.config_handler import ConfigHandler
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the 'pcap_cache' section of the configuration file
+default_cache_dir = "pcap"
+default_max_size = 1073741824
+
+# Size of the chunks of the PCAPs read from the cache
+read_chunk_size = 65536
+
+# Temporary files that weren't written to for this many seconds were left
+# behind by a transfer that died
+stale_temp_age = 600
+
+
+class CacheEntry():
+    """This class holds the size and remote signature of a cached PCAP."""
+    def __init__(self, size, signature):
+        """The class constructor."""
+        self.size = size
+        self.signature = signature
+
+
+class CacheFill():
+    """This class is the transfer of a missing PCAP into the cache. The PCAP
+    is written to 'temp_path' with 'write()', and then either committed into
+    the cache or aborted. The requests for the PCAP read it as it is written
+    with 'stream()' or 'aio_stream()'."""
+    def __init__(self, pcap_cache, name, signature):
+        """The class constructor, the temporary file is created right away
+        so that the readers can open it as soon as they join."""
+        self.pcap_cache = pcap_cache
+        self.name = name
+        self.signature = signature
+        self.temp_path = pcap_cache._temp_path(name)
+        self._temp_file = open(self.temp_path, "wb")
+        # number of bytes written so far, and the end of the transfer
+        self.size = 0
+        self.done = False
+        self.error = None
+        self._condition = threading.Condition()
+        # callables notified of the progress, for the asynchronous readers
+        self._listeners = set()
+
+    def add_listener(self, listener):
+        """Call 'listener()' whenever the transfer makes progress."""
+        with self._condition:
+            self._listeners.add(listener)
+
+    def remove_listener(self, listener):
+        with self._condition:
+            self._listeners.discard(listener)
+
+    def _notify(self):
+        """Wake the readers up, the lock must be held."""
+        self._condition.notify_all()
+        for each_listener in list(self._listeners):
+            try:
+                each_listener()
+            except RuntimeError:
+                # the event loop of the listener was closed
+                self._listeners.discard(each_listener)
+
+    def write(self, chunk):
+        """Append a chunk to the PCAP."""
+        self._temp_file.write(chunk)
+        # the readers only read what reached the file
+        self._temp_file.flush()
+        with self._condition:
+            self.size += len(chunk)
+            self._notify()
+
+    def commit(self):
+        """Move the complete PCAP into place in the cache."""
+        self._temp_file.close()
+        with self._condition:
+            self.pcap_cache._commit(self.name, self.signature, self.temp_path)
+            self.done = True
+            self._notify()
+        self.pcap_cache._end(self.name, self)
+
+    def abort(self, error):
+        """Drop the partial PCAP after 'error', which is raised to the
+        readers."""
+        self._temp_file.close()
+        if not isinstance(error, Exception) or \
+                isinstance(error, asyncio.CancelledError):
+            # the readers weren't cancelled themselves
+            error = TimeoutError(f"The transfer of {self.name} was "
+                "cancelled.")
+        with self._condition:
+            self.error = error
+            self.done = True
+            self._notify()
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        self.pcap_cache._end(self.name, self)
+
+    def _open(self):
+        """Open the PCAP for a reader, the temporary file while it is
+        written and the cached PCAP once it is committed. An open temporary
+        file can still be read once it is moved into place."""
+        with self._condition:
+            if self.error is not None:
+                raise self.error
+            if not self.done:
+                return open(self.temp_path, "rb")
+        return self.pcap_cache._open_fetched(self.name, self.signature)
+
+    def _read(self, pcap_file):
+        """Return the next chunk of the PCAP for the reader of 'pcap_file',
+        b"" at the end of the PCAP, or None until more of it is written."""
+        with self._condition:
+            if self.error is not None:
+                raise self.error
+            available = self.size - pcap_file.tell()
+            done = self.done
+        if available > 0:
+            return pcap_file.read(min(available, read_chunk_size))
+        return b"" if done else None
+
+    def stream(self, timeout):
+        """Generate the chunks of the PCAP as they are written. Raises
+        TimeoutError if nothing is written for 'timeout' seconds, and the
+        error of the transfer if it fails."""
+        with self._open() as pcap_file:
+            while True:
+                chunk = self._read(pcap_file)
+                if chunk is None:
+                    with self._condition:
+                        if not self._condition.wait_for(lambda: self.done or
+                                self.size > pcap_file.tell(), timeout):
+                            raise TimeoutError(f"The transfer of {self.name} "
+                                f"stalled for {timeout:.1f} seconds.")
+                    continue
+                if not chunk:
+                    return
+                yield chunk
+
+    async def aio_stream(self, timeout):
+        """Generate the chunks of the PCAP as they are written like
+        'stream()', for the asynchronous controllers."""
+        loop = asyncio.get_event_loop()
+        progress = asyncio.Event()
+        listener = functools.partial(loop.call_soon_threadsafe, progress.set)
+        self.add_listener(listener)
+        try:
+            with self._open() as pcap_file:
+                while True:
+                    progress.clear()
+                    chunk = await loop.run_in_executor(None, self._read,
+                        pcap_file)
+                    if chunk is None:
+                        try:
+                            await asyncio.wait_for(progress.wait(), timeout)
+                        except asyncio.TimeoutError:
+                            raise TimeoutError(f"The transfer of {self.name} "
+                                f"stalled for {timeout:.1f} seconds.")
+                        continue
+                    if not chunk:
+                        return
+                    yield chunk
+        finally:
+            self.remove_listener(listener)
+
+
+class PCAPCache():
+    """This class implements the thread-safe LRU cache of the PCAPs in a
+    directory, bounded in bytes.
+
+    'cache_params' is the 'pcap_cache' section of the configuration file.
+    """
+    def __init__(self, cache_params):
+        """The class constructor, it clears the PCAPs of the earlier runs
+        and the temporary files left behind from the directory."""
+        self.cache_dir = cache_params.get("directory", default_cache_dir)
+        self.max_size = cache_params.get("max_size", default_max_size)
+
+        # entries as PCAP filename => CacheEntry, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # transfers in flight as PCAP filename => CacheFill
+        self._inflight = dict()
+
+        # usage counters of the cache
+        self._hits = 0
+        self._misses = 0
+        self._shared = 0
+        self._evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        removed = 0
+        for each_entry in os.scandir(self.cache_dir):
+            if not each_entry.is_file():
+                continue
+            try:
+                if each_entry.name.startswith(".") and time.time() - \
+                        each_entry.stat().st_mtime < stale_temp_age:
+                    continue
+                os.remove(each_entry.path)
+                removed += 1
+            except FileNotFoundError:
+                # removed by another server sharing the directory
+                pass
+        logger.info(f"Cleared {removed} files from the PCAP cache.")
+
+    def get_path(self, name):
+        """Return the path of the cached PCAP 'name'."""
+        return os.path.join(self.cache_dir, name)
+
+    def _temp_path(self, name):
+        """Return a new temporary path for the PCAP 'name', hidden in the
+        cache directory."""
+        return os.path.join(self.cache_dir, f".{name}.{uuid.uuid4().hex}.tmp")
+
+    def _open(self, name, signature):
+        """Open the cached PCAP 'name' if it is there with 'signature', the
+        lock must be held. An open PCAP can still be read once evicted."""
+        entry = self._entries.get(name)
+        if entry is None or entry.signature != signature:
+            return None
+        try:
+            pcap_file = open(self.get_path(name), "rb")
+        except FileNotFoundError:
+            self._size -= entry.size
+            del self._entries[name]
+            return None
+        self._entries.move_to_end(name)
+        return pcap_file
+
+    def _evict(self):
+        """Remove the least recently used PCAPs until the cache fits in
+        'max_size', the lock must be held. The most recent PCAP is always
+        kept."""
+        while self._size > self.max_size and len(self._entries) > 1:
+            name, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+            self._evictions += 1
+            try:
+                os.remove(self.get_path(name))
+            except FileNotFoundError:
+                pass
+
+    def _commit(self, name, signature, temp_path):
+        """Move a complete temporary file into place as the PCAP 'name'."""
+        size = os.path.getsize(temp_path)
+        with self._lock:
+            os.replace(temp_path, self.get_path(name))
+            old_entry = self._entries.pop(name, None)
+            if old_entry is not None:
+                self._size -= old_entry.size
+            self._entries[name] = CacheEntry(size, signature)
+            self._size += size
+            self._evict()
+
+    def begin(self, name, signature):
+        """Start the retrieval of the PCAP 'name' with the remote
+        'signature'. Return (open PCAP, None, None) on a hit. On a miss
+        return (None, the CacheFill of the transfer, None) if another
+        request already started it, or (None, None, a new CacheFill) for
+        this request to start it. The PCAP of a transfer is read from its
+        CacheFill."""
+        with self._lock:
+            pcap_file = self._open(name, signature)
+            if pcap_file is not None:
+                self._hits += 1
+                return pcap_file, None, None
+            inflight = self._inflight.get(name)
+            if inflight is not None and inflight.signature == signature:
+                self._shared += 1
+                return None, inflight, None
+            self._misses += 1
+            cache_fill = CacheFill(self, name, signature)
+            self._inflight[name] = cache_fill
+            return None, None, cache_fill
+
+    def _end(self, name, cache_fill):
+        """Forget the transfer of the PCAP 'name' once it is over."""
+        with self._lock:
+            if self._inflight.get(name) is cache_fill:
+                del self._inflight[name]
+
+    def _open_fetched(self, name, signature):
+        """Open a PCAP once its transfer completed."""
+        with self._lock:
+            pcap_file = self._open(name, signature)
+        if pcap_file is None:
+            raise FileNotFoundError(f"{name} was evicted from the PCAP cache "
+                "as soon as it was fetched.")
+        return pcap_file
+
+    def get_metrics(self):
+        """Return the usage counters of the cache as a dict()."""
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "hits": self._hits,
+                "misses": self._misses,
+                "shared": self._shared,
+                "evictions": self._evictions
+            }
+
+
+# The shared PCAP cache of the process
+_pcap_cache = None
+_pcap_cache_lock = threading.Lock()
+
+
+def get_pcap_cache():
+    """Return the shared PCAPCache, creating it on first use."""
+    global _pcap_cache
+    if _pcap_cache is None:
+        with _pcap_cache_lock:
+            if _pcap_cache is None:
+                _pcap_cache = PCAPCache(
+                    ConfigHandler().get_params("pcap_cache", {}))
+    return _pcap_cache
@@ -0,0 +1,148 @@
+"""This module implements the merge of several PCAP files into one, by the
+timestamps of their packets.
+
+The SIP and RTP of a call are captured in separate PCAPs, and a call can be
+captured by more than one sniffer, each of them holding a part of its
+packets. The PCAPs are merged as streams: the packet records are read one at
+a time from each file and written out in timestamp order, so the merge never
+holds more than one packet per input in memory. The inputs can be files, or
+PCAPs read in chunks through a ChunkReader. A packet seen by two sniffers at
+the same time is only written once.
+
+The inputs are classic libpcap files of the same link type, in either byte
+order and with microsecond or nanosecond timestamps. The output uses the
+global header of the first input, the timestamps of the other inputs are
+converted to its precision.
+
+When a call is captured by several sniffers, the lookup of its PCAPs waits
+up to 'merge_window' seconds for the other sniffers once one of them has it.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import heapq
+import struct
+
+if __name__ == '__main__':
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Magic numbers of the global header => byte order, sub-second units
+pcap_magics = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1000000),
+    b"\xa1\xb2\xc3\xd4": (">", 1000000),
+    b"\x4d\x3c\xb2\xa1": ("<", 1000000000),
+    b"\xa1\xb2\x3c\x4d": (">", 1000000000),
+}
+
+# Sizes of the global header and of the header of a packet record
+global_header_size = 24
+record_header_size = 16
+
+# Size of the chunks of the merged output
+merge_chunk_size = 65536
+
+# Default values for the 'pcap_merge' section of the configuration file
+default_merge_window = 0.5
+
+
+class ChunkReader():
+    """This class reads from an iterator of chunks of bytes like from a
+    file, so that a PCAP streamed in chunks can be merged."""
+    def __init__(self, chunks):
+        """The class constructor."""
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size):
+        """Return the next 'size' bytes, or less at the end."""
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class PCAPReader():
+    """This class reads the packet records of a PCAP file one at a time."""
+    def __init__(self, pcap_file):
+        """The class constructor, 'pcap_file' is open in binary mode.
+        Raises ValueError if it isn't a classic PCAP file."""
+        self.pcap_file = pcap_file
+        self.global_header = pcap_file.read(global_header_size)
+        magic = self.global_header[:4]
+        if len(self.global_header) != global_header_size or \
+                magic not in pcap_magics:
+            raise ValueError("Not a PCAP file.")
+        self.byte_order, self.units = pcap_magics[magic]
+        self.linktype = struct.unpack(self.byte_order + "I",
+            self.global_header[20:24])[0]
+        self._record_header = struct.Struct(self.byte_order + "IIII")
+
+    def records(self):
+        """Generate the packet records as tuples of (timestamp in units,
+        original length, packet data)."""
+        while True:
+            header = self.pcap_file.read(record_header_size)
+            if len(header) < record_header_size:
+                return
+            ts_sec, ts_frac, incl_len, orig_len = \
+                self._record_header.unpack(header)
+            data = self.pcap_file.read(incl_len)
+            if len(data) < incl_len:
+                logger.warning("Truncated packet at the end of a PCAP.")
+                return
+            yield ts_sec * self.units + ts_frac, orig_len, data
+
+
+def merge_pcaps(pcap_files):
+    """Merge the PCAP files in 'pcap_files', open in binary mode, and
+    generate the merged PCAP in chunks of bytes. Raises ValueError if an
+    input isn't a PCAP file, or if their link types differ."""
+    readers = [PCAPReader(each_file) for each_file in pcap_files]
+    output = readers[0]
+    for each_reader in readers[1:]:
+        if each_reader.linktype != output.linktype:
+            raise ValueError(f"Can't merge PCAPs of link types "
+                f"{output.linktype} and {each_reader.linktype}.")
+    record_header = struct.Struct(output.byte_order + "IIII")
+
+    def converted(reader):
+        # the timestamps of all the inputs in the units of the output
+        for timestamp, orig_len, data in reader.records():
+            if reader.units != output.units:
+                timestamp = timestamp * output.units // reader.units
+            yield timestamp, orig_len, data
+
+    chunk = bytearray(output.global_header)
+    # the packets written with the current timestamp, as (original length,
+    # hash of the data) tuples. The copies of a packet captured by several
+    # sniffers share its timestamp, but other packets with that timestamp
+    # can come in between.
+    last_timestamp = None
+    written = set()
+    for timestamp, orig_len, data in heapq.merge(*[converted(each_reader)
+            for each_reader in readers], key=lambda record: record[0]):
+        if timestamp != last_timestamp:
+            last_timestamp = timestamp
+            written.clear()
+        packet = (orig_len, hash(data))
+        if packet in written:
+            continue
+        written.add(packet)
+        chunk += record_header.pack(timestamp // output.units,
+            timestamp % output.units, len(data), orig_len)
+        chunk += data
+        if len(chunk) >= merge_chunk_size:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
@@ -6,30 +6,21 @@ Author: Noor
 Date: December 28, 2021
 License: None
 """
-import logging
-from scapy.utils import rdpcap
+from scapy.utils import PcapReader
 from math import floor
 
 # For testing the reader
 if __name__ != '__main__':
     from swagger_server.controllers.common.rtp_parser import RTPParser
+    from swagger_server.controllers.common.log_handler import get_logger
 else:
     from rtp_parser import RTPParser
+    from log_handler import get_logger
 
 import wave
 
 # Create a module logger
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-# Create a file handler and set the formatter for it
-file_handler = logging.FileHandler('logs/' + __name__ + '.log')
-formatter = logging.Formatter(
-    '%(asctime)s : %(levelname)s : %(name)s : %(message)s')
-file_handler.setFormatter(formatter)
-
-# Add the handler to the logger for this module
-logger.addHandler(file_handler)
+logger = get_logger(__name__)
 
 class PCAPProcessor():
     """This class provides the functionality for reading a Packet Capture
@@ -37,10 +28,12 @@ class PCAPProcessor():
     returned can be treated as a raw binary stream which can then be parsed
     by other modules in the package like 'RTPParser'.
     """
-    def __init__(self, filename):
-        """This class constructor"""
+    def __init__(self, filename, deadline=None):
+        """This class constructor. The optional 'deadline' is checked while
+        the packets are read and parsed."""
         # Name of the PCAP file that is to be read
         self.filename = filename
+        self.deadline = deadline
         self.rtp_parser = RTPParser()
 
     def dump_all_packets(self):
@@ -48,9 +41,13 @@ class PCAPProcessor():
         packet_list = list()
 
         logger.info(f"Reading packets from {self.filename}")
-        packets = rdpcap(self.filename)
-        for packet in packets:
-            packet_list.append(bytes(packet))
+        # the packets are read one at a time, so that a large PCAP is
+        # stopped at the deadline
+        with PcapReader(self.filename) as packets:
+            for packet in packets:
+                if self.deadline is not None:
+                    self.deadline.check()
+                packet_list.append(bytes(packet))
 
         logger.info(f"Finished reading {len(packet_list)} packets from {self.filename}")
         return packet_list
@@ -58,15 +55,17 @@ class PCAPProcessor():
     def get_first_packet(self):
         """Return the first packet from the PCAP file. This is used to
         determine Payload Type (PT) field of an RTP stream."""
-        # The rdpcap function returns a 'PacketList' object, even for a single
-        # packet, so need to subscript and return one object
-        return rdpcap(self.filename, 1)[0]
+        # only the first packet is read, not the whole file
+        with PcapReader(self.filename) as packets:
+            return packets.read_packet()
 
     def get_all_payload(self):
         logger.info(f"Extracting payload from {self.filename}")
         packets = self.dump_all_packets()
         total_payload = b''
         for each_packet in packets:
+            if self.deadline is not None:
+                self.deadline.check()
             total_payload += self.rtp_parser.parse(each_packet)
         logger.info(f"Extracted {len(total_payload)} bytes of payload.")
         return total_payload
@@ -0,0 +1,317 @@
+"""This module implements the routing of the reads to the MySQL replica hosts
+of the VoIP Monitor database.
+
+The 'replicas' list of the 'database' section names the replica hosts, their
+other connection parameters default to the ones of the primary host. Each
+host gets its own connection pool. Reads go to the healthy replica with the
+lowest expected latency, which is its recent mean latency scaled by the
+number of queries it is already running. A replica whose queries keep failing
+is taken out of the rotation for 'replica_retry_interval' seconds, and the
+reads fall back on the primary host when no replica is healthy. A read that
+finds the connection pool of its host exhausted is retried on another host,
+without counting against the busy host.
+
+With 'hedged_reads', a read that has been running on a replica for longer
+than the 'hedge_percentile' latency of that replica is sent to a second
+replica as well, and the first result is used. This trims the tail latency caused by
+a single slow host at the cost of a few duplicate queries.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+import mysql.connector
+
+if __name__ == '__main__':
+    from config_handler import ConfigHandler
+    from db_handler import DBHandler, get_db_handler
+    from errors import DBPoolExhausted
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.config_handler import ConfigHandler
+    from swagger_server.controllers.common.db_handler import DBHandler, \
+        get_db_handler
+    from swagger_server.controllers.common.errors import DBPoolExhausted
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the optional routing parameters of the 'database'
+# section
+default_hedge_percentile = 95
+# seconds a failing replica is left out of the rotation
+default_replica_retry_interval = 30
+# consecutive failures after which a replica is left out of the rotation
+default_replica_max_failures = 3
+
+# Number of recent query latencies kept per host
+latency_window = 1000
+# Latencies needed before a host is hedged, and between two updates of its
+# percentile
+min_latency_samples = 50
+# Weight of the latest query in the mean latency of a host
+latency_weight = 0.2
+
+# Errors that count as a failure of the host, those of the connection and
+# of the server. The errors of a query, such as a ProgrammingError or a
+# DataError, would fail on any host.
+host_errors = (mysql.connector.InterfaceError,
+    mysql.connector.OperationalError)
+# Errors after which a read is retried on another host. A host whose pool is
+# exhausted is busy rather than failing, so its health is left alone.
+retry_errors = host_errors + (DBPoolExhausted,)
+
+
+class HostHealth():
+    """This class tracks the latency and the failures of the queries run on
+    a database host."""
+    def __init__(self, host, retry_interval, max_failures):
+        """The class constructor."""
+        self.host = host
+        self.retry_interval = retry_interval
+        self.max_failures = max_failures
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._new_samples = 0
+        self._percentiles = dict()
+        # exponentially weighted mean latency, in seconds
+        self.mean_latency = 0.0
+        self.failures = 0
+        self.down_until = 0.0
+
+    def record_success(self, latency):
+        """Record the latency of a successful query."""
+        with self._lock:
+            if len(self._latencies) == 0:
+                self.mean_latency = latency
+            else:
+                self.mean_latency += latency_weight * \
+                    (latency - self.mean_latency)
+            self._latencies.append(latency)
+            self._new_samples += 1
+            self.failures = 0
+
+    def record_failure(self):
+        """Record a failed query, taking the host out of the rotation after
+        'max_failures' failures in a row."""
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.down_until = time.monotonic() + self.retry_interval
+                logger.error(f"Database host {self.host} is down after "
+                    f"{self.failures} failures, retrying in "
+                    f"{self.retry_interval} seconds.")
+
+    def is_up(self):
+        """Check if the host is in the rotation. A host that is down gets a
+        query again once its retry interval is over."""
+        return time.monotonic() >= self.down_until
+
+    def percentile(self, percentile):
+        """Return a percentile of the recent latencies in seconds, or None
+        while there are too few of them."""
+        with self._lock:
+            if len(self._latencies) < min_latency_samples:
+                return None
+            if percentile not in self._percentiles or \
+                    self._new_samples >= min_latency_samples:
+                latencies = sorted(self._latencies)
+                index = min(len(latencies) - 1,
+                    len(latencies) * percentile // 100)
+                self._percentiles[percentile] = latencies[index]
+                self._new_samples = 0
+            return self._percentiles[percentile]
+
+    def get_metrics(self):
+        """Return the health of the host as a dict()."""
+        return {
+            "up": self.is_up(),
+            "mean_latency": round(self.mean_latency, 4),
+            "failures": self.failures
+        }
+
+
+class ReadRouter():
+    """This class routes the reads of the controllers to the replica hosts
+    and falls back on the primary host.
+
+    'primary' is the DBHandler of the primary host. The replica hosts get a
+    DBHandler each, with the pool parameters of the primary.
+    """
+    def __init__(self, db_params, primary):
+        """The class constructor. 'db_params' is the 'database' section of
+        the configuration file."""
+        self.hedged_reads = db_params.get("hedged_reads", False)
+        self.hedge_percentile = db_params.get("hedge_percentile",
+            default_hedge_percentile)
+        retry_interval = db_params.get("replica_retry_interval",
+            default_replica_retry_interval)
+        max_failures = db_params.get("replica_max_failures",
+            default_replica_max_failures)
+
+        self.primary = primary
+        self.replicas = list()
+        for each_replica in db_params.get("replicas", []):
+            replica_params = dict(db_params)
+            replica_params.update(each_replica)
+            self.replicas.append(DBHandler(replica_params))
+
+        self.health = {db_handler: HostHealth(db_handler.db_params["host"],
+            retry_interval, max_failures)
+            for db_handler in [primary] + self.replicas}
+
+        # runs the hedged reads, each of them borrows a pooled connection
+        self._executor = None
+        if self.hedged_reads and len(self.replicas) != 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=sum(db_handler.pool_size
+                    for db_handler in self.health),
+                thread_name_prefix="hedged-read")
+
+        # metrics of the routing
+        self.fallbacks = 0
+        self.hedged = 0
+        self.hedges_won = 0
+
+    def warm_up(self):
+        """Open all the connections of the replica pools."""
+        for each_replica in self.replicas:
+            each_replica.warm_up()
+
+    def choose(self, exclude=()):
+        """Return the host for the next read, excluding the DBHandlers in
+        'exclude'. The primary host is only chosen when no replica is up,
+        and None is returned if it is excluded as well."""
+        candidates = [db_handler for db_handler in self.replicas
+            if db_handler not in exclude and self.health[db_handler].is_up()]
+        if len(candidates) == 0:
+            if self.primary in exclude:
+                return None
+            if len(self.replicas) != 0:
+                self.fallbacks += 1
+            return self.primary
+        return min(candidates, key=lambda db_handler:
+            (self.health[db_handler].mean_latency *
+                (db_handler.get_metrics()["in_use"] + 1)))
+
+    @contextmanager
+    def cursor(self, db_handler=None, timed=True):
+        """Borrow a connection from the pool of a host, the chosen one by
+        default, and provide a cursor on it. The time spent in the 'with'
+        block is recorded as the latency of the host, unless 'timed' is
+        False as for streamed reads."""
+        db_handler = db_handler or self.choose()
+        health = self.health[db_handler]
+        start = time.monotonic()
+        try:
+            with db_handler.cursor() as db_cur:
+                yield db_cur
+        except host_errors:
+            health.record_failure()
+            raise
+        if timed:
+            health.record_success(time.monotonic() - start)
+
+    def _run_query(self, db_handler, query_fn, *args):
+        """Run query_fn(db_cur, *args) on a host."""
+        with self.cursor(db_handler) as db_cur:
+            return query_fn(db_cur, *args)
+
+    def process_query(self, query_fn, *args):
+        """Run query_fn(db_cur, *args) on the chosen host and return its
+        result, like 'db_handle_process_query'. A read that fails on a
+        replica is retried once on another host. 'query_fn' must only read,
+        as a hedged read may run it on two hosts."""
+        db_handler = self.choose()
+        if self._executor is not None and db_handler is not self.primary:
+            return self._process_hedged(db_handler, query_fn, *args)
+        try:
+            return self._run_query(db_handler, query_fn, *args)
+        except retry_errors:
+            retry_handler = self.choose(exclude=[db_handler])
+            if db_handler is self.primary or retry_handler is None:
+                raise
+            logger.warning(f"Read failed on {db_handler.db_params['host']}, "
+                f"retrying on {retry_handler.db_params['host']}.")
+            return self._run_query(retry_handler, query_fn, *args)
+
+    def _process_hedged(self, db_handler, query_fn, *args):
+        """Run a read on a replica, and on a second replica as well if it is
+        slower than the hedge percentile of the first one. A failed read is
+        retried on another host, the primary host only when no other replica
+        is up. The first successful result is returned, the other query
+        completes in the background."""
+        futures = {self._executor.submit(self._run_query, db_handler,
+            query_fn, *args): db_handler}
+        hedge_delay = self.health[db_handler].percentile(
+            self.hedge_percentile)
+        done, pending = wait(futures, timeout=hedge_delay)
+
+        # hedge a slow read on a second replica, a slow replica is no
+        # reason to load the primary host
+        hedge_handler = None
+        if len(pending) != 0:
+            hedge_handler = self.choose(exclude=[db_handler, self.primary])
+            if hedge_handler is not None:
+                self.hedged += 1
+                futures[self._executor.submit(self._run_query, hedge_handler,
+                    query_fn, *args)] = hedge_handler
+
+        pending = set(futures)
+        error = None
+        while len(pending) != 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for each_future in done:
+                if each_future.exception() is None:
+                    if futures[each_future] is hedge_handler:
+                        self.hedges_won += 1
+                    return each_future.result()
+                error = each_future.exception()
+            # retry a read that failed everywhere once on another host
+            if len(pending) == 0 and len(futures) == 1 and \
+                    isinstance(error, retry_errors):
+                retry_handler = self.choose(exclude=[db_handler])
+                if retry_handler is not None:
+                    logger.warning(f"Read failed on "
+                        f"{db_handler.db_params['host']}, retrying on "
+                        f"{retry_handler.db_params['host']}.")
+                    retry_future = self._executor.submit(self._run_query,
+                        retry_handler, query_fn, *args)
+                    futures[retry_future] = retry_handler
+                    pending = {retry_future}
+        raise error
+
+    def get_metrics(self):
+        """Return the health of the hosts and the routing metrics as a
+        dict()."""
+        return {
+            "hosts": {db_handler.db_params["host"]: {
+                **health.get_metrics(), **db_handler.get_metrics()}
+                for db_handler, health in self.health.items()},
+            "fallbacks": self.fallbacks,
+            "hedged": self.hedged,
+            "hedges_won": self.hedges_won
+        }
+
+
+# The shared router for all the controllers of the program
+_read_router = None
+_read_router_lock = threading.Lock()
+
+
+def get_read_router():
+    """Return the shared ReadRouter object, creating it on first use."""
+    global _read_router
+    if _read_router is None:
+        with _read_router_lock:
+            if _read_router is None:
+                db_params = ConfigHandler().get_params("database")
+                _read_router = ReadRouter(db_params, get_db_handler())
+    return _read_router
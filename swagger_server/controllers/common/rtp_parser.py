@@ -11,20 +11,13 @@ License: None"""
 import struct
 import socket
 import binascii
-import logging
+if __name__ == '__main__':
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.log_handler import get_logger
 
 # Create a logger for this module
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-# Create a file handler for this module
-file_handler = logging.FileHandler('logs/' + __name__ + ".log")
-formatter = logging.Formatter(
-    '%(asctime)s : %(levelname)s : %(name)s : %(message)s')
-file_handler.setFormatter(formatter)
-
-# Add the handler to this logger
-logger.addHandler(file_handler)
+logger = get_logger(__name__)
 
 # A sample RTP packet for testing of the parser
 raw_rtp_packet = b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x08\x00\x45\x00" \
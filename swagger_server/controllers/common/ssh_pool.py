@@ -0,0 +1,319 @@
+"""This module implements a pool of authenticated SSH transports per sniffer
+host.
+
+Fetching a PCAP used to open a new SSH client for every request, paying for
+the TCP connection, the key exchange and the password authentication each
+time. The pool keeps up to 'pool_size' authenticated transports per sniffer
+and multiplexes the exec sessions and SFTP channels of the requests over
+them, at most 'max_sessions' at a time on each transport to stay under the
+'MaxSessions' limit of the SSH server. The transports send keepalives every
+'keepalive_interval' seconds, so that dead connections are noticed while
+idle. A transport that fails or dies is dropped, and replaced by a new one
+on the next request.
+
+The host keys of the sniffers are checked against the system known hosts,
+like 'SSHClient.load_system_host_keys()' does.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import os
+import socket
+import threading
+import time
+
+import paramiko
+
+if __name__ == '__main__':
+    from config_handler import ConfigHandler
+    from errors import SSHPoolExhausted
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.config_handler import ConfigHandler
+    from swagger_server.controllers.common.errors import SSHPoolExhausted
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the 'ssh' section of the configuration file
+default_pool_size = 2
+default_max_sessions = 8
+default_keepalive_interval = 30
+
+# Default SSH port of the sniffers
+default_ssh_port = 22
+
+# Errors of the commands and transfers run over a transport
+transport_errors = (paramiko.SSHException, EOFError, OSError)
+# Errors that break a transport, it is closed and replaced. The SFTP status
+# errors of a file, such as FileNotFoundError for a PCAP rotated away, are
+# OSErrors as well but leave the transport usable.
+broken_transport_errors = (paramiko.SSHException, EOFError, ConnectionError)
+
+# Size of the SFTP reads, the largest paramiko requests, and number of reads
+# kept in flight while a file is streamed
+sftp_chunk_size = 32768
+sftp_read_ahead = 16
+
+
+class PooledTransport():
+    """This class holds a pooled transport along with the number of sessions
+    currently open on it."""
+    def __init__(self, transport):
+        """The class constructor."""
+        self.transport = transport
+        self.sessions = 0
+        self.created = time.monotonic()
+
+    def is_active(self):
+        return self.transport.is_active()
+
+    def close(self):
+        self.transport.close()
+
+
+class SSHSession():
+    """This class runs the commands and transfers of a request over a pooled
+    transport. It is returned by 'SSHPool.session()' and gives its session
+    back to the pool at the end of its 'with' block. An error that breaks
+    the transport closes it."""
+    def __init__(self, ssh_pool, pooled_transport):
+        """The class constructor."""
+        self.ssh_pool = ssh_pool
+        self.pooled_transport = pooled_transport
+        self.transport = pooled_transport.transport
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release(exc_type)
+
+    def release(self, exc_type=None):
+        """Give the session back to the pool, after an error of 'exc_type'
+        if any. This is for sessions used outside of a 'with' block."""
+        broken = exc_type is not None and issubclass(exc_type,
+            broken_transport_errors)
+        self.ssh_pool.release(self.pooled_transport, broken)
+
+    def exec_command(self, command, timeout, channels=None):
+        """Run 'command' in an exec session and return the lines of its
+        standard output. The command times out after 'timeout' seconds
+        overall. The channel of the session is kept in the set 'channels'
+        while the command runs, so that another thread can close it to stop
+        the command."""
+        if timeout <= 0:
+            raise socket.timeout(f"No time left to run a command on "
+                f"{self.ssh_pool.host}.")
+        expires = time.monotonic() + timeout
+        channel = self.transport.open_session(timeout=timeout)
+        if channels is not None:
+            channels.add(channel)
+        try:
+            channel.exec_command(command)
+            stdout = list()
+            while True:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout(f"The command on "
+                        f"{self.ssh_pool.host} timed out after "
+                        f"{timeout:.1f} seconds.")
+                channel.settimeout(remaining)
+                data = channel.recv(sftp_chunk_size)
+                if not data:
+                    break
+                stdout.append(data)
+            return b"".join(stdout).decode().splitlines(keepends=True)
+        finally:
+            if channels is not None:
+                channels.discard(channel)
+            channel.close()
+
+    def open_sftp(self, timeout):
+        """Open an SFTP channel whose operations time out after 'timeout'
+        seconds without data. The caller closes it."""
+        sftp_client = paramiko.SFTPClient.from_transport(self.transport)
+        sftp_client.get_channel().settimeout(timeout)
+        return sftp_client
+
+
+def read_sftp_chunks(remote_file, size):
+    """Generate the chunks of the first 'size' bytes of an open SFTP file.
+    The reads are pipelined, 'sftp_read_ahead' of them are requested ahead
+    of the chunk being returned, so the memory used stays bounded however
+    slowly the chunks are consumed."""
+    window = sftp_chunk_size * sftp_read_ahead
+    for window_start in range(0, size, window):
+        window_end = min(window_start + window, size)
+        yield from remote_file.readv([(offset,
+            min(sftp_chunk_size, window_end - offset))
+            for offset in range(window_start, window_end, sftp_chunk_size)])
+
+
+class SSHPool():
+    """This class implements the pool of transports of a sniffer host.
+
+    'sniffer_params' is the entry of the sniffer in the 'sniffers' section,
+    and 'ssh_params' the 'ssh' section of the configuration file.
+    """
+    def __init__(self, sniffer_params, ssh_params):
+        """The class constructor."""
+        self.host = sniffer_params["host"]
+        self.port = sniffer_params.get("port", default_ssh_port)
+        self.username = sniffer_params["username"]
+        self.password = sniffer_params["password"]
+        self.pool_size = ssh_params.get("pool_size", default_pool_size)
+        self.max_sessions = ssh_params.get("max_sessions",
+            default_max_sessions)
+        self.keepalive_interval = ssh_params.get("keepalive_interval",
+            default_keepalive_interval)
+
+        self._transports = list()
+        # transports being opened, they count against the pool size
+        self._connecting = 0
+        self._condition = threading.Condition()
+
+        # metrics of the pool
+        self.connects = 0
+        self.reuses = 0
+        self.failures = 0
+
+    def _load_host_keys(self):
+        """Load the known host keys of the system, as the SSH client
+        does."""
+        host_keys = paramiko.HostKeys()
+        known_hosts = os.path.expanduser("~/.ssh/known_hosts")
+        if os.path.exists(known_hosts):
+            host_keys.load(known_hosts)
+        return host_keys
+
+    def _connect(self, timeout):
+        """Open and authenticate a new transport to the sniffer, each step
+        timing out after 'timeout' seconds."""
+        sock = socket.create_connection((self.host, self.port), timeout)
+        transport = paramiko.Transport(sock)
+        try:
+            transport.banner_timeout = timeout
+            transport.auth_timeout = timeout
+            transport.start_client(timeout=timeout)
+
+            # reject the hosts that aren't known, like the RejectPolicy
+            server_key = transport.get_remote_server_key()
+            host_name = self.host if self.port == default_ssh_port else \
+                f"[{self.host}]:{self.port}"
+            if not self._load_host_keys().check(host_name, server_key):
+                raise paramiko.SSHException(
+                    f"Server {host_name} not found in known_hosts")
+
+            transport.auth_password(self.username, self.password)
+            transport.set_keepalive(self.keepalive_interval)
+        except BaseException:
+            transport.close()
+            raise
+        logger.info(f"Opened an SSH transport to {self.host}.")
+        return PooledTransport(transport)
+
+    def _prune(self):
+        """Drop the transports that died, the lock must be held."""
+        for each_transport in list(self._transports):
+            if not each_transport.is_active():
+                self._transports.remove(each_transport)
+                each_transport.close()
+                self.failures += 1
+                logger.warning(f"Dropped a dead SSH transport to "
+                    f"{self.host}.")
+
+    def session(self, timeout):
+        """Return an SSHSession on the least busy transport, opening a new
+        transport when all of them are busy and the pool isn't full. Waits
+        up to 'timeout' seconds for a free session when all the transports
+        are at 'max_sessions', then raises SSHPoolExhausted."""
+        expires = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._prune()
+                idle = [each_transport for each_transport in self._transports
+                    if each_transport.sessions < self.max_sessions]
+                least_busy = min(idle, default=None,
+                    key=lambda each_transport: each_transport.sessions)
+                if least_busy is not None and (least_busy.sessions == 0 or
+                        len(self._transports) + self._connecting >=
+                        self.pool_size):
+                    least_busy.sessions += 1
+                    self.reuses += 1
+                    return SSHSession(self, least_busy)
+                if len(self._transports) + self._connecting < self.pool_size:
+                    self._connecting += 1
+                    break
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    raise SSHPoolExhausted(f"No SSH session to {self.host} "
+                        f"was available within {timeout:.1f} seconds.")
+                self._condition.wait(remaining)
+
+        # open the new transport outside of the lock
+        try:
+            pooled_transport = self._connect(max(0, expires -
+                time.monotonic()))
+        except BaseException:
+            with self._condition:
+                self._connecting -= 1
+                self.failures += 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._connecting -= 1
+            pooled_transport.sessions += 1
+            self._transports.append(pooled_transport)
+            self.connects += 1
+        return SSHSession(self, pooled_transport)
+
+    def release(self, pooled_transport, broken=False):
+        """Give a session back to the pool. A broken transport is closed
+        and dropped, its other sessions fail on their own."""
+        with self._condition:
+            pooled_transport.sessions -= 1
+            if broken and pooled_transport in self._transports:
+                self._transports.remove(pooled_transport)
+                pooled_transport.close()
+                self.failures += 1
+                logger.warning(f"Dropped a failed SSH transport to "
+                    f"{self.host}.")
+            self._condition.notify()
+
+    def close(self):
+        """Close all the transports of the pool."""
+        with self._condition:
+            for each_transport in self._transports:
+                each_transport.close()
+            self._transports.clear()
+
+    def get_metrics(self):
+        """Return the state of the pool as a dict()."""
+        with self._condition:
+            return {
+                "transports": len(self._transports),
+                "sessions": sum(each_transport.sessions
+                    for each_transport in self._transports),
+                "connects": self.connects,
+                "reuses": self.reuses,
+                "failures": self.failures
+            }
+
+
+# The shared pools of the sniffer hosts, by host
+_ssh_pools = dict()
+_ssh_pools_lock = threading.Lock()
+
+
+def get_ssh_pool(sniffer_params):
+    """Return the shared SSHPool of a sniffer, creating it on first use."""
+    host = sniffer_params["host"]
+    if host not in _ssh_pools:
+        with _ssh_pools_lock:
+            if host not in _ssh_pools:
+                ssh_params = ConfigHandler().get_params("ssh", {})
+                _ssh_pools[host] = SSHPool(sniffer_params, ssh_params)
+    return _ssh_pools[host]
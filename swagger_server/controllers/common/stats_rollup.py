@@ -0,0 +1,382 @@
+"""This module implements the incremental rollup of call statistics.
+
+A background job reads the CDRs that were added to the 'cdr' table since its
+last run, past a stored CDR-ID high-water mark, and adds them to per-hour and
+per-day aggregates kept in a local SQLite store. The aggregates hold the
+number of calls, answered calls, total and connected duration, and the calls
+per CODEC of each leg, from which the ASR and ACD are computed. Dashboards
+read the aggregates instead of scanning the CDRs.
+
+The aggregates of a batch and the new high-water mark are written in a
+single transaction, so each CDR is counted exactly once.
+
+- The CDRs of ongoing calls are skipped, and their CDR-IDs are kept in the
+  store to be revisited until their call has ended. A call whose end is never
+  written, such as a call of a crashed sniffer, is given up after
+  'max_call_age' seconds.
+- A CDR-ID is only committed once its row is inserted, and a CDR can be
+  committed after another one with a larger CDR-ID. Each run reads the last
+  'trailing_window' CDR-IDs below the high-water mark again, and adds the
+  CDRs it hasn't counted yet. The CDR-IDs counted within that window are kept
+  in the store.
+
+Author: Noor
+Date: October 18, 2026
+License: None
+"""
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+if __name__ == '__main__':
+    from db_handler import in_clause
+    from rtp_parser import codec_lookup
+    from log_handler import get_logger
+else:
+    from swagger_server.controllers.common.db_handler import in_clause
+    from swagger_server.controllers.common.rtp_parser import codec_lookup
+    from swagger_server.controllers.common.log_handler import get_logger
+
+# Setup the logger for this module
+logger = get_logger(__name__)
+
+# Default values for the 'rollup' section of the configuration file
+default_store = "stats.db"
+default_interval = 60
+default_batch_size = 10000
+default_trailing_window = 1000
+default_max_call_age = 86400
+
+# Format of the start of an aggregation period, by granularity
+period_formats = {
+    "hour": "%Y-%m-%dT%H:00:00",
+    "day": "%Y-%m-%dT00:00:00"
+}
+# Format of the bounds of a period range, it compares with all of them
+period_bound_format = "%Y-%m-%dT%H:%M:%S"
+
+# Schema of the local store
+store_schema = [
+    "CREATE TABLE IF NOT EXISTS rollup_state ("
+        "name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS call_stats ("
+        "granularity TEXT NOT NULL, period TEXT NOT NULL, "
+        "calls INTEGER NOT NULL, answered INTEGER NOT NULL, "
+        "duration INTEGER NOT NULL, connect_duration INTEGER NOT NULL, "
+        "PRIMARY KEY (granularity, period))",
+    "CREATE TABLE IF NOT EXISTS codec_stats ("
+        "granularity TEXT NOT NULL, period TEXT NOT NULL, "
+        "leg TEXT NOT NULL, payload_type INTEGER NOT NULL, "
+        "calls INTEGER NOT NULL, "
+        "PRIMARY KEY (granularity, period, leg, payload_type))",
+    # the CDR-IDs counted within the trailing window
+    "CREATE TABLE IF NOT EXISTS rollup_counted ("
+        "cdr_id INTEGER PRIMARY KEY)",
+    # the CDR-IDs of the ongoing calls, since when they were seen ongoing
+    "CREATE TABLE IF NOT EXISTS rollup_ongoing ("
+        "cdr_id INTEGER PRIMARY KEY, first_seen REAL NOT NULL)"
+]
+
+# Columns of the CDRs that are aggregated
+rollup_columns = ("SELECT ID, calldate, callend, duration, "
+    "connect_duration, a_payload, b_payload FROM cdr")
+# Query for the CDRs following the high-water mark, with bound
+# (last_id, batch_size) parameters
+rollup_cdr_query = f"{rollup_columns} WHERE ID>%s ORDER BY ID LIMIT %s"
+# Query for the CDRs of the trailing window, with bound (first_id, last_id)
+# parameters
+rollup_window_query = f"{rollup_columns} WHERE ID>%s AND ID<=%s"
+
+# Statements adding the aggregates of a batch to the store
+call_stats_upsert = ("INSERT INTO call_stats VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (granularity, period) DO UPDATE SET "
+    "calls = calls + excluded.calls, "
+    "answered = answered + excluded.answered, "
+    "duration = duration + excluded.duration, "
+    "connect_duration = connect_duration + excluded.connect_duration")
+codec_stats_upsert = ("INSERT INTO codec_stats VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (granularity, period, leg, payload_type) DO UPDATE SET "
+    "calls = calls + excluded.calls")
+high_water_mark_upsert = ("INSERT INTO rollup_state VALUES "
+    "('high_water_mark', ?) ON CONFLICT (name) DO UPDATE SET "
+    "value = excluded.value")
+
+
+class StatsRollup():
+    """This class implements the rollup job and the queries of its store.
+
+    The job runs every 'interval' seconds on a daemon thread once started.
+    Each run catches up with the 'cdr' table in batches of 'batch_size'
+    CDRs, then counts the calls that ended since and the CDRs committed late
+    in the trailing window. The rollup is 'enabled' when the 'rollup'
+    section is configured, the store isn't opened otherwise.
+    """
+    def __init__(self, rollup_params, db_handler):
+        """The class constructor. 'rollup_params' is the 'rollup' section of
+        the configuration file and 'db_handler' is the connection pool of
+        the CDR database."""
+        self.enabled = bool(rollup_params)
+        self.store = rollup_params.get("store", default_store)
+        self.interval = rollup_params.get("interval", default_interval)
+        self.batch_size = rollup_params.get("batch_size", default_batch_size)
+        self.trailing_window = rollup_params.get("trailing_window",
+            default_trailing_window)
+        self.max_call_age = rollup_params.get("max_call_age",
+            default_max_call_age)
+        self.db_handler = db_handler
+
+        self._store_ready = False
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        # progress of the job
+        self.last_run = None
+        self.rolled_up = 0
+
+    def _connect(self):
+        """Open a connection to the local store, creating its tables on
+        first use. WAL mode lets the API read while the job writes."""
+        store_conn = sqlite3.connect(self.store, timeout=10)
+        if not self._store_ready:
+            store_conn.execute("PRAGMA journal_mode=WAL")
+            for each_statement in store_schema:
+                store_conn.execute(each_statement)
+            # the CDR-IDs counted below the high-water mark of a store from
+            # before the trailing window aren't known
+            store_conn.execute("INSERT OR IGNORE INTO rollup_state "
+                "SELECT 'counted_from', COALESCE(MAX(value), 0) "
+                "FROM rollup_state WHERE name='high_water_mark'")
+            store_conn.commit()
+            self._store_ready = True
+        return store_conn
+
+    def get_state(self, store_conn, name):
+        """Return a CDR-ID of the state of the job, 0 if it isn't set."""
+        row = store_conn.execute("SELECT value FROM rollup_state "
+            "WHERE name=?", (name,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def get_high_water_mark(self, store_conn):
+        """Return the CDR-ID of the last CDR added to the aggregates."""
+        return self.get_state(store_conn, "high_water_mark")
+
+    def aggregate(self, resp_cdr):
+        """Aggregate a batch of CDRs per period. Returns the call and CODEC
+        aggregates as dict()s keyed like the rows of the store, the CDR-IDs
+        of the aggregated CDRs and the CDR-IDs of the ongoing calls, which
+        are skipped."""
+        call_totals = defaultdict(lambda: [0, 0, 0, 0])
+        codec_totals = defaultdict(int)
+        counted_ids = list()
+        ongoing_ids = list()
+        for cdr_id, calldate, callend, duration, connect_duration, \
+                a_payload, b_payload in resp_cdr:
+            # a call that is still ongoing is aggregated on a later run
+            if callend is None:
+                ongoing_ids.append(cdr_id)
+                continue
+            counted_ids.append(cdr_id)
+            for granularity, period_format in period_formats.items():
+                period = calldate.strftime(period_format)
+                totals = call_totals[(granularity, period)]
+                totals[0] += 1
+                if connect_duration is not None:
+                    totals[1] += 1
+                    totals[3] += connect_duration
+                totals[2] += duration or 0
+                for leg, payload_type in [("a", a_payload), ("b", b_payload)]:
+                    if payload_type is not None:
+                        codec_totals[(granularity, period, leg,
+                            payload_type)] += 1
+        return call_totals, codec_totals, counted_ids, ongoing_ids
+
+    def add_cdrs(self, store_conn, resp_cdr, high_water_mark=None):
+        """Add a batch of CDRs to the aggregates, along with the new
+        high-water mark if any, in a single transaction. Returns the number
+        of CDRs that were counted."""
+        call_totals, codec_totals, counted_ids, ongoing_ids = \
+            self.aggregate(resp_cdr)
+        first_seen = time.time()
+        with store_conn:
+            store_conn.executemany(call_stats_upsert,
+                [key + tuple(totals) for key, totals in call_totals.items()])
+            store_conn.executemany(codec_stats_upsert,
+                [key + (calls,) for key, calls in codec_totals.items()])
+            store_conn.executemany("INSERT OR IGNORE INTO rollup_counted "
+                "VALUES (?)", [(cdr_id,) for cdr_id in counted_ids])
+            store_conn.executemany("DELETE FROM rollup_ongoing "
+                "WHERE cdr_id=?", [(cdr_id,) for cdr_id in counted_ids])
+            store_conn.executemany("INSERT OR IGNORE INTO rollup_ongoing "
+                "VALUES (?, ?)", [(cdr_id, first_seen)
+                    for cdr_id in ongoing_ids])
+            if high_water_mark is not None:
+                store_conn.execute(high_water_mark_upsert,
+                    (high_water_mark,))
+        return len(counted_ids)
+
+    def revisit(self, store_conn):
+        """Count the CDRs of the trailing window that weren't counted yet,
+        and the ongoing calls below it that have ended since. Returns the
+        number of CDRs that were counted."""
+        last_id = self.get_high_water_mark(store_conn)
+        window_start = max(self.get_state(store_conn, "counted_from"),
+            last_id - self.trailing_window)
+        counted_ids = set(row[0] for row in store_conn.execute(
+            "SELECT cdr_id FROM rollup_counted WHERE cdr_id>?",
+            (window_start,)))
+        with self.db_handler.cursor() as db_cur:
+            db_cur.execute(rollup_window_query, (window_start, last_id))
+            resp_cdr = [row for row in db_cur.fetchall()
+                if row[0] not in counted_ids]
+        rolled_up = self.add_cdrs(store_conn, resp_cdr)
+
+        ongoing_ids = [row[0] for row in store_conn.execute(
+            "SELECT cdr_id FROM rollup_ongoing WHERE cdr_id<=? "
+            "ORDER BY cdr_id", (window_start,))]
+        for start in range(0, len(ongoing_ids), self.batch_size):
+            placeholders, params = in_clause(
+                ongoing_ids[start:start + self.batch_size])
+            with self.db_handler.cursor() as db_cur:
+                db_cur.execute(f"{rollup_columns} WHERE ID IN "
+                    f"({placeholders})", params)
+                resp_cdr = db_cur.fetchall()
+            rolled_up += self.add_cdrs(store_conn, resp_cdr)
+
+        # forget the CDR-IDs below the window and the abandoned calls
+        with store_conn:
+            store_conn.execute("DELETE FROM rollup_counted WHERE cdr_id<=?",
+                (window_start,))
+            abandoned = store_conn.execute("DELETE FROM rollup_ongoing "
+                "WHERE first_seen<?", (time.time() - self.max_call_age,)
+                ).rowcount
+        if abandoned != 0:
+            logger.warning(f"Gave up on {abandoned} calls that didn't end "
+                f"within {self.max_call_age} seconds.")
+        return rolled_up
+
+    def run_once(self):
+        """Add the CDRs past the high-water mark to the aggregates, then the
+        ones of the trailing window and the ended calls. Returns the number
+        of CDRs that were added."""
+        store_conn = self._connect()
+        rolled_up = 0
+        try:
+            while True:
+                last_id = self.get_high_water_mark(store_conn)
+                with self.db_handler.cursor() as db_cur:
+                    db_cur.execute(rollup_cdr_query,
+                        (last_id, self.batch_size))
+                    resp_cdr = db_cur.fetchall()
+                if len(resp_cdr) == 0:
+                    break
+
+                new_last_id = resp_cdr[-1][0]
+                rolled_up += self.add_cdrs(store_conn, resp_cdr, new_last_id)
+                logger.info(f"Rolled up CDRs up to CDR-ID {new_last_id}.")
+
+                # stop at the end of the table
+                if len(resp_cdr) < self.batch_size:
+                    break
+            rolled_up += self.revisit(store_conn)
+        finally:
+            store_conn.close()
+
+        self.last_run = time.time()
+        self.rolled_up += rolled_up
+        return rolled_up
+
+    def _run(self):
+        """The loop of the job thread."""
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Rollup failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """Start the job on a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                name="stats-rollup", daemon=True)
+            self._thread.start()
+            logger.info(f"Started the rollup job, every {self.interval}s.")
+
+    def stop(self):
+        """Stop the job thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_stats(self, granularity, period_from=None, period_to=None,
+            limit=None):
+        """Return the aggregates of the periods of a granularity starting in
+        [period_from, period_to), ordered by period, as a list of dict()s.
+        The ASR is the ratio of answered calls and the ACD the mean
+        connected duration of the answered calls, in seconds. Nothing is
+        returned when the rollup isn't enabled."""
+        if not self.enabled:
+            return list()
+        conditions = ["granularity=?"]
+        params = [granularity]
+        if period_from is not None:
+            conditions.append("period>=?")
+            params.append(period_from.strftime(period_bound_format))
+        if period_to is not None:
+            conditions.append("period<?")
+            params.append(period_to.strftime(period_bound_format))
+        where_clause = " AND ".join(conditions)
+        limit_clause = f" LIMIT {int(limit)}" if limit is not None else ""
+
+        store_conn = self._connect()
+        try:
+            call_rows = store_conn.execute("SELECT period, calls, answered, "
+                f"duration, connect_duration FROM call_stats "
+                f"WHERE {where_clause} ORDER BY period{limit_clause}",
+                params).fetchall()
+            codec_rows = list()
+            if len(call_rows) != 0:
+                # only the periods that are returned
+                codec_rows = store_conn.execute("SELECT period, leg, "
+                    f"payload_type, calls FROM codec_stats "
+                    f"WHERE {where_clause} AND period<=?",
+                    params + [call_rows[-1][0]]).fetchall()
+        finally:
+            store_conn.close()
+
+        codecs = defaultdict(lambda: {"a": dict(), "b": dict()})
+        for period, leg, payload_type, calls in codec_rows:
+            codec_name = codec_lookup.get(payload_type, str(payload_type))
+            leg_codecs = codecs[period][leg]
+            leg_codecs[codec_name] = leg_codecs.get(codec_name, 0) + calls
+
+        stats = list()
+        for period, calls, answered, duration, connect_duration in call_rows:
+            stats.append({
+                "period": period,
+                "calls": calls,
+                "answered": answered,
+                "asr": answered / calls if calls else 0.0,
+                "acd": connect_duration / answered if answered else 0.0,
+                "duration": duration,
+                "codec_a": codecs[period]["a"],
+                "codec_b": codecs[period]["b"]
+            })
+        return stats
+
+    def get_metrics(self):
+        """Return the progress of the job as a dict()."""
+        if not self.enabled:
+            return {"high_water_mark": 0, "rolled_up": 0, "last_run": None}
+        store_conn = self._connect()
+        try:
+            high_water_mark = self.get_high_water_mark(store_conn)
+        finally:
+            store_conn.close()
+        return {
+            "high_water_mark": high_water_mark,
+            "rolled_up": self.rolled_up,
+            "last_run": self.last_run
+        }
@@ -1,24 +1,326 @@
 
-from flask import Response
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import chain
+from shlex import quote
+
+import connexion
 import paramiko
-import mysql.connector
+from flask import Response
 
 from swagger_server.controllers.common.config_handler import ConfigHandler
+from swagger_server.controllers.common.deadline import Deadline
+from swagger_server.controllers.common.errors import DeadlineExceeded, \
+    SSHPoolExhausted, SnifferLookupError
+from swagger_server.controllers.common.ssh_pool import get_ssh_pool, \
+    transport_errors, read_sftp_chunks
+from swagger_server.controllers.common.pcap_merge import merge_pcaps, \
+    ChunkReader, default_merge_window
+from swagger_server.controllers.common.pcap_cache import get_pcap_cache
+from swagger_server.controllers.common.http_cache import make_etag, \
+    etag_matches, cache_headers
+from swagger_server.controllers.cdr_controller import db_handle_process_query, \
+    cache_max_age
 
-import logging
+from swagger_server.controllers.common.log_handler import get_logger
 
 # Setup logger for this module
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler('logs/' + __name__ + '.log')
-formatter = logging.Formatter(
-    '%(asctime)s : %(levelname)s : %(name)s : %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+logger = get_logger(__name__)
 
 # Setup the config handler for this module
 config_handler = ConfigHandler()
 
+# Request and per-stage timeouts of the PCAP pipeline
+timeout_params = config_handler.get_params("timeouts", {})
+
+# How long the lookup of a PCAP waits for the other sniffers once one of them
+# has it
+merge_params = config_handler.get_params("pcap_merge", {})
+merge_window = merge_params.get("merge_window", default_merge_window)
+
+# The schema for Call Date, Call-ID and the end of the call
+db_query_schema = "cdr_next.calldate, cdr_next.fbasename, cdr.callend"
+# The query to retrieve this information from the database, with the CDR-ID
+# as bound parameter. The server aborts it past the timeout of the database
+# stage, which is filled in as milliseconds, since the socket timeout of the
+# connections is much longer.
+call_info_query = ("SELECT /*+ MAX_EXECUTION_TIME({}) */ "
+    f"{db_query_schema} FROM cdr_next "
+    "JOIN cdr ON cdr.ID = cdr_next.cdr_ID WHERE cdr_next.cdr_ID=%s")
+
+# Errors of a sniffer that fail its PCAP lookup
+probe_errors = transport_errors + (SSHPoolExhausted,)
+# Errors of a sniffer that fail the transfer of a PCAP, a PCAP that is
+# rotated away in the meantime fails with FileNotFoundError
+transfer_errors = transport_errors + (paramiko.SFTPError,)
+
+# Output of the probe of a sniffer, a line of path, size and modification
+# time per file found
+probe_format = "%p %s %T@\\n"
+
+# Default sizes of the thread pools of the sniffers, in the 'ssh' section
+default_probe_workers = 16
+default_fill_workers = 16
+
+# Run the PCAP lookups and the PCAP transfers of the sniffers concurrently.
+# The short lookups have their own threads, so that they never queue behind
+# the transfers of large PCAPs.
+ssh_params = config_handler.get_params("ssh", {})
+probe_executor = ThreadPoolExecutor(ssh_params.get("probe_workers",
+    default_probe_workers), thread_name_prefix="sniffer-probe")
+fill_executor = ThreadPoolExecutor(ssh_params.get("fill_workers",
+    default_fill_workers), thread_name_prefix="sniffer-fill")
+
+# Size of the chunks of the PCAPs sent from the cache
+pcap_chunk_size = 65536
+
+def get_call_info_query(timeout):
+    """Return the call info query, aborted by the server after 'timeout'
+    seconds."""
+    return call_info_query.format(max(1, int(timeout * 1000)))
+
+def fetch_call_info(db_cur, cdr_id, timeout):
+    """Fetch the calldate, Call-ID and callend of a call from the 'cdr_next'
+    and 'cdr' tables, within 'timeout' seconds."""
+    # Run the query to fetch data
+    db_cur.execute(get_call_info_query(timeout), (cdr_id,))
+    # This returns a single row since CDR-ID is unique.
+    return db_cur.fetchall()
+
+def get_pcap_paths(call_id, call_date, spool_dir):
+    """Return the PCAP filename of a call and the SIP and RTP directories
+    that hold it in the spool directory of a sniffer."""
+    # Day, Month, Hour and Minute need to be 0 filled 2 digit numbers
+    pcap_filename = call_id + ".pcap"
+    pcap_dir = f"{spool_dir}/{call_date.year}-{call_date.month:02d}-{call_date.day:02d}/{call_date.hour:02d}/{call_date.minute:02d}"
+    sip_dir = pcap_dir + "/SIP/"
+    rtp_dir = pcap_dir + "/RTP/"
+    return pcap_filename, sip_dir, rtp_dir
+
+def get_pcap_cache_headers(cdr_id, call_id, call_date, callend, disable_rtp):
+    """Return the caching headers of the PCAP of a call. The PCAP of a
+    finished call never changes, so its ETag is derived from the database
+    alone and can be checked without contacting the sniffer. The PCAP of an
+    ongoing call has no ETag."""
+    if callend is None:
+        return cache_headers(None, False)
+    etag = make_etag("pcap", cdr_id, call_id, call_date, callend,
+        "sip" if disable_rtp else "sip+rtp")
+    return cache_headers(etag, True, cache_max_age)
+
+def parse_probe_output(lines, sniffer_params, pcap_filename, sip_dir,
+        rtp_dir):
+    """Return the PCAPs of a call found by the probe of a sniffer, as a
+    dict() of kind, 'sip' or 'rtp' => (remote path, (size, modification
+    time)). Return None if the sniffer doesn't have the SIP PCAP."""
+    found = dict()
+    for each_line in lines:
+        path, size, mtime = each_line.rstrip("\n").rsplit(" ", 2)
+        found[path] = (int(size), mtime)
+    pcap_files = dict()
+    for kind, pcap_dir in [("sip", sip_dir), ("rtp", rtp_dir)]:
+        if pcap_dir + pcap_filename in found:
+            pcap_files[kind] = (pcap_dir + pcap_filename,
+                found[pcap_dir + pcap_filename])
+    if "rtp" in pcap_files:
+        logger.info(f"RTP of {pcap_filename} found on "
+            f"{sniffer_params['host']}.")
+    else:
+        logger.info(f"No RTP for this CDR-ID on {sniffer_params['host']}!")
+    if "sip" not in pcap_files:
+        return None
+    return pcap_files
+
+def get_sniffer_hosts(found):
+    """Return the hosts of the sniffers that have the PCAP of a call, for
+    the log messages."""
+    return ", ".join(sniffer_params["host"]
+        for sniffer_params, pcap_files in found)
+
+def get_remote_pcaps(found, disable_rtp):
+    """Return the (sniffer params, remote path, PCAP stat) of the PCAPs to
+    merge for a call, from the sniffers that have it. These are its SIP and
+    RTP PCAPs, or its SIP PCAPs only with 'disable_rtp'."""
+    kinds = ["sip"] if disable_rtp else ["sip", "rtp"]
+    return [(sniffer_params, *pcap_files[kind])
+        for sniffer_params, pcap_files in found
+        for kind in kinds if kind in pcap_files]
+
+def get_pcap_signature(remote_pcaps):
+    """Return the signature of the remote PCAPs of a call, which changes
+    when any of them changes."""
+    return tuple(sorted((sniffer_params["host"], remote_path, pcap_stat)
+        for sniffer_params, remote_path, pcap_stat in remote_pcaps))
+
+def probe_sniffer_pcap(sniffer_params, pcap_filename, sip_dir, rtp_dir,
+        connect_timeout, deadline, channels):
+    """Look for the PCAPs of a call on a sniffer over a pooled transport, and
+    return them as 'parse_probe_output()' does. The probe ends with the
+    listing stage of 'deadline', its channel is kept in 'channels' so that
+    the lookup can close it once it is over."""
+    with get_ssh_pool(sniffer_params).session(connect_timeout) as ssh_session:
+        ssh_command = (f"find {quote(sip_dir)} {quote(rtp_dir)} -maxdepth 1 "
+            f"-name {quote(pcap_filename)} -printf {quote(probe_format)}")
+        stdout_str = ssh_session.exec_command(ssh_command,
+            deadline.stage_remaining(), channels)
+    return parse_probe_output(stdout_str, sniffer_params, pcap_filename,
+        sip_dir, rtp_dir)
+
+def find_sniffer_pcaps(sniffers, call_id, call_date, deadline):
+    """Probe all the sniffers concurrently for the PCAPs of a call, and return
+    the (sniffer params, PCAPs found) of the sniffers that have it. The
+    lookup ends 'merge_window' seconds after the first sniffer that has the
+    call answers, the probes still running are cancelled and their
+    channels closed. Raises SnifferLookupError if no sniffer has it and some
+    of them failed."""
+    with deadline.stage("listing") as timeout:
+        connect_timeout = min(timeout, deadline.timeouts["ssh_connect"])
+        # the channels of the running probes
+        channels = set()
+        probes = dict()
+        for each_sniffer in sniffers:
+            pcap_filename, sip_dir, rtp_dir = get_pcap_paths(call_id,
+                call_date, each_sniffer["spool_dir"])
+            probes[probe_executor.submit(probe_sniffer_pcap, each_sniffer,
+                pcap_filename, sip_dir, rtp_dir, connect_timeout, deadline,
+                channels)] = each_sniffer
+
+        expires = time.monotonic() + timeout
+        found = list()
+        failures = 0
+        pending = set(probes)
+        try:
+            while len(pending) != 0:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining,
+                    return_when=FIRST_COMPLETED)
+                for each_probe in done:
+                    each_sniffer = probes[each_probe]
+                    try:
+                        pcap_files = each_probe.result()
+                        if pcap_files is not None:
+                            found.append((each_sniffer, pcap_files))
+                    except probe_errors as e:
+                        failures += 1
+                        logger.error(f"PCAP lookup on {each_sniffer['host']} "
+                            f"failed: {e}")
+                # wait a little for the other parts of the call, if any
+                if len(found) != 0:
+                    expires = min(expires, time.monotonic() +
+                        merge_window)
+        finally:
+            # a running probe can't be cancelled, closing its channel ends
+            # its command
+            for each_probe in pending:
+                each_probe.cancel()
+            for each_channel in channels.copy():
+                each_channel.close()
+
+        if len(found) == 0 and len(pending) != 0:
+            raise TimeoutError("No sniffer answered the PCAP lookup.")
+    if len(found) == 0 and failures != 0:
+        raise SnifferLookupError(f"The PCAP lookup failed on {failures} of "
+            f"{len(sniffers)} sniffers.")
+    return found
+
+def open_sniffer_pcap(sniffer_params, remote_path, timeout):
+    """Open a PCAP on a sniffer over a pooled transport. Return the
+    SSHSession, the SFTP client and the remote file, which are closed with
+    'close_sniffer_pcaps()', and the size of the PCAP."""
+    ssh_session = get_ssh_pool(sniffer_params).session(timeout)
+    try:
+        sftp_client = ssh_session.open_sftp(timeout)
+        try:
+            remote_file = sftp_client.open(remote_path, "rb")
+            size = remote_file.stat().st_size
+        except BaseException:
+            sftp_client.close()
+            raise
+    except BaseException as e:
+        ssh_session.release(type(e))
+        raise
+    return ssh_session, sftp_client, remote_file, size
+
+def close_sniffer_pcaps(opened, exc_type=None):
+    """Close the PCAPs opened with 'open_sniffer_pcap()', after an error of
+    'exc_type' if any."""
+    for ssh_session, sftp_client, remote_file, size in opened:
+        remote_file.close()
+        sftp_client.close()
+        ssh_session.release(exc_type)
+
+def get_opened_hosts(opened):
+    """Return the hosts of the PCAPs opened with 'open_sniffer_pcap()', for
+    the log messages."""
+    return ", ".join(ssh_session.ssh_pool.host
+        for ssh_session, sftp_client, remote_file, size in opened)
+
+def fill_sniffer_pcaps(opened, cache_fill):
+    """Write the PCAP of a call into the PCAP cache as it is read from the
+    sniffers, and commit it once complete. Several PCAPs are merged on the
+    fly by packet timestamp. This runs in 'fill_executor' apart from the
+    requests, so the transfer goes at the pace of the sniffers whatever the
+    pace of their clients, and the reads time out with the transfer
+    stage."""
+    exc_type = None
+    try:
+        if len(opened) == 1:
+            ssh_session, sftp_client, remote_file, size = opened[0]
+            chunks = read_sftp_chunks(remote_file, size)
+        else:
+            chunks = merge_pcaps([ChunkReader(read_sftp_chunks(remote_file,
+                size)) for ssh_session, sftp_client, remote_file, size
+                in opened])
+        for chunk in chunks:
+            cache_fill.write(chunk)
+        cache_fill.commit()
+    except BaseException as e:
+        exc_type = type(e)
+        cache_fill.abort(e)
+        if isinstance(e, Exception):
+            logger.error(f"Fetching {cache_fill.name} from "
+                f"{get_opened_hosts(opened)} failed: {e}")
+    finally:
+        close_sniffer_pcaps(opened, exc_type)
+
+def iter_pcap_file(pcap_file):
+    """Generate the chunks of an open PCAP, and close it."""
+    with pcap_file:
+        while True:
+            chunk = pcap_file.read(pcap_chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def open_call_pcap(remote_pcaps, cache_name, timeout):
+    """Return the chunks of the PCAP of a call, from the PCAP cache or from
+    its transfer into the cache. A missing PCAP is transferred from the
+    sniffers in the background, and read as it is written by all the
+    requests for it. The first chunk is read here, so that the errors of
+    the sniffers and of the merge are raised before the response starts."""
+    pcap_cache = get_pcap_cache()
+    signature = get_pcap_signature(remote_pcaps)
+    pcap_file, cache_fill, new_fill = pcap_cache.begin(cache_name, signature)
+    if pcap_file is not None:
+        return iter_pcap_file(pcap_file)
+
+    if new_fill is not None:
+        opened = list()
+        try:
+            for sniffer_params, remote_path, pcap_stat in remote_pcaps:
+                opened.append(open_sniffer_pcap(sniffer_params, remote_path,
+                    timeout))
+            fill_executor.submit(fill_sniffer_pcaps, opened, new_fill)
+        except BaseException as e:
+            close_sniffer_pcaps(opened, type(e))
+            new_fill.abort(e)
+            raise
+        cache_fill = new_fill
+    pcap_chunks = cache_fill.stream(timeout)
+    return chain([next(pcap_chunks, b"")], pcap_chunks)
+
 def pcap_get(cdr_id, disable_rtp=None):  # noqa: E501
     """Return a PCAP with SIP and RTP of call given CDR ID.
 
@@ -31,25 +333,16 @@ def pcap_get(cdr_id, disable_rtp=None):  # noqa: E501
 
     :rtype: Object
     """
-    db_params = config_handler.get_params("database")
+    deadline = Deadline(timeout_params)
+
     # need to determine the call-id and calldate of the call, from the CDR DB
-    db_conn = mysql.connector.connect(
-        user=db_params["username"],
-        password=db_params["password"],
-        host=db_params["host"],
-        database=db_params["database"]
-    )
-    db_cur = db_conn.cursor()
-    # The schema for Call Date and Call-ID
-    db_query_schema = "calldate, fbasename"
-    # The query to retrieve this information from the database
-    db_query_cdr_next = (
-        f"SELECT {db_query_schema} FROM cdr_next WHERE cdr_ID={cdr_id}"
-    )
-    # Run the query to fetch data
-    db_cur.execute(db_query_cdr_next)
-    # This returns a single row since CDR-ID is unique.
-    db_query_resp = db_cur.fetchall()
+    try:
+        with deadline.stage("database") as timeout:
+            db_query_resp = db_handle_process_query(fetch_call_info, cdr_id,
+                timeout)
+    except DeadlineExceeded as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id}: {e}")
+        return connexion.problem(504, "Gateway Timeout", str(e))
     # if there is no CDR entry, return nothing
     # TODO: improve this with a better response
     if db_query_resp is None or len(db_query_resp) == 0:
@@ -59,51 +352,57 @@ def pcap_get(cdr_id, disable_rtp=None):  # noqa: E501
 
     call_date = db_query_resp[0][0]
     call_id = db_query_resp[0][1]
+    callend = db_query_resp[0][2]
     logger.info(f"Calldate: {call_date}, Call-ID: {call_id}")
-    
-    # TODO: update the backend to process multiple sniffers
-    sniffer_params = config_handler.get_params("sniffers")[0]
-    sniffer_ip = sniffer_params["host"]
-    username = sniffer_params["username"]
-    password = sniffer_params["password"]
-    spool_dir = sniffer_params["spool_dir"]
 
+    # the client already has this PCAP, don't fetch it from the sniffer
+    pcap_headers = get_pcap_cache_headers(cdr_id, call_id, call_date, callend,
+        disable_rtp)
+    if etag_matches(pcap_headers.get("ETag"),
+            connexion.request.headers.get("If-None-Match")):
+        logger.info(f"PCAP of CDR-ID {cdr_id} not modified.")
+        return Response(None, 304, pcap_headers)
+    
     # FETCH THE PCAP FROM THE SNIFFER(S) USING THE CALLDATE INFORMATION
-    # Day, Month, Hour and Minute need to be 0 filled 2 digit numbers
     pcap_filename = call_id + ".pcap"
-    pcap_dir = f"{spool_dir}/{call_date.year}-{call_date.month:02d}-{call_date.day:02d}/{call_date.hour:02d}/{call_date.minute:02d}"
-    sip_dir = pcap_dir + "/SIP/"
-    rtp_dir = pcap_dir + "/RTP/"
-
-    ssh_command = f"ls -l {rtp_dir} | grep {pcap_filename}"
-    ssh_client = paramiko.SSHClient()
-    ssh_client.load_system_host_keys()
-    ssh_client.connect(sniffer_ip, 22, username, password)
-    stdin, stdout, stderr = ssh_client.exec_command(ssh_command)
-    
-    # DETERMINE IF RTP WAS FOUND FOR THIS CALL
-    stdout_str = stdout.readlines()
-    if len(stdout_str) != 0:
-        logger.info("REMOTE COMMAND OUTPUT:")
-        for each_line in stdout.readlines():
-            logger.info(each_line)
-    else:
-        logger.info("No RTP for this CDR-ID!")
-
-    # RETRIEVE THE SIP PCAP
-    sftp_client = ssh_client.open_sftp()
-    sftp_client.get(sip_dir + pcap_filename, localpath=f"pcap/{pcap_filename}")
-    sftp_client.close()
-
-    # CLEANUP THE SSH CHANNELS
-    stdin.close()
-    stdout.close()
-    stderr.close()
-
-    pcap_data = b''
-    with open(f'pcap/{pcap_filename}', 'rb') as f:
-        pcap_data = f.read()
+    # the SIP only PCAP is cached apart from the merged one
+    cache_name = call_id + ".sip.pcap" if disable_rtp else pcap_filename
+    sniffer_hosts = None
+    # the errors of a transfer by another request are raised by the wait for
+    # it as well
+    try:
+        found = find_sniffer_pcaps(config_handler.get_params("sniffers"),
+            call_id, call_date, deadline)
+        if len(found) == 0:
+            logger.error(f"PCAP of CDR-ID {cdr_id} not found on any sniffer.")
+            return connexion.problem(404, "Not Found",
+                f"The PCAP of CDR-ID {cdr_id} wasn't found on any sniffer.")
+        sniffer_hosts = get_sniffer_hosts(found)
+        # served from the PCAP cache, or streamed from the sniffers into it
+        with deadline.stage("transfer") as timeout:
+            pcap_chunks = open_call_pcap(get_remote_pcaps(found,
+                disable_rtp), cache_name, timeout)
+    except DeadlineExceeded as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id} from {sniffer_hosts}: {e}")
+        return connexion.problem(504, "Gateway Timeout", str(e))
+    except SnifferLookupError as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id}: {e}")
+        return connexion.problem(502, "Bad Gateway", str(e))
+    except SSHPoolExhausted as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id} from {sniffer_hosts}: {e}")
+        return connexion.problem(503, "Service Unavailable", str(e))
+    except ValueError as e:
+        logger.error(f"PCAP of CDR-ID {cdr_id} from {sniffer_hosts} can't "
+            f"be merged: {e}")
+        return connexion.problem(502, "Bad Gateway", str(e))
+    except transfer_errors as e:
+        logger.error(f"Transfer of the PCAP of CDR-ID {cdr_id} from "
+            f"{sniffer_hosts} failed: {e}")
+        return connexion.problem(502, "Bad Gateway",
+            f"The transfer of the PCAP of CDR-ID {cdr_id} from "
+            f"{sniffer_hosts} failed: {e}")
 
-    resp = Response(pcap_data, 200, {
-        'Content-Disposition': f'attachment;filename="{pcap_filename}";'})
+    resp = Response(pcap_chunks, 200, {
+        'Content-Disposition': f'attachment;filename="{pcap_filename}";',
+        **pcap_headers}, mimetype="application/octet-stream")
     return resp
\ No newline at end of file
@@ -0,0 +1,62 @@
+import connexion
+
+from swagger_server.models.stats_entry import StatsEntry  # noqa: E501
+from swagger_server.models.stats_list import StatsList  # noqa: E501
+from swagger_server.controllers.common.config_handler import ConfigHandler
+from swagger_server.controllers.common.db_handler import get_db_handler
+from swagger_server.controllers.common.stats_rollup import StatsRollup
+from swagger_server.controllers.cdr_controller import parse_calldate_filter, \
+    max_page_size
+
+from swagger_server.controllers.common.log_handler import get_logger
+
+# Configuration handler for this module
+config_handler = ConfigHandler()
+
+# Logger setup for this module
+logger = get_logger(__name__)
+
+# The rollup job is only run when the 'rollup' section is configured
+rollup_params = config_handler.get_params("rollup", {})
+
+# Rollup of the CDRs into per-hour and per-day aggregates
+stats_rollup = StatsRollup(rollup_params, get_db_handler())
+
+def rollup_init():
+    """Start the rollup job if it is configured. This is called once at
+    startup."""
+    if stats_rollup.enabled:
+        stats_rollup.start()
+
+
+def stats_get(granularity=None, period_from=None, period_to=None):  # noqa: E501
+    """Return aggregated call statistics.
+
+    This endpoint returns the number of calls, the ASR, the ACD, the total duration and the calls per CODEC of each hour or day, from aggregates that are maintained incrementally from the CDRs. # noqa: E501
+
+    :param granularity: The aggregation period, &#x27;hour&#x27; or &#x27;day&#x27;.
+    :type granularity: str
+    :param period_from: Start of the range of periods (inclusive) in ISO 8601 format.
+    :type period_from: str
+    :param period_to: End of the range of periods (exclusive) in ISO 8601 format.
+    :type period_to: str
+
+    :rtype: StatsList
+    """
+    try:
+        if period_from is not None:
+            period_from = parse_calldate_filter("period_from", period_from)
+        if period_to is not None:
+            period_to = parse_calldate_filter("period_to", period_to)
+    except ValueError as e:
+        return connexion.problem(400, "Bad Request", str(e))
+
+    stats = stats_rollup.get_stats(granularity or "hour", period_from,
+        period_to, max_page_size)
+
+    return_stats_list = StatsList()
+    return_stats_list.stats = [StatsEntry(**each_entry)
+        for each_entry in stats]
+    return_stats_list.high_water_mark = \
+        stats_rollup.get_metrics()["high_water_mark"]
+    return return_stats_list
@@ -4,4 +4,7 @@
 from __future__ import absolute_import
 # import models into model package
 from swagger_server.models.cdr import CDR
+from swagger_server.models.cdr_batch_request import CDRBatchRequest
 from swagger_server.models.cdr_list import CDRList
+from swagger_server.models.stats_entry import StatsEntry
+from swagger_server.models.stats_list import StatsList
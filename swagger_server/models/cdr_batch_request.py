@@ -0,0 +1,66 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+from datetime import date, datetime  # noqa: F401
+
+from typing import List, Dict  # noqa: F401
+
+from swagger_server.models.base_model_ import Model
+from swagger_server import util
+
+
+class CDRBatchRequest(Model):
+    """NOTE: This class is auto generated by the swagger code generator program.
+
+    Do not edit the class manually.
+    """
+    def __init__(self, cdr_ids: List[int]=None):  # noqa: E501
+        """CDRBatchRequest - a model defined in Swagger
+
+        :param cdr_ids: The cdr_ids of this CDRBatchRequest.  # noqa: E501
+        :type cdr_ids: List[int]
+        """
+        self.swagger_types = {
+            'cdr_ids': List[int]
+        }
+
+        self.attribute_map = {
+            'cdr_ids': 'cdrIds'
+        }
+        self._cdr_ids = cdr_ids
+
+    @classmethod
+    def from_dict(cls, dikt) -> 'CDRBatchRequest':
+        """Returns the dict as a model
+
+        :param dikt: A dict.
+        :type: dict
+        :return: The CDRBatchRequest of this CDRBatchRequest.  # noqa: E501
+        :rtype: CDRBatchRequest
+        """
+        return util.deserialize_model(dikt, cls)
+
+    @property
+    def cdr_ids(self) -> List[int]:
+        """Gets the cdr_ids of this CDRBatchRequest.
+
+        The CDR-IDs of the CDRs to retrieve.  # noqa: E501
+
+        :return: The cdr_ids of this CDRBatchRequest.
+        :rtype: List[int]
+        """
+        return self._cdr_ids
+
+    @cdr_ids.setter
+    def cdr_ids(self, cdr_ids: List[int]):
+        """Sets the cdr_ids of this CDRBatchRequest.
+
+        The CDR-IDs of the CDRs to retrieve.  # noqa: E501
+
+        :param cdr_ids: The cdr_ids of this CDRBatchRequest.
+        :type cdr_ids: List[int]
+        """
+        if cdr_ids is None:
+            raise ValueError("Invalid value for `cdr_ids`, must not be `None`")  # noqa: E501
+
+        self._cdr_ids = cdr_ids
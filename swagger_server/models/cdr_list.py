@@ -15,20 +15,30 @@ class CDRList(Model):
 
     Do not edit the class manually.
     """
-    def __init__(self, cdr: List[CDR]=None):  # noqa: E501
+    def __init__(self, cdr: List[CDR]=None, next_cursor: str=None, missing: List[int]=None):  # noqa: E501
         """CDRList - a model defined in Swagger
 
         :param cdr: The cdr of this CDRList.  # noqa: E501
         :type cdr: List[CDR]
+        :param next_cursor: The next_cursor of this CDRList.  # noqa: E501
+        :type next_cursor: str
+        :param missing: The missing of this CDRList.  # noqa: E501
+        :type missing: List[int]
         """
         self.swagger_types = {
-            'cdr': List[CDR]
+            'cdr': List[CDR],
+            'next_cursor': str,
+            'missing': List[int]
         }
 
         self.attribute_map = {
-            'cdr': 'cdr'
+            'cdr': 'cdr',
+            'next_cursor': 'next_cursor',
+            'missing': 'missing'
         }
         self._cdr = cdr
+        self._next_cursor = next_cursor
+        self._missing = missing
 
     @classmethod
     def from_dict(cls, dikt) -> 'CDRList':
@@ -63,3 +73,51 @@ class CDRList(Model):
         """
 
         self._cdr = cdr
+
+    @property
+    def next_cursor(self) -> str:
+        """Gets the next_cursor of this CDRList.
+
+        Opaque cursor to pass as 'cursor' to retrieve the next page of CDRs. It is not set on the last page.  # noqa: E501
+
+        :return: The next_cursor of this CDRList.
+        :rtype: str
+        """
+        return self._next_cursor
+
+    @next_cursor.setter
+    def next_cursor(self, next_cursor: str):
+        """Sets the next_cursor of this CDRList.
+
+        Opaque cursor to pass as 'cursor' to retrieve the next page of CDRs. It is not set on the last page.  # noqa: E501
+
+        :param next_cursor: The next_cursor of this CDRList.
+        :type next_cursor: str
+        :param missing: The missing of this CDRList.  # noqa: E501
+        :type missing: List[int]
+        """
+
+        self._next_cursor = next_cursor
+
+    @property
+    def missing(self) -> List[int]:
+        """Gets the missing of this CDRList.
+
+        The requested CDR-IDs that don't exist. It is only set on batch lookups.  # noqa: E501
+
+        :return: The missing of this CDRList.
+        :rtype: List[int]
+        """
+        return self._missing
+
+    @missing.setter
+    def missing(self, missing: List[int]):
+        """Sets the missing of this CDRList.
+
+        The requested CDR-IDs that don't exist. It is only set on batch lookups.  # noqa: E501
+
+        :param missing: The missing of this CDRList.
+        :type missing: List[int]
+        """
+
+        self._missing = missing
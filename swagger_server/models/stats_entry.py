@@ -0,0 +1,260 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+from datetime import date, datetime  # noqa: F401
+
+from typing import List, Dict  # noqa: F401
+
+from swagger_server.models.base_model_ import Model
+from swagger_server import util
+
+
+class StatsEntry(Model):
+    """NOTE: This class is auto generated by the swagger code generator program.
+
+    Do not edit the class manually.
+    """
+    def __init__(self, period: str=None, calls: int=None, answered: int=None, asr: float=None, acd: float=None, duration: int=None, codec_a: Dict[str, int]=None, codec_b: Dict[str, int]=None):  # noqa: E501
+        """StatsEntry - a model defined in Swagger
+
+        :param period: The period of this StatsEntry.  # noqa: E501
+        :type period: str
+        :param calls: The calls of this StatsEntry.  # noqa: E501
+        :type calls: int
+        :param answered: The answered of this StatsEntry.  # noqa: E501
+        :type answered: int
+        :param asr: The asr of this StatsEntry.  # noqa: E501
+        :type asr: float
+        :param acd: The acd of this StatsEntry.  # noqa: E501
+        :type acd: float
+        :param duration: The duration of this StatsEntry.  # noqa: E501
+        :type duration: int
+        :param codec_a: The codec_a of this StatsEntry.  # noqa: E501
+        :type codec_a: Dict[str, int]
+        :param codec_b: The codec_b of this StatsEntry.  # noqa: E501
+        :type codec_b: Dict[str, int]
+        """
+        self.swagger_types = {
+            'period': str,
+            'calls': int,
+            'answered': int,
+            'asr': float,
+            'acd': float,
+            'duration': int,
+            'codec_a': Dict[str, int],
+            'codec_b': Dict[str, int]
+        }
+
+        self.attribute_map = {
+            'period': 'period',
+            'calls': 'calls',
+            'answered': 'answered',
+            'asr': 'asr',
+            'acd': 'acd',
+            'duration': 'duration',
+            'codec_a': 'codec_a',
+            'codec_b': 'codec_b'
+        }
+        self._period = period
+        self._calls = calls
+        self._answered = answered
+        self._asr = asr
+        self._acd = acd
+        self._duration = duration
+        self._codec_a = codec_a
+        self._codec_b = codec_b
+
+    @classmethod
+    def from_dict(cls, dikt) -> 'StatsEntry':
+        """Returns the dict as a model
+
+        :param dikt: A dict.
+        :type: dict
+        :return: The StatsEntry of this StatsEntry.  # noqa: E501
+        :rtype: StatsEntry
+        """
+        return util.deserialize_model(dikt, cls)
+
+    @property
+    def period(self) -> str:
+        """Gets the period of this StatsEntry.
+
+        Start of the aggregation period in ISO 8601 format, in the timezone of the calldate of the CDRs.  # noqa: E501
+
+        :return: The period of this StatsEntry.
+        :rtype: str
+        """
+        return self._period
+
+    @period.setter
+    def period(self, period: str):
+        """Sets the period of this StatsEntry.
+
+        Start of the aggregation period in ISO 8601 format, in the timezone of the calldate of the CDRs.  # noqa: E501
+
+        :param period: The period of this StatsEntry.
+        :type period: str
+        """
+
+        self._period = period
+
+    @property
+    def calls(self) -> int:
+        """Gets the calls of this StatsEntry.
+
+        Number of calls that started in the period.  # noqa: E501
+
+        :return: The calls of this StatsEntry.
+        :rtype: int
+        """
+        return self._calls
+
+    @calls.setter
+    def calls(self, calls: int):
+        """Sets the calls of this StatsEntry.
+
+        Number of calls that started in the period.  # noqa: E501
+
+        :param calls: The calls of this StatsEntry.
+        :type calls: int
+        """
+
+        self._calls = calls
+
+    @property
+    def answered(self) -> int:
+        """Gets the answered of this StatsEntry.
+
+        Number of calls that were answered.  # noqa: E501
+
+        :return: The answered of this StatsEntry.
+        :rtype: int
+        """
+        return self._answered
+
+    @answered.setter
+    def answered(self, answered: int):
+        """Sets the answered of this StatsEntry.
+
+        Number of calls that were answered.  # noqa: E501
+
+        :param answered: The answered of this StatsEntry.
+        :type answered: int
+        """
+
+        self._answered = answered
+
+    @property
+    def asr(self) -> float:
+        """Gets the asr of this StatsEntry.
+
+        Answer Seizure Ratio, the ratio of answered calls to all calls.  # noqa: E501
+
+        :return: The asr of this StatsEntry.
+        :rtype: float
+        """
+        return self._asr
+
+    @asr.setter
+    def asr(self, asr: float):
+        """Sets the asr of this StatsEntry.
+
+        Answer Seizure Ratio, the ratio of answered calls to all calls.  # noqa: E501
+
+        :param asr: The asr of this StatsEntry.
+        :type asr: float
+        """
+
+        self._asr = asr
+
+    @property
+    def acd(self) -> float:
+        """Gets the acd of this StatsEntry.
+
+        Average Call Duration, the mean connected duration of the answered calls in seconds.  # noqa: E501
+
+        :return: The acd of this StatsEntry.
+        :rtype: float
+        """
+        return self._acd
+
+    @acd.setter
+    def acd(self, acd: float):
+        """Sets the acd of this StatsEntry.
+
+        Average Call Duration, the mean connected duration of the answered calls in seconds.  # noqa: E501
+
+        :param acd: The acd of this StatsEntry.
+        :type acd: float
+        """
+
+        self._acd = acd
+
+    @property
+    def duration(self) -> int:
+        """Gets the duration of this StatsEntry.
+
+        Total duration of the calls in seconds.  # noqa: E501
+
+        :return: The duration of this StatsEntry.
+        :rtype: int
+        """
+        return self._duration
+
+    @duration.setter
+    def duration(self, duration: int):
+        """Sets the duration of this StatsEntry.
+
+        Total duration of the calls in seconds.  # noqa: E501
+
+        :param duration: The duration of this StatsEntry.
+        :type duration: int
+        """
+
+        self._duration = duration
+
+    @property
+    def codec_a(self) -> Dict[str, int]:
+        """Gets the codec_a of this StatsEntry.
+
+        Number of calls per CODEC of the caller RTP stream.  # noqa: E501
+
+        :return: The codec_a of this StatsEntry.
+        :rtype: Dict[str, int]
+        """
+        return self._codec_a
+
+    @codec_a.setter
+    def codec_a(self, codec_a: Dict[str, int]):
+        """Sets the codec_a of this StatsEntry.
+
+        Number of calls per CODEC of the caller RTP stream.  # noqa: E501
+
+        :param codec_a: The codec_a of this StatsEntry.
+        :type codec_a: Dict[str, int]
+        """
+
+        self._codec_a = codec_a
+
+    @property
+    def codec_b(self) -> Dict[str, int]:
+        """Gets the codec_b of this StatsEntry.
+
+        Number of calls per CODEC of the callee RTP stream.  # noqa: E501
+
+        :return: The codec_b of this StatsEntry.
+        :rtype: Dict[str, int]
+        """
+        return self._codec_b
+
+    @codec_b.setter
+    def codec_b(self, codec_b: Dict[str, int]):
+        """Sets the codec_b of this StatsEntry.
+
+        Number of calls per CODEC of the callee RTP stream.  # noqa: E501
+
+        :param codec_b: The codec_b of this StatsEntry.
+        :type codec_b: Dict[str, int]
+        """
+
+        self._codec_b = codec_b
@@ -0,0 +1,93 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+from datetime import date, datetime  # noqa: F401
+
+from typing import List, Dict  # noqa: F401
+
+from swagger_server.models.base_model_ import Model
+from swagger_server.models.stats_entry import StatsEntry  # noqa: F401,E501
+from swagger_server import util
+
+
+class StatsList(Model):
+    """NOTE: This class is auto generated by the swagger code generator program.
+
+    Do not edit the class manually.
+    """
+    def __init__(self, stats: List[StatsEntry]=None, high_water_mark: int=None):  # noqa: E501
+        """StatsList - a model defined in Swagger
+
+        :param stats: The stats of this StatsList.  # noqa: E501
+        :type stats: List[StatsEntry]
+        :param high_water_mark: The high_water_mark of this StatsList.  # noqa: E501
+        :type high_water_mark: int
+        """
+        self.swagger_types = {
+            'stats': List[StatsEntry],
+            'high_water_mark': int
+        }
+
+        self.attribute_map = {
+            'stats': 'stats',
+            'high_water_mark': 'high_water_mark'
+        }
+        self._stats = stats
+        self._high_water_mark = high_water_mark
+
+    @classmethod
+    def from_dict(cls, dikt) -> 'StatsList':
+        """Returns the dict as a model
+
+        :param dikt: A dict.
+        :type: dict
+        :return: The StatsList of this StatsList.  # noqa: E501
+        :rtype: StatsList
+        """
+        return util.deserialize_model(dikt, cls)
+
+    @property
+    def stats(self) -> List[StatsEntry]:
+        """Gets the stats of this StatsList.
+
+        A list of aggregates ordered by period.  # noqa: E501
+
+        :return: The stats of this StatsList.
+        :rtype: List[StatsEntry]
+        """
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats: List[StatsEntry]):
+        """Sets the stats of this StatsList.
+
+        A list of aggregates ordered by period.  # noqa: E501
+
+        :param stats: The stats of this StatsList.
+        :type stats: List[StatsEntry]
+        """
+
+        self._stats = stats
+
+    @property
+    def high_water_mark(self) -> int:
+        """Gets the high_water_mark of this StatsList.
+
+        CDR-ID of the last CDR included in the aggregates.  # noqa: E501
+
+        :return: The high_water_mark of this StatsList.
+        :rtype: int
+        """
+        return self._high_water_mark
+
+    @high_water_mark.setter
+    def high_water_mark(self, high_water_mark: int):
+        """Sets the high_water_mark of this StatsList.
+
+        CDR-ID of the last CDR included in the aggregates.  # noqa: E501
+
+        :param high_water_mark: The high_water_mark of this StatsList.
+        :type high_water_mark: int
+        """
+
+        self._high_water_mark = high_water_mark
@@ -12,5 +12,5 @@ class BaseTestCase(TestCase):
         logging.getLogger('connexion.operation').setLevel('ERROR')
         app = connexion.App(__name__, specification_dir='../swagger/')
         app.app.json_encoder = JSONEncoder
-        app.add_api('swagger.yaml')
+        app.add_api('swagger.yaml', pythonic_params=True)
         return app.app
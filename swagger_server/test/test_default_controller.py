@@ -2,12 +2,151 @@
 
 from __future__ import absolute_import
 
+import asyncio
+import base64
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
 from flask import json
 from six import BytesIO
 
 from swagger_server.models.cdr import CDR  # noqa: E501
+from swagger_server.models.cdr_batch_request import CDRBatchRequest  # noqa: E501
+from swagger_server.controllers import cdr_controller
+from swagger_server.controllers import pcap_controller
+from swagger_server.controllers.common import binary_encoder
+from swagger_server.controllers.common import read_router
+from swagger_server.controllers.common.cdr_cache import CDRCache
+from swagger_server.controllers.common.cdr_feed import CDRFeed
+from swagger_server.controllers.common.cdr_replica import CDRReplica, \
+    ReplicaCursor
+from swagger_server.controllers.common.codec_processor import CODECProcessor
+from swagger_server.controllers.common.db_handler import DBHandler
+from swagger_server.controllers.common.deadline import Deadline
+from swagger_server.controllers.common.errors import DeadlineExceeded
+from swagger_server.controllers.common.log_handler import \
+    DroppingQueueHandler
+from swagger_server.controllers.common.pcap_cache import PCAPCache
+from swagger_server.controllers.common.pcap_merge import merge_pcaps
+from swagger_server.controllers.common.ssh_pool import PooledTransport, \
+    SSHPool
 from swagger_server.test import BaseTestCase
 
+# the asynchronous serving mode needs aiohttp, and a connexion release that
+# supports this version of Python
+try:
+    from aiohttp.test_utils import TestClient, TestServer
+    from swagger_server import aio_app
+except (ImportError, AttributeError):
+    aio_app = None
+
+
+class SnapshotConnection():
+    """A MySQL connection on top of SQLite in WAL mode. Without autocommit
+    its first statement opens a transaction reading a snapshot, like
+    InnoDB in REPEATABLE READ does."""
+    unread_result = False
+
+    def __init__(self, database, autocommit=False, **kwargs):
+        self.autocommit = autocommit
+        self.sqlite_conn = sqlite3.connect(database, isolation_level=None,
+                                           check_same_thread=False)
+
+    def cursor(self, prepared=False):
+        return SnapshotCursor(self)
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        self.sqlite_conn.close()
+
+
+class SnapshotCursor():
+    def __init__(self, db_conn):
+        self.db_conn = db_conn
+        self.rows = []
+
+    def execute(self, query, params=()):
+        sqlite_conn = self.db_conn.sqlite_conn
+        if not self.db_conn.autocommit and not sqlite_conn.in_transaction:
+            sqlite_conn.execute("BEGIN")
+        self.rows = sqlite_conn.execute(query.replace("%s", "?"),
+                                        params).fetchall()
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+def fill_pcap_cache(pcap_cache, name, signature, data):
+    """Transfer a PCAP into the cache in one chunk."""
+    _, _, cache_fill = pcap_cache.begin(name, signature)
+    cache_fill.write(data)
+    cache_fill.commit()
+
+
+def make_pcap(records, magic=b"\xd4\xc3\xb2\xa1", linktype=1):
+    """Return a little-endian PCAP of (seconds, fraction, data) records,
+    microsecond timestamps by default."""
+    pcap = magic + struct.pack("<HHiIII", 2, 4, 0, 0, 65535, linktype)
+    for ts_sec, ts_frac, data in records:
+        pcap += struct.pack("<IIII", ts_sec, ts_frac, len(data), len(data))
+        pcap += data
+    return pcap
+
+
+def read_pcap(pcap):
+    """Return the (seconds, fraction, data) records of a little-endian
+    PCAP."""
+    records = []
+    offset = 24
+    while offset < len(pcap):
+        ts_sec, ts_frac, incl_len, _ = struct.unpack_from("<IIII", pcap,
+                                                          offset)
+        offset += 16
+        records.append((ts_sec, ts_frac, pcap[offset:offset + incl_len]))
+        offset += incl_len
+    return records
+
+
+def make_cdr_replica(store, cdr_ids, ongoing_ids=()):
+    """Return a caught up replica holding finished CDRs of the given
+    CDR-IDs, those of 'ongoing_ids' having no callend yet."""
+    cdr_replica = CDRReplica({"store": store}, None,
+                             cdr_controller.cdr_joined_tables)
+    store_conn = cdr_replica._connect()
+    calldate = datetime(2026, 10, 18, 12, 0, 0)
+    for cdr_id in cdr_ids:
+        callend = None if cdr_id in ongoing_ids else \
+            calldate + timedelta(seconds=60)
+        store_conn.execute(
+            "INSERT INTO cdr VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, "
+            "?, ?)", (cdr_id, f"caller{cdr_id}", f"called{cdr_id}",
+                         calldate + timedelta(seconds=cdr_id), callend, 60,
+                         55, 167772161, 5060, 167772162, 5060, 8, 8, 0, 0))
+        store_conn.execute("INSERT INTO cdr_next VALUES (?, ?)",
+                           (cdr_id, f"call{cdr_id}"))
+    store_conn.commit()
+    store_conn.close()
+    cdr_replica.ready = True
+    cdr_replica._caught_up = time.monotonic()
+    return cdr_replica
+
 
 class TestDefaultController(BaseTestCase):
     """DefaultController integration test stubs"""
@@ -23,6 +162,870 @@ class TestDefaultController(BaseTestCase):
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
+    def test_calls_cdr_id_get_unknown_field(self):
+        """Test case for calls_cdr_id_get
+
+        Reject a projection on a field that a CDR doesn't have.
+        """
+        query_string = [('fields', 'caller,unknown')]
+        response = self.client.open(
+            '/v1alpha4/calls/{cdrId}'.format(cdrId=2),
+            method='GET',
+            query_string=query_string)
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_calls_get_invalid_cursor(self):
+        """Test case for calls_get
+
+        Reject a malformed pagination cursor.
+        """
+        query_string = [('size', 10),
+                        ('cursor', 'not-a-cursor')]
+        response = self.client.open(
+            '/v1alpha4/calls',
+            method='GET',
+            query_string=query_string)
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_calls_get_single_joined_fetch(self):
+        """Test case for calls_get
+
+        A page of CDRs is read with one query for its CDR-IDs and one
+        joined query for the CDRs, whatever its size.
+        """
+        with tempfile.TemporaryDirectory() as store_dir:
+            cdr_replica = make_cdr_replica(
+                os.path.join(store_dir, "replica.db"), range(1, 6))
+            with mock.patch.object(cdr_controller, "cdr_replica",
+                                   cdr_replica), \
+                    mock.patch.object(cdr_controller, "cdr_cache",
+                                      CDRCache({})), \
+                    mock.patch.object(ReplicaCursor, "execute",
+                                      autospec=True,
+                                      side_effect=ReplicaCursor.execute) \
+                    as execute:
+                response = self.client.open(
+                    '/v1alpha4/calls',
+                    method='GET',
+                    query_string=[('size', 4)])
+            self.assert200(response,
+                           'Response body is : ' +
+                           response.data.decode('utf-8'))
+            self.assertEqual([each_cdr["cdrId"]
+                              for each_cdr in response.json["cdr"]],
+                             ["1", "2", "3", "4"])
+            self.assertEqual(response.json["cdr"][0]["callId"], "call1")
+            self.assertEqual(execute.call_count, 2)
+
+    def test_calls_get_stream(self):
+        """Test case for calls_get
+
+        The CDRs are streamed as NDJSON, one line per CDR, reading
+        'stream_chunk_size' rows at a time and bypassing the cache.
+        """
+        cdr_cache = CDRCache({})
+        with tempfile.TemporaryDirectory() as store_dir:
+            cdr_replica = make_cdr_replica(
+                os.path.join(store_dir, "replica.db"), range(1, 6))
+            with mock.patch.object(cdr_controller, "cdr_replica",
+                                   cdr_replica), \
+                    mock.patch.object(cdr_controller, "cdr_cache",
+                                      cdr_cache), \
+                    mock.patch.object(cdr_controller, "stream_chunk_size",
+                                      2), \
+                    mock.patch.object(ReplicaCursor, "fetchmany",
+                                      autospec=True,
+                                      side_effect=ReplicaCursor.fetchmany) \
+                    as fetchmany:
+                response = self.client.open(
+                    '/v1alpha4/calls',
+                    method='GET',
+                    query_string=[('size', 4), ('stream', 1)])
+                body = response.data.decode('utf-8')
+            self.assert200(response, 'Response body is : ' + body)
+            self.assertEqual(response.mimetype, "application/x-ndjson")
+            self.assertEqual([json.loads(each_line)["cdrId"]
+                              for each_line in body.splitlines()],
+                             ["1", "2", "3", "4"])
+            self.assertEqual(fetchmany.call_args_list,
+                             [mock.call(mock.ANY, 2)] * 3)
+            self.assertEqual(cdr_cache.get_metrics()["entries"], 0)
+
+    def test_cdr_etag_not_modified(self):
+        """Test case for calls_cdr_id_get
+
+        The CDR of a finished call is cacheable and answered with 304 when
+        its ETag matches 'If-None-Match', the CDR of an ongoing call must
+        be revalidated.
+        """
+        with tempfile.TemporaryDirectory() as store_dir:
+            cdr_replica = make_cdr_replica(
+                os.path.join(store_dir, "replica.db"), [1, 2],
+                ongoing_ids=[2])
+            with mock.patch.object(cdr_controller, "cdr_replica",
+                                   cdr_replica), \
+                    mock.patch.object(cdr_controller, "cdr_cache",
+                                      CDRCache({})):
+                response = self.client.open(
+                    '/v1alpha4/calls/{cdrId}'.format(cdrId=1),
+                    method='GET')
+                etag = response.headers["ETag"]
+                revalidated = self.client.open(
+                    '/v1alpha4/calls/{cdrId}'.format(cdrId=1),
+                    method='GET',
+                    headers=[('If-None-Match', etag)])
+                ongoing = self.client.open(
+                    '/v1alpha4/calls/{cdrId}'.format(cdrId=2),
+                    method='GET')
+            self.assert200(response,
+                           'Response body is : ' +
+                           response.data.decode('utf-8'))
+            self.assertIn("immutable", response.headers["Cache-Control"])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated.data, b"")
+            self.assertEqual(revalidated.headers["ETag"], etag)
+            self.assert200(ongoing)
+            self.assertEqual(ongoing.headers["Cache-Control"], "no-cache")
+            self.assertNotEqual(ongoing.headers["ETag"], etag)
+
+    def test_calls_search_get_full_scan(self):
+        """Test case for calls_search_get
+
+        Reject a search that isn't narrowed by an indexed filter.
+        """
+        query_string = [('size', 10),
+                        ('codec', 'G729')]
+        response = self.client.open(
+            '/v1alpha4/calls/search',
+            method='GET',
+            query_string=query_string)
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_build_search_conditions_calldate_range(self):
+        """Test case for build_search_conditions
+
+        A calldate range alone narrows a search over at most
+        'max_search_days' days.
+        """
+        date_from = datetime(2019, 1, 1)
+        max_days = timedelta(days=cdr_controller.max_search_days)
+        for date_to, indexed in [(date_from + max_days, True),
+                                 (date_from + max_days + timedelta(hours=23),
+                                  False)]:
+            search = (None, None, date_from.isoformat() + 'Z',
+                      date_to.isoformat() + 'Z', None, None, None)
+            if indexed:
+                cdr_controller.build_search_conditions(*search)
+            else:
+                with self.assertRaises(ValueError):
+                    cdr_controller.build_search_conditions(*search)
+
+    def test_calls_batch_post_too_many(self):
+        """Test case for calls_batch_post
+
+        Reject a batch lookup of more CDR-IDs than the server allows.
+        """
+        body = CDRBatchRequest(cdr_ids=list(range(1, 100002)))
+        response = self.client.open(
+            '/v1alpha4/calls/batch',
+            method='POST',
+            data=json.dumps(body),
+            content_type='application/json')
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_serialize_cdr_row(self):
+        """Test case for serialize_cdr_row
+
+        The fast path serializes a joined row exactly like the CDR model.
+        """
+        calldate = datetime(2019, 1, 28, 15, 19, 45)
+        rows = [
+            (40122, '4179383431512', '4179383431512', calldate, calldate,
+             14, 10, 183434551, 44410, 183430136, 5060, 8, 0, 55, 10,
+             'sshcbKlTL@10.231.96.147', 'XXX', 'XXX', '42402A48', '42402a49',
+             'XXX'),
+            # ongoing call without 'cdr_next' and 'cdr_next_1' entries
+            (40123, '4179383431512', '4179383431512', calldate, None,
+             0, None, 183434551, 44410, 183430136, 5060, 8, 8, None, None,
+             None, None, None, None, None, None)
+        ]
+        for row in rows:
+            cdr = cdr_controller.create_cdr_object(
+                *cdr_controller.split_joined_row(row))
+            self.assertEqual(json.dumps(cdr_controller.serialize_cdr_row(row)),
+                             json.dumps(cdr))
+
+    def test_calls_feed_get_invalid_cursor(self):
+        """Test case for calls_feed_get
+
+        Reject a cursor that wasn't issued by the server.
+        """
+        query_string = [('cursor', 'not-a-cursor')]
+        response = self.client.open(
+            '/v1alpha4/calls/feed',
+            method='GET',
+            query_string=query_string)
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_calls_export_get_invalid_range(self):
+        """Test case for calls_export_get
+
+        Reject a calldate range that ends before it starts.
+        """
+        query_string = [('calldate_from', '2019-01-29T00:00:00Z'),
+                        ('calldate_to', '2019-01-28T00:00:00Z')]
+        response = self.client.open(
+            '/v1alpha4/calls/export',
+            method='GET',
+            query_string=query_string)
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_calls_export_get_csv(self):
+        """Test case for calls_export_get
+
+        The CDRs of the calldate range are exported as CSV with a header
+        row, ordered by calldate and read 'stream_chunk_size' rows at a
+        time.
+        """
+        with tempfile.TemporaryDirectory() as store_dir:
+            cdr_replica = make_cdr_replica(
+                os.path.join(store_dir, "replica.db"), range(1, 6))
+            # the calldates of the replica are in local time
+            calldate_from = datetime(2026, 10, 18, 12, 0, 1).astimezone()
+            calldate_to = calldate_from + timedelta(seconds=3)
+            with mock.patch.object(cdr_controller, "cdr_replica",
+                                   cdr_replica), \
+                    mock.patch.object(cdr_controller, "stream_chunk_size",
+                                      2), \
+                    mock.patch.object(ReplicaCursor, "fetchmany",
+                                      autospec=True,
+                                      side_effect=ReplicaCursor.fetchmany) \
+                    as fetchmany:
+                response = self.client.open(
+                    '/v1alpha4/calls/export',
+                    method='GET',
+                    query_string=[('calldate_from', calldate_from.isoformat()),
+                                  ('calldate_to', calldate_to.isoformat()),
+                                  ('format', 'csv')])
+                body = response.data.decode('utf-8')
+            self.assert200(response, 'Response body is : ' + body)
+            self.assertEqual(response.mimetype, "text/csv")
+            self.assertEqual(response.headers["Content-Disposition"],
+                             'attachment; filename="'
+                             'cdr_20261018T120001_20261018T120004.csv"')
+            rows = body.splitlines()
+            self.assertEqual(rows[0].split(",")[:3],
+                             ["cdr_id", "caller", "called"])
+            self.assertEqual([each_row.split(",")[:2]
+                              for each_row in rows[1:]],
+                             [["1", "caller1"], ["2", "caller2"],
+                              ["3", "caller3"]])
+            self.assertEqual(fetchmany.call_args_list,
+                             [mock.call(mock.ANY, 2)] * 3)
+
+    def test_stats_get_invalid_granularity(self):
+        """Test case for stats_get
+
+        Reject an aggregation period that isn't maintained.
+        """
+        query_string = [('granularity', 'week')]
+        response = self.client.open(
+            '/v1alpha4/stats',
+            method='GET',
+            query_string=query_string)
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+
+    def test_db_handler_sees_new_rows(self):
+        """Test case for DBHandler
+
+        A pooled connection reads the rows inserted after it was borrowed.
+        """
+        with tempfile.TemporaryDirectory() as db_dir:
+            database = os.path.join(db_dir, "voipmonitor.db")
+            writer = sqlite3.connect(database, isolation_level=None)
+            writer.execute("PRAGMA journal_mode=WAL")
+            writer.execute("CREATE TABLE cdr (ID INTEGER PRIMARY KEY)")
+            writer.execute("INSERT INTO cdr VALUES (1)")
+            db_handler = DBHandler({"username": "", "password": "",
+                                    "host": "", "database": database,
+                                    "pool_size": 1})
+            query = "SELECT MAX(ID) FROM cdr WHERE ID > %s"
+            with mock.patch("mysql.connector.connect", SnapshotConnection):
+                with db_handler.cursor() as db_cur:
+                    db_cur.execute(query, (0,))
+                    self.assertEqual(db_cur.fetchall(), [(1,)])
+                    writer.execute("INSERT INTO cdr VALUES (2)")
+                    db_cur.execute(query, (0,))
+                    self.assertEqual(db_cur.fetchall(), [(2,)])
+                # the same connection, once back in the pool
+                writer.execute("INSERT INTO cdr VALUES (3)")
+                with db_handler.cursor() as db_cur:
+                    db_cur.execute(query, (0,))
+                    self.assertEqual(db_cur.fetchall(), [(3,)])
+                self.assertEqual(db_handler.get_metrics()["open"], 1)
+            writer.close()
+
+    def test_cursor_round_trip(self):
+        """Test case for encode_cursor and decode_cursor
+
+        A cursor decodes to the CDR-ID it was encoded from, and malformed
+        cursors are rejected.
+        """
+        for last_id in [0, 1, 2 ** 40]:
+            self.assertEqual(cdr_controller.decode_cursor(
+                cdr_controller.encode_cursor(last_id)), last_id)
+
+        def encode(value):
+            return base64.urlsafe_b64encode(
+                json.dumps(value).encode()).decode()
+        for cursor in ["not-a-cursor", encode([1]), encode({}),
+                       encode({"last_id": -1}), encode({"last_id": "1"}),
+                       encode({"last_id": 1.5}), encode({"last_id": True}),
+                       base64.urlsafe_b64encode(b"{").decode()]:
+            self.assertIsNone(cdr_controller.decode_cursor(cursor), cursor)
+
+    def test_cdr_cache_lru(self):
+        """Test case for CDRCache
+
+        The least recently used CDR is evicted once the cache is full.
+        """
+        cdr_cache = CDRCache({"size": 2})
+        cdr_cache.put(1, "cdr 1")
+        cdr_cache.put(2, "cdr 2")
+        self.assertEqual(cdr_cache.get(1), "cdr 1")
+        cdr_cache.put(3, "cdr 3")
+        self.assertEqual(cdr_cache.get_many([1, 2, 3]),
+                         {1: "cdr 1", 3: "cdr 3"})
+        self.assertEqual(cdr_cache.get_metrics()["evictions"], 1)
+
+    def test_cdr_cache_ttl(self):
+        """Test case for CDRCache
+
+        The CDR of an ongoing call expires sooner than a finished one.
+        """
+        cdr_cache = CDRCache({"ttl_finished": 60, "ttl_ongoing": 5})
+        with mock.patch("time.monotonic", return_value=1000):
+            cdr_cache.put(1, "finished call")
+            cdr_cache.put(2, "ongoing call", finished=False)
+        with mock.patch("time.monotonic", return_value=1010):
+            self.assertEqual(cdr_cache.get(1), "finished call")
+            self.assertIsNone(cdr_cache.get(2))
+        with mock.patch("time.monotonic", return_value=1060):
+            self.assertIsNone(cdr_cache.get(1))
+        self.assertEqual(cdr_cache.get_metrics()["expirations"], 2)
+
+    def test_feed_cursor_round_trip(self):
+        """Test case for encode_feed_cursor and decode_feed_cursor
+
+        A feed cursor decodes to the position it was encoded from, and the
+        cursor of a page continues the feed by CDR-ID.
+        """
+        position = (40122, "5f0c1a2b", 17)
+        self.assertEqual(cdr_controller.decode_feed_cursor(
+            cdr_controller.encode_feed_cursor(position)), position)
+        self.assertEqual(cdr_controller.decode_feed_cursor(
+            cdr_controller.encode_cursor(40122)), (40122, None, None))
+        cursor = base64.urlsafe_b64encode(json.dumps(
+            {"last_id": 1, "epoch": "5f0c1a2b", "seq": True}).encode())
+        self.assertIsNone(cdr_controller.decode_feed_cursor(cursor.decode()))
+
+
+    def test_feed_resume_after_trim(self):
+        """Test case for CDRFeed.wait
+
+        A subscriber resumes from its cursor in the buffer, by CDR-ID from an
+        earlier run of the tail job, and from the database once the buffer
+        was trimmed past its cursor.
+        """
+        cdrs = [(cdr_id, "cdr %d" % cdr_id) for cdr_id in range(1, 5)]
+
+        def fetch_fn(last_id, size):
+            return [entry for entry in cdrs if entry[0] > last_id][:size]
+        cdr_feed = CDRFeed({"buffer_size": 2}, fetch_fn, None, None)
+        cdr_feed.epoch = "5f0c1a2b"
+        cdr_feed.start_id = cdr_feed.last_id = 0
+        position = cdr_feed.position()
+        cdr_feed._publish(cdrs[:2])
+        position = cdr_feed.read(position, 1)[0][0]
+        self.assertEqual(position, (1, "5f0c1a2b", 1))
+        cdr_feed._publish(cdrs[2:])
+        self.assertEqual(cdr_feed.get_metrics()["start_id"], 2)
+        self.assertIsNone(cdr_feed.read(position, 10))
+        self.assertEqual(cdr_feed.wait(position, 0, 10),
+                         [((2, None, None), "cdr 2"),
+                          ((3, None, None), "cdr 3"),
+                          ((4, None, None), "cdr 4")])
+        self.assertEqual(cdr_feed.wait((2, "5f0c1a2b", 2), 0, 10),
+                         [((3, "5f0c1a2b", 3), "cdr 3"),
+                          ((4, "5f0c1a2b", 4), "cdr 4")])
+        self.assertEqual(cdr_feed.wait((3, "0d1e2f3a", 9), 0, 10),
+                         [((4, "5f0c1a2b", 4), "cdr 4")])
+
+    def test_host_health_mean_latency(self):
+        """Test case for HostHealth
+
+        The mean latency is weighted towards the latest queries, and a host
+        failing in a row is taken out of the rotation.
+        """
+        health = read_router.HostHealth("replica", 30, 3)
+        health.record_success(0.1)
+        self.assertAlmostEqual(health.mean_latency, 0.1)
+        health.record_success(0.6)
+        self.assertAlmostEqual(health.mean_latency,
+                               0.1 + read_router.latency_weight * 0.5)
+        health.record_failure()
+        health.record_failure()
+        self.assertTrue(health.is_up())
+        health.record_failure()
+        self.assertFalse(health.is_up())
+        health.record_success(0.1)
+        self.assertEqual(health.failures, 0)
+
+    def test_read_router_choose(self):
+        """Test case for ReadRouter.choose
+
+        Reads go to the fastest healthy replica, and to the primary host
+        when no replica is up.
+        """
+        def make_db_handler(db_params):
+            return mock.Mock(db_params=db_params, pool_size=1, **{
+                "get_metrics.return_value": {"in_use": 0}})
+        primary = make_db_handler({"host": "primary"})
+        with mock.patch.object(read_router, "DBHandler", make_db_handler):
+            router = read_router.ReadRouter(
+                {"host": "primary",
+                 "replicas": [{"host": "replica1"}, {"host": "replica2"}]},
+                primary)
+        replica1, replica2 = router.replicas
+        router.health[replica1].record_success(0.2)
+        router.health[replica2].record_success(0.1)
+        self.assertIs(router.choose(), replica2)
+        self.assertIs(router.choose(exclude=[replica2]), replica1)
+        for _ in range(read_router.default_replica_max_failures):
+            router.health[replica2].record_failure()
+        self.assertIs(router.choose(), replica1)
+        self.assertIs(router.choose(exclude=[replica1]), primary)
+        self.assertEqual(router.fallbacks, 1)
+        self.assertIsNone(router.choose(exclude=[replica1, primary]))
+
+    def test_read_router_host_errors(self):
+        """Test case for ReadRouter.process_query
+
+        A read failing with a connection error is retried on another host
+        and counts as a failure of its host, a read failing with an error
+        of the query isn't.
+        """
+        def make_db_handler(db_params):
+            return mock.MagicMock(db_params=db_params, pool_size=1, **{
+                "get_metrics.return_value": {"in_use": 0}})
+        primary = make_db_handler({"host": "primary"})
+        with mock.patch.object(read_router, "DBHandler", make_db_handler):
+            router = read_router.ReadRouter(
+                {"host": "primary", "replicas": [{"host": "replica"}]},
+                primary)
+        replica = router.replicas[0]
+        primary.cursor.return_value.__enter__.return_value = "primary"
+
+        def read_host(db_cur):
+            return db_cur
+        replica.cursor.return_value.__enter__.side_effect = \
+            read_router.mysql.connector.OperationalError("gone away")
+        self.assertEqual(router.process_query(read_host), "primary")
+        self.assertEqual(router.health[replica].failures, 1)
+        replica.cursor.return_value.__enter__.side_effect = \
+            read_router.mysql.connector.ProgrammingError("syntax error")
+        with self.assertRaises(read_router.mysql.connector.ProgrammingError):
+            router.process_query(read_host)
+        self.assertEqual(router.health[replica].failures, 1)
+
+    def test_deadline_stage_exceeded(self):
+        """Test case for Deadline.stage
+
+        A stage that times out or runs past its deadline raises
+        DeadlineExceeded.
+        """
+        deadline = Deadline({"listing": 0.05})
+        with self.assertRaises(DeadlineExceeded):
+            with deadline.stage("listing"):
+                raise socket.timeout("timed out")
+        with self.assertRaises(DeadlineExceeded):
+            with deadline.stage("listing"):
+                time.sleep(0.1)
+        with deadline.stage("listing") as timeout:
+            self.assertLessEqual(timeout, 0.05)
+        with self.assertRaises(DeadlineExceeded):
+            with Deadline({"request": 0}).stage("listing"):
+                pass
+
+    def test_decode_deadline_exceeded(self):
+        """Test case for CODECProcessor.decode_payload
+
+        The decoding stops at the deadline of the decode stage, before the
+        WAV file is written.
+        """
+        with tempfile.TemporaryDirectory() as audio_dir:
+            audio_filename = os.path.join(audio_dir, "audio.wav")
+            with self.assertRaises(DeadlineExceeded):
+                CODECProcessor(b'\x00' * 160, 9, audio_filename,
+                               Deadline({"request": 0})).decode_payload()
+            self.assertFalse(os.path.exists(audio_filename))
+
+    def test_dropping_queue_handler(self):
+        """Test case for DroppingQueueHandler
+
+        The records that don't fit in the queue are dropped and counted.
+        """
+        handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+        for message in ["first", "second", "third"]:
+            handler.handle(logging.makeLogRecord({"msg": message}))
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(handler.queue.get_nowait().getMessage(), "first")
+
+    def test_binary_encoder_round_trip(self):
+        """Test case for encode_document
+
+        A document decodes back from MessagePack and CBOR with its native
+        values.
+        """
+        document = {"cdr": [{"id": 40122, "caller": "4179383431512",
+                             "calldate": datetime(2019, 1, 28, 15, 19, 45,
+                                                  tzinfo=timezone.utc),
+                             "duration": 14}],
+                    "next_cursor": cdr_controller.encode_cursor(40122)}
+        decoders = {
+            binary_encoder.msgpack_mimetype: lambda data:
+                binary_encoder.msgpack.unpackb(data, timestamp=3),
+            binary_encoder.cbor_mimetype: lambda data:
+                binary_encoder.cbor2.loads(data)
+        }
+        for media_type, decode in decoders.items():
+            if media_type not in binary_encoder.binary_encoders:
+                continue
+            self.assertEqual(binary_encoder.negotiate_encoding(
+                media_type + ", application/json;q=0.5"), media_type)
+            self.assertEqual(decode(binary_encoder.encode_document(
+                media_type, document)), document)
+        self.assertIsNone(binary_encoder.negotiate_encoding(
+            "application/json, application/msgpack;q=0.5"))
+
+    def test_pcap_cache_evicts_by_size(self):
+        """Test case for PCAPCache
+
+        The least recently used PCAPs are removed once the cache is over
+        its size in bytes.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pcap_cache = PCAPCache({"directory": cache_dir, "max_size": 250})
+            fill_pcap_cache(pcap_cache, "a.pcap", ("a",), b'a' * 100)
+            fill_pcap_cache(pcap_cache, "b.pcap", ("b",), b'b' * 100)
+            # 'a.pcap' becomes the most recently used
+            pcap_file, _, _ = pcap_cache.begin("a.pcap", ("a",))
+            pcap_file.close()
+            fill_pcap_cache(pcap_cache, "c.pcap", ("c",), b'c' * 100)
+            self.assertEqual(sorted(os.listdir(cache_dir)),
+                             ["a.pcap", "c.pcap"])
+            metrics = pcap_cache.get_metrics()
+            self.assertEqual(metrics["size"], 200)
+            self.assertEqual(metrics["evictions"], 1)
+
+    def test_pcap_cache_stale_signature(self):
+        """Test case for PCAPCache
+
+        A PCAP whose remote files changed is fetched again.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pcap_cache = PCAPCache({"directory": cache_dir})
+            fill_pcap_cache(pcap_cache, "a.pcap", (1, 100), b'old')
+            pcap_file, _, cache_fill = pcap_cache.begin("a.pcap", (2, 200))
+            self.assertIsNone(pcap_file)
+            cache_fill.write(b'new')
+            cache_fill.commit()
+            pcap_file, _, _ = pcap_cache.begin("a.pcap", (2, 200))
+            with pcap_file:
+                self.assertEqual(pcap_file.read(), b'new')
+
+    def test_pcap_cache_shared_transfer_error(self):
+        """Test case for PCAPCache
+
+        The requests sharing a transfer get its data as it is written, and
+        its error when it fails.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pcap_cache = PCAPCache({"directory": cache_dir})
+            _, _, cache_fill = pcap_cache.begin("a.pcap", ("a",))
+            _, shared_fill, new_fill = pcap_cache.begin("a.pcap", ("a",))
+            self.assertIs(shared_fill, cache_fill)
+            self.assertIsNone(new_fill)
+            pcap_chunks = shared_fill.stream(1)
+            cache_fill.write(b'head')
+            self.assertEqual(next(pcap_chunks), b'head')
+            cache_fill.abort(EOFError("sniffer went away"))
+            with self.assertRaises(EOFError):
+                next(pcap_chunks)
+            # the next request starts a new transfer
+            _, shared_fill, new_fill = pcap_cache.begin("a.pcap", ("a",))
+            self.assertIsNone(shared_fill)
+            self.assertIsNotNone(new_fill)
+            new_fill.abort(EOFError("sniffer went away"))
+            self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_pcap_cache_startup(self):
+        """Test case for PCAPCache
+
+        The PCAPs of an earlier run and the temporary files left behind are
+        removed on startup, the temporary files being written are kept.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for name in ["a.pcap", ".b.pcap.1.tmp", ".c.pcap.2.tmp"]:
+                with open(os.path.join(cache_dir, name), "wb") as pcap_file:
+                    pcap_file.write(b'pcap')
+            stale_time = time.time() - 3600
+            os.utime(os.path.join(cache_dir, ".b.pcap.1.tmp"),
+                     (stale_time, stale_time))
+            pcap_cache = PCAPCache({"directory": cache_dir})
+            self.assertEqual(os.listdir(cache_dir), [".c.pcap.2.tmp"])
+            self.assertEqual(pcap_cache.get_metrics()["size"], 0)
+            pcap_file, _, cache_fill = pcap_cache.begin("a.pcap", ("a",))
+            self.assertIsNone(pcap_file)
+            cache_fill.abort(EOFError("sniffer went away"))
+
+    def test_merge_pcaps_timestamp_order(self):
+        """Test case for merge_pcaps
+
+        The packets of the SIP and RTP PCAPs are merged in timestamp order.
+        """
+        sip = make_pcap([(10, 0, b'INVITE'), (10, 500000, b'200 OK'),
+                         (12, 0, b'BYE')])
+        rtp = make_pcap([(10, 250000, b'rtp1'), (11, 0, b'rtp2')])
+        merged = b''.join(merge_pcaps([BytesIO(sip), BytesIO(rtp)]))
+        self.assertEqual(merged[:24], sip[:24])
+        self.assertEqual([data for _, _, data in read_pcap(merged)],
+                         [b'INVITE', b'rtp1', b'200 OK', b'rtp2', b'BYE'])
+
+    def test_merge_pcaps_duplicate_frames(self):
+        """Test case for merge_pcaps
+
+        A packet captured by two sniffers is only written once.
+        """
+        first = make_pcap([(10, 0, b'INVITE'), (11, 0, b'BYE')])
+        second = make_pcap([(10, 0, b'INVITE'), (10, 500, b'180')])
+        merged = b''.join(merge_pcaps([BytesIO(first), BytesIO(second)]))
+        self.assertEqual([data for _, _, data in read_pcap(merged)],
+                         [b'INVITE', b'180', b'BYE'])
+
+    def test_merge_pcaps_interleaved_duplicates(self):
+        """Test case for merge_pcaps
+
+        The copies of a packet are dropped when other packets with the same
+        timestamp come in between.
+        """
+        first = make_pcap([(10, 0, b'rtp1'), (10, 0, b'rtp2')])
+        second = make_pcap([(10, 0, b'rtp1'), (10, 0, b'rtp2'),
+                            (10, 0, b'rtp3')])
+        merged = b''.join(merge_pcaps([BytesIO(first), BytesIO(second)]))
+        self.assertEqual([data for _, _, data in read_pcap(merged)],
+                         [b'rtp1', b'rtp2', b'rtp3'])
+
+    def test_merge_pcaps_nanosecond_input(self):
+        """Test case for merge_pcaps
+
+        The timestamps of a nanosecond PCAP are converted to the microsecond
+        precision of the first one.
+        """
+        usec = make_pcap([(10, 1, b'INVITE')])
+        nsec = make_pcap([(10, 500, b'rtp1'), (10, 2000, b'rtp2')],
+                         magic=b"\x4d\x3c\xb2\xa1")
+        merged = b''.join(merge_pcaps([BytesIO(usec), BytesIO(nsec)]))
+        self.assertEqual(read_pcap(merged), [(10, 0, b'rtp1'),
+                                             (10, 1, b'INVITE'),
+                                             (10, 2, b'rtp2')])
+        with self.assertRaises(ValueError):
+            list(merge_pcaps([BytesIO(usec),
+                              BytesIO(make_pcap([], linktype=113))]))
+
+
+    def test_ssh_pool_release_after_error(self):
+        """Test case for SSHPool
+
+        A transport is reused after a PCAP fails to open, and replaced after
+        it breaks.
+        """
+        sniffer_params = {"host": "sniffer-pool-test", "username": "root",
+                          "password": "", "spool_dir": "/var/spool"}
+        ssh_pool = SSHPool(sniffer_params, {"pool_size": 1})
+        sftp_client = mock.Mock(**{
+            "open.side_effect": FileNotFoundError(2, "No such file")})
+        with mock.patch.object(ssh_pool, "_connect",
+                               side_effect=lambda timeout: PooledTransport(
+                                   mock.Mock())), \
+                mock.patch.object(pcap_controller, "get_ssh_pool",
+                                  return_value=ssh_pool), \
+                mock.patch("paramiko.SFTPClient.from_transport",
+                           return_value=sftp_client):
+            with self.assertRaises(FileNotFoundError):
+                pcap_controller.open_sniffer_pcap(sniffer_params,
+                                                  "/var/spool/a.pcap", 1)
+            sftp_client.close.assert_called_once_with()
+            self.assertEqual(ssh_pool.get_metrics()["transports"], 1)
+            self.assertEqual(ssh_pool.get_metrics()["sessions"], 0)
+            with self.assertRaises(EOFError):
+                with ssh_pool.session(1):
+                    raise EOFError("transport went away")
+            with ssh_pool.session(1):
+                pass
+        metrics = ssh_pool.get_metrics()
+        self.assertEqual((metrics["connects"], metrics["reuses"],
+                          metrics["failures"]), (2, 1, 1))
+
+    def test_replica_fallback_past_high_water_mark(self):
+        """Test case for fetch_cdr_rows
+
+        The CDRs past the high-water mark of the replica, or within its
+        trailing window, are read from the database, and all the reads go
+        to the database once the replica lags behind.
+        """
+        cdr_replica = CDRReplica({"trailing_window": 10, "max_lag": 30},
+                                 None, [])
+        cdr_replica.ready = True
+        cdr_replica.high_water_mark = 100
+        cdr_replica._caught_up = time.monotonic()
+        hosts = {"replica": {1: "replica 1", 95: "replica 95"},
+                 "database": {1: "database 1", 95: "database 95",
+                              98: "database 98", 105: "database 105"}}
+        queried = []
+
+        def fetch_cdrs(db_cur, cdr_ids, projection=None):
+            queried.append((db_cur, cdr_ids))
+            return {cdr_id: hosts[db_cur][cdr_id] for cdr_id in cdr_ids
+                    if cdr_id in hosts[db_cur]}
+
+        def process_query(query_fn, *args):
+            return query_fn("database", *args)
+        with mock.patch.object(cdr_controller, "cdr_replica", cdr_replica), \
+                mock.patch.object(cdr_controller, "cdr_cache",
+                                  CDRCache({})), \
+                mock.patch.object(cdr_replica, "cursor",
+                                  return_value=mock.MagicMock(**{
+                                      "__enter__.return_value": "replica"})), \
+                mock.patch.object(cdr_controller, "fetch_cdrs", fetch_cdrs), \
+                mock.patch.object(cdr_controller.read_router,
+                                  "process_query", process_query):
+            self.assertEqual(cdr_controller.fetch_cdr_rows(
+                [1, 50, 95, 98, 105]),
+                {1: "replica 1", 95: "replica 95", 98: "database 98",
+                 105: "database 105"})
+            self.assertEqual(queried, [("replica", [1, 50, 95, 98, 105]),
+                                       ("database", [98, 105])])
+            cdr_replica._caught_up -= 31
+            self.assertFalse(cdr_replica.get_metrics()["ready"])
+            self.assertEqual(cdr_controller.fetch_cdr_rows([1]),
+                             {1: "database 1"})
+
+    def test_pcap_get_concurrent_share_transfer(self):
+        """Test case for pcap_get
+
+        Two concurrent requests for the PCAP of a call share a single
+        transfer from the sniffer.
+        """
+        pcap = make_pcap([(10, 0, b'INVITE'), (11, 0, b'BYE')])
+        transfer_started = threading.Event()
+
+        class RemoteFile():
+            def readv(self, chunks):
+                transfer_started.wait(5)
+                for offset, size in chunks:
+                    yield pcap[offset:offset + size]
+
+            def close(self):
+                pass
+        opened = []
+
+        def open_sniffer_pcap(sniffer_params, remote_path, timeout):
+            opened.append(remote_path)
+            return mock.Mock(), mock.Mock(), RemoteFile(), len(pcap)
+
+        def probe_sniffer_pcap(sniffer_params, pcap_filename, sip_dir,
+                               rtp_dir, connect_timeout, deadline, channels):
+            return {"sip": (sip_dir + pcap_filename, (len(pcap), "1.0"))}
+        call_info = [(datetime(2019, 1, 28, 15, 19, 45), "call-1",
+                      datetime(2019, 1, 28, 15, 20, 0))]
+        responses = []
+
+        def get_pcap():
+            responses.append(self.client.open(
+                '/v1alpha4/pcap', method='GET',
+                query_string=[('cdrId', 40122), ('disable_rtp', 1)]))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pcap_cache = PCAPCache({"directory": cache_dir})
+            with mock.patch.object(pcap_controller, "db_handle_process_query",
+                                   return_value=call_info), \
+                    mock.patch.object(pcap_controller, "probe_sniffer_pcap",
+                                      probe_sniffer_pcap), \
+                    mock.patch.object(pcap_controller, "open_sniffer_pcap",
+                                      open_sniffer_pcap), \
+                    mock.patch.object(pcap_controller, "get_pcap_cache",
+                                      return_value=pcap_cache):
+                requests = [threading.Thread(target=get_pcap)
+                            for _ in range(2)]
+                for each_request in requests:
+                    each_request.start()
+                for _ in range(100):
+                    if pcap_cache.get_metrics()["shared"] == 1:
+                        break
+                    time.sleep(0.05)
+                transfer_started.set()
+                for each_request in requests:
+                    each_request.join()
+            self.assertEqual(len(opened), 1)
+            self.assertEqual([(response.status_code, response.data)
+                              for response in responses],
+                             [(200, pcap), (200, pcap)])
+            metrics = pcap_cache.get_metrics()
+            self.assertEqual((metrics["misses"], metrics["shared"],
+                              metrics["entries"]), (1, 1, 1))
+
+    @unittest.skipIf(aio_app is None,
+                     "the asynchronous serving mode can't be loaded")
+    def test_aio_app_smoke(self):
+        """Test case for the asynchronous serving mode
+
+        The application starts, and answers through the asynchronous
+        controllers and through the synchronous ones run on the executor.
+        """
+        aio_read_router = mock.Mock(warm_up=mock.AsyncMock(),
+                                    close=mock.AsyncMock())
+
+        async def get_statuses():
+            async with TestClient(TestServer(aio_app.create_app().app)) \
+                    as client:
+                statuses = []
+                for path in ['/v1alpha4/calls?cursor=not-a-cursor',
+                             '/v1alpha4/calls/feed?cursor=not-a-cursor',
+                             '/v1alpha4/stats?granularity=week']:
+                    response = await client.get(path)
+                    statuses.append(response.status)
+                return statuses
+        with mock.patch.object(aio_app, "get_aio_read_router",
+                               return_value=aio_read_router), \
+                mock.patch.object(aio_app, "replica_init"), \
+                mock.patch.object(aio_app, "rollup_init"):
+            loop = asyncio.new_event_loop()
+            try:
+                statuses = loop.run_until_complete(get_statuses())
+            finally:
+                loop.close()
+        self.assertEqual(statuses, [400, 400, 400])
+        aio_read_router.warm_up.assert_awaited_once_with()
+        aio_read_router.close.assert_awaited_once_with()
+
 
 if __name__ == '__main__':
     import unittest